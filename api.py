@@ -0,0 +1,241 @@
+# This file contains the versioned JSON read API of venues, artists and shows.
+# Lists are pages of JSON objects, or with ?format=ndjson (or an Accept: application/x-ndjson header),
+# every row streamed as one JSON object per line from a server side cursor, in constant memory.
+# Rows are projections of the columns below, model instances and their relationships are never loaded.
+
+import json
+from datetime import datetime
+from flask import Blueprint, Response, request, current_app, stream_with_context
+from models import db, Venue, Artist, Show, VenueGenre, ArtistGenre, weekDays
+from pagination import paginate
+from search import search, backend, tokens
+from schedule import parse_range, shows_between, by_day
+import geo
+import matchmaking
+import typeahead
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+venueColumns = (Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone, Venue.image_link,
+                Venue.facebook_link, Venue.website, Venue.seeking_talent, Venue.seeking_description,
+                Venue.latitude, Venue.longitude)
+artistColumns = (Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone, Artist.image_link,
+                 Artist.facebook_link, Artist.website, Artist.seeking_venue, Artist.seeking_description,
+                 Artist.availability_mask)
+showColumns = (Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+               Venue.image_link.label('venue_image_link'), Show.artist_id, Artist.name.label('artist_name'),
+               Artist.image_link.label('artist_image_link'))
+
+# (model, columns, genre model, genre model's key) of every listed kind
+resources = {
+    'venues': (Venue, venueColumns, VenueGenre, VenueGenre.venue_id),
+    'artists': (Artist, artistColumns, ArtistGenre, ArtistGenre.artist_id)
+}
+
+# rows fetched per round trip of a streamed response, their genres are looked up together
+streamChunk = 1000
+
+
+def dumps(data):
+    return json.dumps(data, separators=(',', ':'), default=lambda value: value.isoformat()
+                      if isinstance(value, datetime) else str(value))
+
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+
+def serialize(rows, kind=None):
+    # row projections to dictionaries, with the genres of venues and artists from one query per batch of rows
+    data = [row._asdict() for row in rows]
+    for item in data:
+        if 'availability_mask' in item:
+            mask = item.pop('availability_mask')
+            item['available_on'] = [day for bit, day in enumerate(
+                weekDays) if mask & (1 << bit)]
+    if kind in resources and data:
+        model, columns, genre_model, key = resources[kind]
+        genres = {}
+        for owner_id, genre in db.session.query(key, genre_model.genre).filter(
+                key.in_([item['id'] for item in data])).order_by(key, genre_model.genre):
+            genres.setdefault(owner_id, []).append(genre)
+        for item in data:
+            item['genres'] = genres.get(item['id'], [])
+    return data
+
+
+def ndjson(rows, kind=None):
+    # streams rows of a query, or of any iterable, as newline delimited JSON, a chunk of rows at a time
+    def generate():
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == streamChunk:
+                yield ''.join(dumps(item) + '\n' for item in serialize(chunk, kind))
+                chunk = []
+        if chunk:
+            yield ''.join(dumps(item) + '\n' for item in serialize(chunk, kind))
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def streamed(query):
+    # a server side cursor on PostgreSQL, fetched streamChunk rows at a time
+    return query.execution_options(stream_results=True).yield_per(streamChunk)
+
+
+def page_response(page, kind=None, **extra):
+    data = {'data': serialize(page, kind), 'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor}
+    data.update(extra)
+    return json_response(data)
+
+
+def list_resource(kind):
+    # the filters of the search pages: a search term, ranked by the search engine, or everything by id
+    model, columns, genre_model, key = resources[kind]
+    term = request.args.get('search_term', '')
+    cursor = request.args.get('cursor')
+    if wants_ndjson():
+        if tokens(term):
+            # ranked ids are capped at SEARCH_MAX_RESULTS, rows are then projected one chunk at a time
+            ids = backend().ids(model, term, 0,
+                                current_app.config['SEARCH_MAX_RESULTS'])
+            return ndjson(ranked_rows(model, columns, ids), kind)
+        return ndjson(streamed(db.session.query(*columns).order_by(model.id)), kind)
+    if term:
+        page = search(model, term, cursor, columns)
+        return page_response(page, kind, count=page.total)
+    page = paginate(db.session.query(*columns), (model.id,),
+                    cursor, current_app.config['PAGE_SIZE'])
+    return page_response(page, kind)
+
+
+def ranked_rows(model, columns, ids):
+    for start in range(0, len(ids), streamChunk):
+        chunk = ids[start:start + streamChunk]
+        rows = {row.id: row for row in db.session.query(
+            *columns).filter(model.id.in_(chunk))}
+        for id in chunk:
+            if id in rows:
+                yield rows[id]
+
+
+def show_resource(kind, id):
+    model, columns, genre_model, key = resources[kind]
+    row = db.session.query(*columns, model.upcoming_shows_count.label('upcoming_shows_count'),
+                           model.past_shows_count.label('past_shows_count')).filter(model.id == id).first()
+    if row is None:
+        return json_response({'error': f'There is no {kind[:-1]} with id {id}.'}, 404)
+    return json_response(serialize([row], kind)[0])
+
+
+def matches_resource(kind, id):
+    # the stored best matches of a venue or artist, artists or venues with their score, best first
+    model = resources[kind][0]
+    if db.session.query(model.id).filter(model.id == id).first() is None:
+        return json_response({'error': f'There is no {kind[:-1]} with id {id}.'}, 404)
+    matched = 'venues' if kind == 'artists' else 'artists'
+    data = serialize(matchmaking.best_matches(kind, id, resources[matched][1]), matched)
+    for item in data:
+        item['score'] = round(item['score'], 4)
+    return json_response({'data': data})
+
+
+@api.route('/venues')
+def venues():
+    return list_resource('venues')
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    return show_resource('venues', venue_id)
+
+
+@api.route('/venues/near')
+def venues_near():
+    # venues nearest to ?lat=&lng=, or to the center of ?city=&state=, with their distance_km, nearest first
+    try:
+        query = geo.parse_near(request.args)
+    except ValueError as error:
+        return json_response({'error': str(error)}, 400)
+    if query is None:
+        return json_response({'error': 'Give a lat and lng, or a city and state, to search around.'}, 400)
+    latitude, longitude, limit, radius = query
+    venues = geo.near(latitude, longitude, limit, radius, venueColumns)
+    data = serialize([row for row, kilometers in venues], 'venues')
+    for item, (row, kilometers) in zip(data, venues):
+        item['distance_km'] = round(kilometers, 3)
+    return json_response({'latitude': latitude, 'longitude': longitude, 'radius_km': radius, 'data': data})
+
+
+@api.route('/venues/<int:venue_id>/matches')
+def venue_matches(venue_id):
+    return matches_resource('venues', venue_id)
+
+
+@api.route('/artists')
+def artists():
+    return list_resource('artists')
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    return show_resource('artists', artist_id)
+
+
+@api.route('/artists/<int:artist_id>/matches')
+def artist_matches(artist_id):
+    return matches_resource('artists', artist_id)
+
+
+@api.route('/typeahead')
+def suggestions():
+    # artists, venues, cities and genres with a word starting with the words of ?q=, or the comma separated ?kinds=
+    requested = [kind for kind in request.args.get('kinds', ','.join(typeahead.kinds)).split(',') if kind]
+    unknown = [kind for kind in requested if kind not in typeahead.kinds]
+    if unknown:
+        return json_response({'error': f'Unknown kinds {", ".join(unknown)}, kinds are {", ".join(typeahead.kinds)}.'},
+                             400)
+    term = request.args.get('q', '')
+    data = typeahead.suggest(term, requested, request.args.get('limit', type=int))
+    return json_response({'query': term, 'data': data})
+
+
+@api.route('/shows')
+def shows():
+    # shows of a venue or an artist with ?venue_id= or ?artist_id=, by start time, or every show streamed by id
+    query = db.session.query(*showColumns).join(Venue, Venue.id == Show.venue_id).join(
+        Artist, Artist.id == Show.artist_id)
+    for name, column in (('venue_id', Show.venue_id), ('artist_id', Show.artist_id)):
+        value = request.args.get(name, type=int)
+        if value is not None:
+            query = query.filter(column == value)
+    if wants_ndjson():
+        return ndjson(streamed(query.order_by(Show.id)))
+    page = paginate(query, (Show.start_time, Show.id), request.args.get(
+        'cursor'), current_app.config['PAGE_SIZE'])
+    return page_response(page)
+
+
+@api.route('/calendar')
+def calendar():
+    # shows between the ?start= and ?end= ISO dates, the end excluded, grouped by day. the current month by default,
+    # for the whole site or with ?venue_id= or ?artist_id=
+    try:
+        start, end = parse_range(request.args.get(
+            'start'), request.args.get('end'))
+    except ValueError as error:
+        return json_response({'error': str(error)}, 400)
+    shows = shows_between(start, end, request.args.get('venue_id', type=int),
+                          request.args.get('artist_id', type=int), showColumns)
+    return json_response({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': [{'date': day.date.isoformat(), 'shows': serialize(day.shows)} for day in by_day(shows)]
+    })
@@ -2,56 +2,173 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
-from flask_moment import Moment
-from flask_migrate import Migrate
-from models import db, Venue, Artist, Show
+import io
+import os
+import sys
+import time
+import click
+from flask import Blueprint, Flask, current_app, render_template, request, flash, redirect, url_for, abort, jsonify
+from jinja2 import FileSystemBytecodeCache
+from models import db, Venue, Artist, Show, Area, VenueGenre, ArtistGenre, touch, get
+import areas
+import stats
+import geo
+import matchmaking
+import typeahead
+from enums import State, Genre
+import instrumentation
+import replicas
+from pagination import paginate
+from search import search
+from importers import import_shows, import_records, file_format, catalogues
+from cache import PageCache, conditional
+from api import api
+from schedule import parse_range, neighbours, shows_between, by_day
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
 from flask_wtf.csrf import CSRFProtect
-from forms import *
-import sys
-from itertools import groupby
-from sqlalchemy import or_
+from forms import ShowForm, VenueForm, ArtistForm
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from sqlalchemy import func
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
 csrf = CSRFProtect()
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db.init_app(app)
-csrf.init_app(app)
-migrate = Migrate(app, db)
+page_cache = PageCache()
+# the pages of the site, registered on the app by create_app()
+pages = Blueprint('pages', __name__, cli_group=None)
+
+
+def create_app(config='config'):
+    """
+    Returns a new app, with the settings of the given module or object.
+
+    Servers can create it once before they fork their workers, like gunicorn --preload 'app:create_app()',
+    so the workers start with the modules imported and the templates compiled.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    csrf.init_app(app)
+    # migrations are run by the flask command only, servers don't import alembic,
+    # and commands don't serve pages, they skip compiling the templates
+    command = click.get_current_context(silent=True) is not None
+    if command:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    instrumentation.init_app(app)
+    replicas.init_app(app)
+    page_cache.init_app(app)
+    geo.init_app(app)
+    typeahead.init_app(app, preload=app.config['TYPEAHEAD_PRELOAD'] and not command)
+    app.register_blueprint(pages)
+    app.register_blueprint(api)
+    init_templates(app, precompile=app.config['PRECOMPILE_TEMPLATES'] and not command)
+    init_logging(app)
+    return app
+
+
+def init_templates(app, precompile):
+    # compiled templates are kept on disk, for the next processes, and loaded before the workers fork
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        directory = app.config['TEMPLATE_CACHE_DIR']
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    if precompile:
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+        # formatting a date imports babel and loads its locale data
+        for format in datetimeFormats:
+            format_datetime.__wrapped__(datetime(2000, 1, 1), format)
+
+
+def init_logging(app):
+    # errors are logged to error.log, opened by the first message
+    if app.debug or any(isinstance(handler, FileHandler) for handler in app.logger.handlers):
+        return
+    file_handler = FileHandler('error.log', delay=True)
+    file_handler.setFormatter(
+        Formatter(
+            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    app.logger.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(file_handler)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+# babel patterns of the format names the templates use
+datetimeFormats = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
 
+@lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+    # compiled babel pattern and parsed locale of a (format, locale) pair, the default locale is LC_TIME's.
+    # babel is imported by the first page showing a date, not by every process and command
+    import babel.dates
+    return babel.dates.parse_pattern(datetimeFormats.get(format, format)), \
+        babel.Locale.parse(locale or babel.dates.LC_TIME)
 
-app.jinja_env.filters['datetime'] = format_datetime
+
+@pages.app_template_filter('datetime')
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale=None):
+    # takes datetimes, or strings: ISO 8601 ones are parsed directly, anything else goes through dateutil.
+    # pages repeat the same show times, so formatted values are memoized
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            import dateutil.parser
+            value = dateutil.parser.parse(value)
+    pattern, locale = datetime_pattern(format, locale)
+    # naive times are formatted as UTC, like babel.dates.format_datetime does
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return pattern.apply(value, locale)
+
+#----------------------------------------------------------------------------#
+# Cache invalidation.
+#----------------------------------------------------------------------------#
+
+
+def venue_tags(venue_id):
+    # a venue shows up on its page, the venues list, and with its shows on the shows list and its artists' pages
+    artist_ids = [row.artist_id for row in db.session.query(
+        Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+    tags = ['venue:%s' % venue_id, 'venues'] + \
+        ['artist:%s' % artist_id for artist_id in artist_ids]
+    if artist_ids:
+        tags.append('shows')
+    return tags
+
+
+def artist_tags(artist_id):
+    # an artist shows up on its page, the artists list, and with its shows on the shows list and its venues' pages
+    venue_ids = [row.venue_id for row in db.session.query(
+        Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+    tags = ['artist:%s' % artist_id, 'artists'] + \
+        ['venue:%s' % venue_id for venue_id in venue_ids]
+    if venue_ids:
+        tags.append('shows')
+    return tags
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 
-@app.route('/')
+@pages.route('/')
 def index():
     return render_template('pages/home.html')
 
@@ -59,55 +176,134 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
-def venues():
-    # query all venues and order results by state and city.
-    venues = Venue.query.order_by(Venue.state, Venue.city).all()
+# (query, sort keys) of the listing pages, also run by the async read path of asgi.py
+def areas_listing():
+    # areas ordered by state and city, from the directory of areas.py: a page is one range of its primary key,
+    # however many venues there are
+    return Area.query.with_entities(
+        Area.state, Area.city, Area.venue_count, Area.upcoming_shows_count
+    ), (Area.state, Area.city)
+
+
+def area_listing(state, city):
+    # venues of an area ordered by name, a range of the (state, city, name) index
+    return Venue.query.with_entities(Venue.id, Venue.name, Venue.upcoming_shows_count).filter(
+        Venue.state == state, Venue.city == city), (Venue.name, Venue.id)
+
+
+def artists_listing():
+    return Artist.query.with_entities(Artist.id, Artist.name), (Artist.name, Artist.id)
+
+
+def shows_listing():
+    # join venues and artists in one query, selecting only the columns the show tiles need
+    return Show.query.with_entities(
+        Show.id, Show.venue_id, Venue.name.label('venue_name'),
+        Show.artist_id, Artist.name.label('artist_name'), Artist.image_link.label(
+            'artist_image_link'),
+        Show.start_time
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id), (Show.start_time, Show.id)
+
+
+def show_tiles(shows):
     data = []
-    # group venues by city and state, storing them in dictionaries.
-    for key, group in groupby(venues, lambda x: (x.city, x.state)):
-        dict = {
-            'city': key[0],
-            'state': key[1],
-            'venues': list(group)
-        }
-        data.append(dict)
-    return render_template('pages/venues.html', areas=data)
-
-
-@app.route('/venues/search', methods=['POST'])
+    for show in shows:
+        data.append({
+            'venue_id': show.venue_id,
+            'venue_name': show.venue_name,
+            'artist_id': show.artist_id,
+            'artist_name': show.artist_name,
+            'artist_image_link': show.artist_image_link,
+            'start_time': show.start_time
+        })
+    return data
+
+
+# shows of the venue and artist pages, with the id, name and image of the other side, in one joined query
+def venue_shows(venue_id):
+    return Show.query.with_entities(
+        Show.id, Show.start_time, Artist.id.label('artist_id'), Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Artist, Artist.id == Show.artist_id).filter(Show.venue_id == venue_id)
+
+
+def artist_shows(artist_id):
+    return Show.query.with_entities(
+        Show.id, Show.start_time, Venue.id.label('venue_id'), Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link')
+    ).join(Venue, Venue.id == Show.venue_id).filter(Show.artist_id == artist_id)
+
+
+def detail_page(data, shows):
+    # a venue or artist page dictionary, with its shows rows split into past and upcoming ones
+    now = datetime.today()
+    data['past_shows'] = [show._asdict() for show in shows if show.start_time <= now]
+    data['upcoming_shows'] = [show._asdict() for show in shows if show.start_time > now]
+    return data
+
+
+@pages.route('/venues')
+@page_cache.cached('venues')
+def venues():
+    # one page of the areas of venues, their venues are listed by area_venues()
+    query, keys = areas_listing()
+    page = paginate(query, keys, request.args.get('cursor'), current_app.config['PAGE_SIZE'])
+    return render_template('pages/venues.html', areas=page, page=page)
+
+
+@pages.route('/venues/areas/<state>/<city>')
+@page_cache.cached('venues')
+def area_venues(state, city):
+    # the venues page loads the first page of an area's venues into the area when it's opened, ?fragment=1
+    # renders the list alone
+    query, keys = area_listing(state, city)
+    venues = paginate(query, keys, request.args.get('cursor'), current_app.config['PAGE_SIZE'])
+    template = 'pages/area_venues.html' if request.args.get('fragment') else 'pages/area.html'
+    return render_template(template, state=state, city=city, venues=venues, page=venues)
+
+
+@pages.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
-    # filter venue names, cities, states, and genres by search term
-    venues = Venue.query.filter(or_(Venue.name.ilike('%' + request.form.get('search_term') + '%'), Venue.city.ilike('%' + request.form.get('search_term') + '%'),
-                                    Venue.state.ilike('%' + request.form.get('search_term') + '%'), Venue.genres.ilike('%' + request.form.get('search_term') + '%')))
-    data = []
-    [data.append(venue.dict()) for venue in venues]
+    # search venue names, cities, states, and genres through the search engine, ranked by relevance
+    # the term is read from the query string too, so next and previous page links can be plain links
+    search_term = request.values.get('search_term', '')
+    page = search(Venue, search_term, request.args.get('cursor'))
     response = {}
-    response['count'] = len(data)
-    response['data'] = data
-    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+    response['count'] = page.total
+    response['data'] = [venue._asdict() for venue in page]
+    return render_template('pages/search_venues.html', results=response, page=page, search_term=search_term)
 
 
-@app.route('/venues/<int:venue_id>')
+@pages.route('/venues/near')
+def venues_near():
+    # venues nearest to ?lat=&lng=, or to the center of ?city=&state=, within ?radius= km. pages aren't cached,
+    # every point is a page of its own
+    try:
+        query = geo.parse_near(request.args)
+    except ValueError as error:
+        flash(str(error), 'error')
+        query = None
+    venues = geo.near(*query) if query else []
+    return render_template('pages/venues_near.html', venues=venues, query=query, states=State,
+                           radius=request.args.get('radius', type=float))
+
+
+@pages.route('/venues/<int:venue_id>')
+@conditional(Venue.version)
+@page_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
-    venue = Venue.query.get(venue_id)
+    venue = get(Venue, venue_id)
+    if venue is None:
+        abort(404)
     # shows the venue page with the given venue_id
-    data = venue.dict()
-    past_shows = list(filter(lambda x: x.start_time <
-                             datetime.today(), venue.shows))
-    upcoming_shows = list(filter(lambda x: x.start_time >
-                                 datetime.today(), venue.shows))
-    past_shows = list(map(lambda x: x.artistDict(), past_shows))
-    upcoming_shows = list(map(lambda x: x.artistDict(), upcoming_shows))
-    data['past_shows'] = past_shows
-    data['upcoming_shows'] = upcoming_shows
+    data = detail_page(venue.dict(), venue_shows(venue_id).all())
     return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/create', methods=['GET', 'POST'])
+@pages.route('/venues/create', methods=['GET', 'POST'])
 def create_venue_submission():
     form = VenueForm()
     error = False
@@ -116,15 +312,15 @@ def create_venue_submission():
         try:
             venue = Venue()
 
+            # genres is a list, stored as rows of the venue_genres table
             form.populate_obj(venue)
-            # genres is a list, so convert it to string
-            genresList = request.form.getlist('genres')
-            venue.genres = ', '.join(genresList)
             db.session.add(venue)
             # to return users to the new venue's page, flush the session, and store the id in another variable
             db.session.flush()
             venue_id = venue.id
             db.session.commit()
+            page_cache.invalidate('venues')
+            typeahead.written('venues', venue_id, form.name.data, form.city.data, form.state.data)
         except:
             # if failed, roll back and display a message to the user
             error = True
@@ -140,16 +336,32 @@ def create_venue_submission():
             else:
                 flash(
                     'Venue ' + str(form.name.data) + ' was listed successfully!')
-                return redirect(url_for('show_venue', venue_id=venue_id))
+                return redirect(url_for('pages.show_venue', venue_id=venue_id))
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@pages.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
+    venue = get(Venue, venue_id)
+    if venue is None:
+        abort(404)
+    # the messages name the venue, read it before it's gone
+    name = venue.name
     error = False
     try:
-        venue = Venue.query.filter_by(id=venue_id).delete()
+        tags = venue_tags(venue_id)
+        artist_ids = [row.artist_id for row in db.session.query(
+            Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+        touch(Artist, Artist.id.in_(artist_ids))
+        places = areas.places_of(Venue.id == venue_id)
+        Venue.query.filter_by(id=venue_id).delete()
+        areas.venues_changed(places)
+        # the venue's shows are deleted by the database (on SQLite, see enable_foreign_keys in models.py),
+        # and leave the statistics of their artists
+        stats.shows_changed([], artist_ids)
         db.session.commit()
+        page_cache.invalidate(*tags)
+        typeahead.deleted('venues', venue_id)
     except:
         error = True
         db.session.rollback()
@@ -158,71 +370,68 @@ def delete_venue(venue_id):
         db.session.close()
         if error:
             flash('Oops! Something wrong happened, venue ' +
-                  venue.name + ' could not be deleted.', 'error')
+                  name + ' could not be deleted.', 'error')
         else:
             flash('venue ' +
-                  venue.name + ' was deleted successfully.')
-    return None
+                  name + ' was deleted successfully.')
+    return jsonify(success=not error)
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@pages.route('/artists')
+@page_cache.cached('artists')
 def artists():
-    # query all artists, ordered by names.
-    data = Artist.query.order_by(Artist.name).all()
-    return render_template('pages/artists.html', artists=data)
+    # query one page of artists, ordered by names.
+    query, keys = artists_listing()
+    data = paginate(query, keys, request.args.get('cursor'), current_app.config['PAGE_SIZE'])
+    return render_template('pages/artists.html', artists=data, page=data)
 
 
-@app.route('/artists/search', methods=['POST'])
+@pages.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
-    # filter artist names, cities, states, and genres by search term
-    artists = Artist.query.filter(or_(Artist.name.ilike('%' + request.form.get('search_term') + '%'), Artist.city.ilike('%' + request.form.get('search_term') + '%'),
-                                      Artist.state.ilike('%' + request.form.get('search_term') + '%'), Artist.genres.ilike('%' + request.form.get('search_term') + '%')))
-    data = []
-    [data.append(artist.dict()) for artist in artists]
+    # search artist names, cities, states, and genres through the search engine, ranked by relevance
+    search_term = request.values.get('search_term', '')
+    page = search(Artist, search_term, request.args.get('cursor'))
     response = {}
-    response['count'] = len(data)
-    response['data'] = data
-    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+    response['count'] = page.total
+    response['data'] = [artist._asdict() for artist in page]
+    return render_template('pages/search_artists.html', results=response, page=page, search_term=search_term)
 
 
-@app.route('/artists/<int:artist_id>')
+@pages.route('/artists/<int:artist_id>')
+@conditional(Artist.version)
+@page_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
     # query artist_id from db
-    artist = Artist.query.get(artist_id)
-    data = artist.dict()
-    # filter shows based on current date
-    past_shows = list(filter(lambda x: x.start_time <
-                             datetime.today(), artist.shows))
-    upcoming_shows = list(filter(lambda x: x.start_time >
-                                 datetime.today(), artist.shows))
-    # map venue information to shows
-    past_shows = list(map(lambda x: x.venueDict(), past_shows))
-    upcoming_shows = list(map(lambda x: x.venueDict(), upcoming_shows))
-    data['past_shows'] = past_shows
-    data['upcoming_shows'] = upcoming_shows
+    artist = get(Artist, artist_id)
+    if artist is None:
+        abort(404)
+    # split shows based on current date, with the venue information of each
+    data = detail_page(artist.dict(), artist_shows(artist_id).all())
     return render_template('pages/show_artist.html', artist=data)
 
 #  Update
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET', 'POST'])
+@pages.route('/artists/<int:artist_id>/edit', methods=['GET', 'POST'])
 def edit_artist_submission(artist_id):
     # query artist_id from db
-    artist = Artist.query.get(artist_id)
+    artist = get(Artist, artist_id)
     # pass the artist object to form for editing
     form = ArtistForm(obj=artist)
     error = False
-    # convert genres back to list, and append to form
-    form.genres.data = artist.genres.split(', ')
     # if form passed validation, populate the artist object with form data
     if form.validate_on_submit():
         try:
+            tags = artist_tags(artist_id)
             form.populate_obj(artist)
-            genresList = request.form.getlist('genres')
-            artist.genres = ', '.join(genresList)
+            # venue pages show the artist with their shows
+            touch(Venue, Venue.id.in_(db.session.query(
+                Show.venue_id).filter(Show.artist_id == artist_id)))
             db.session.commit()
+            page_cache.invalidate(*tags)
+            typeahead.written('artists', artist_id, form.name.data, form.city.data, form.state.data)
         except:
             error = True
             db.session.rollback()
@@ -235,22 +444,25 @@ def edit_artist_submission(artist_id):
             else:
                 flash(
                     'Artist ' + request.form['name'] + ' was edited successfully!')
-            return redirect(url_for('show_artist', artist_id=artist_id))
+            return redirect(url_for('pages.show_artist', artist_id=artist_id))
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET', 'POST'])
+@pages.route('/venues/<int:venue_id>/edit', methods=['GET', 'POST'])
 def edit_venue_submission(venue_id):
-    venue = Venue.query.get(venue_id)
+    venue = get(Venue, venue_id)
     form = VenueForm(obj=venue)
     error = False
-    form.genres.data = venue.genres.split(', ')
     if form.validate_on_submit():
         try:
+            tags = venue_tags(venue_id)
             form.populate_obj(venue)
-            genresList = request.form.getlist('genres')
-            venue.genres = ', '.join(genresList)
+            # artist pages show the venue with their shows
+            touch(Artist, Artist.id.in_(db.session.query(
+                Show.artist_id).filter(Show.venue_id == venue_id)))
             db.session.commit()
+            page_cache.invalidate(*tags)
+            typeahead.written('venues', venue_id, form.name.data, form.city.data, form.state.data)
         except:
             error = True
             db.session.rollback()
@@ -263,14 +475,14 @@ def edit_venue_submission(venue_id):
             else:
                 flash(
                     'Venue ' + request.form['name'] + ' was edited successfully!')
-            return redirect(url_for('show_venue', venue_id=venue_id))
+            return redirect(url_for('pages.show_venue', venue_id=venue_id))
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/create', methods=['GET', 'POST'])
+@pages.route('/artists/create', methods=['GET', 'POST'])
 def create_artist_submission():
     form = ArtistForm()
     error = False
@@ -278,13 +490,13 @@ def create_artist_submission():
         try:
             artist = Artist()
             form.populate_obj(artist)
-            genresList = request.form.getlist('genres')
-            artist.genres = ', '.join(genresList)
             db.session.add(artist)
             # to return users to the new artist page, flush the session, and store the id in another variable
             db.session.flush()
             artist_id = artist.id
             db.session.commit()
+            page_cache.invalidate('artists')
+            typeahead.written('artists', artist_id, form.name.data, form.city.data, form.state.data)
         except:
             error = True
             db.session.rollback()
@@ -298,37 +510,38 @@ def create_artist_submission():
             else:
                 flash(
                     'Artist ' + str(form.name.data) + ' was listed successfully!')
-                return redirect(url_for('show_artist', artist_id=artist_id))
+                return redirect(url_for('pages.show_artist', artist_id=artist_id))
     return render_template('forms/new_artist.html', form=form)
 
 #  Shows
 #  ----------------------------------------------------------------
 
 
-@app.route('/shows')
+@pages.route('/shows')
+@conditional(Show.list_version)
+@page_cache.cached('shows')
 def shows():
     # displays list of shows at /shows
-    data = []
-    shows = Show.query.all()
-    for show in shows:
-        data.append({
-            'venue_id': show.venue_id,
-            'venue_name': show.venue.name,
-            'artist_id': show.artist_id,
-            'artist_name': show.artist.name,
-            'artist_image_link': show.artist.image_link,
-            'start_time': show.start_time.isoformat()
-        })
-    return render_template('pages/shows.html', shows=data)
+    query, keys = shows_listing()
+    shows = paginate(query, keys, request.args.get('cursor'), current_app.config['PAGE_SIZE'])
+    return render_template('pages/shows.html', shows=show_tiles(shows), page=shows)
 
 
-@app.route('/shows/create', methods=['GET', 'POST'])
+@pages.route('/shows/create', methods=['GET', 'POST'])
 def create_show_submission():
     form = ShowForm()
     error = False
-    # query only artists who seak venues
-    artists = Artist.query.with_entities(
-        Artist.id, Artist.name, Artist.seeking_venue).filter_by(seeking_venue=True)
+    # query only artists who seak venues, and if a date was picked, only the ones free on that weekday
+    artists = Artist.query.filter_by(seeking_venue=True)
+    try:
+        day = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d')
+        artists = Artist.free_on(day.weekday())
+        if not form.is_submitted():
+            form.start_time.data = datetime.combine(
+                day.date(), form.start_time.data.time())
+    except ValueError:
+        pass
+    artists = artists.with_entities(Artist.id, Artist.name)
     # query only venues who seak talent
     venues = Venue.query.with_entities(
         Venue.id, Venue.name, Venue.seeking_talent).filter_by(seeking_talent=True).all()
@@ -341,7 +554,12 @@ def create_show_submission():
             show = Show()
             form.populate_obj(show)
             db.session.add(show)
+            touch(Venue, Venue.id == form.venue_id.data)
+            touch(Artist, Artist.id == form.artist_id.data)
             db.session.commit()
+            # the venues list counts upcoming shows
+            page_cache.invalidate('shows', 'venues', 'venue:%s' %
+                                  form.venue_id.data, 'artist:%s' % form.artist_id.data)
         except:
             error = True
             db.session.rollback()
@@ -358,38 +576,261 @@ def create_show_submission():
     return render_template('forms/new_show.html', form=form)
 
 
-@app.errorhandler(404)
+@pages.route('/shows/import', methods=['GET', 'POST'])
+def import_shows_submission():
+    return import_submission('shows')
+
+
+@pages.route('/venues/import', methods=['GET', 'POST'])
+def import_venues_submission():
+    return import_submission('venues')
+
+
+@pages.route('/artists/import', methods=['GET', 'POST'])
+def import_artists_submission():
+    return import_submission('artists')
+
+
+def import_submission(kind):
+    # stream an uploaded CSV or JSON lines file into the database, reporting rejected rows
+    report = None
+    upload = request.files.get('file')
+    if request.method == 'POST':
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or JSON lines file to import.', 'error')
+        else:
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8')
+            report = run_import(kind, stream, file_format(
+                upload.filename), current_app.config['IMPORT_BATCH_SIZE'])
+            flash('Import finished: ' + report.summary())
+            page_cache.clear()
+    fields = [name for name in catalogues[kind][2](formdata=None)._fields
+              if name != 'csrf_token'] if kind in catalogues else []
+    return render_template('forms/import.html', kind=kind, fields=fields, report=report)
+
+
+def run_import(kind, stream, format, batch_size):
+    if kind == 'shows':
+        return import_shows(stream, format, batch_size)
+    return import_records(kind, stream, format, batch_size)
+
+
+@pages.cli.command('import')
+@click.argument('kind', type=click.Choice(['shows', 'venues', 'artists']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='File format, guessed from the file extension by default.')
+@click.option('--batch-size', type=int, default=None, help='Rows validated and saved per transaction.')
+def import_command(kind, path, format, batch_size):
+    """Imports shows, venues or artists from a CSV or JSON lines file."""
+    with open(path, encoding='utf-8', newline='') as stream:
+        report = run_import(kind, stream, format or file_format(path),
+                            batch_size or current_app.config['IMPORT_BATCH_SIZE'])
+    page_cache.clear()
+    for number, messages in report.errors:
+        click.echo(f'line {number}: ' + ' '.join(messages), err=True)
+    click.echo(report.summary())
+
+
+@pages.cli.group('stats')
+def stats_command():
+    """Maintains the show statistics of venues and artists."""
+
+
+@stats_command.command('roll')
+@click.option('--every', type=float, default=None,
+              help='Keep running, and roll every given number of seconds.')
+def roll_command(every):
+    """Moves the shows that started since the last roll into the past show statistics."""
+    while True:
+        venues, artists = stats.roll()
+        db.session.commit()
+        if venues or artists:
+            # the lists show upcoming show counts, detail pages are versioned by their latest past show
+            page_cache.invalidate('venues', 'artists')
+            click.echo(f'{venues} venues and {artists} artists rolled.')
+        if every is None:
+            break
+        time.sleep(every)
+
+
+@stats_command.command('check')
+@click.option('--fix', is_flag=True, help='Recompute the statistics that drifted.')
+def check_command(fix):
+    """Recomputes the show statistics in bulk, and reports the venues and artists whose stored ones drifted."""
+    # shows that started since the last roll aren't drift, they're rolled first
+    stats.roll()
+    drifted = 0
+    for model, key in stats.owners:
+        rows = stats.drift(model)
+        for id, stored, actual in rows:
+            click.echo(f'{model.__tablename__[:-1]} {id}: stored ' +
+                       ', '.join(f'{name} {value}' for name, value in zip(stats.statColumns, stored)) +
+                       '; actual ' + ', '.join(f'{name} {value}' for name, value in zip(stats.statColumns, actual)),
+                       err=True)
+        if fix and rows:
+            stats.refresh(model, model.id.in_([row[0] for row in rows]))
+        drifted += len(rows)
+    db.session.commit()
+    if fix and drifted:
+        page_cache.clear()
+    click.echo(f'{drifted} venues and artists drifted' + (', their statistics were recomputed.' if fix and drifted else '.'))
+    if drifted and not fix:
+        sys.exit(1)
+
+
+@pages.cli.command('geocode')
+@click.option('--all', 'everything', is_flag=True, help='Locate every venue again, not only the ones without a location.')
+def geocode_command(everything):
+    """Locates venues with the geocoder of the GEOCODER setting."""
+    located = geo.locate_venues(everything)
+    click.echo(f'{located} venues located.')
+
+
+#  Calendar
+#  ----------------------------------------------------------------
+
+
+def render_calendar(endpoint, title, **filters):
+    # shows between the ?start= and ?end= dates grouped by day, the current month by default
+    try:
+        start, end = parse_range(request.args.get(
+            'start'), request.args.get('end'))
+    except ValueError as error:
+        flash(str(error), 'error')
+        start, end = parse_range()
+    previous, following = neighbours(start, end)
+    days = by_day(shows_between(start, end, **filters))
+    return render_template('pages/calendar.html', title=title, days=days, start=start,
+                           last_day=end - timedelta(days=1), endpoint=endpoint, filters=filters,
+                           previous=previous, following=following)
+
+
+@pages.route('/calendar')
+def calendar():
+    return render_calendar('pages.calendar', 'All shows')
+
+
+@pages.route('/venues/<int:venue_id>/calendar')
+def venue_calendar(venue_id):
+    venue = db.session.query(Venue.name).filter(
+        Venue.id == venue_id).first() or abort(404)
+    return render_calendar('pages.venue_calendar', venue.name, venue_id=venue_id)
+
+
+@pages.route('/artists/<int:artist_id>/calendar')
+def artist_calendar(artist_id):
+    artist = db.session.query(Artist.name).filter(
+        Artist.id == artist_id).first() or abort(404)
+    return render_calendar('pages.artist_calendar', artist.name, artist_id=artist_id)
+
+
+#  Matches
+#  ----------------------------------------------------------------
+
+
+# the stored best matches of an artist or venue, from the last refresh of matchmaking.py. pages aren't cached,
+# refreshes change them
+@pages.route('/artists/<int:artist_id>/matches')
+def artist_matches(artist_id):
+    artist = db.session.query(Artist.id, Artist.name, Artist.seeking_venue).filter(
+        Artist.id == artist_id).first() or abort(404)
+    return render_template('pages/matches.html', owner=artist, kind='venues', seeking=artist.seeking_venue,
+                           matches=matchmaking.best_matches('artists', artist_id))
+
+
+@pages.route('/venues/<int:venue_id>/matches')
+def venue_matches(venue_id):
+    venue = db.session.query(Venue.id, Venue.name, Venue.seeking_talent).filter(
+        Venue.id == venue_id).first() or abort(404)
+    return render_template('pages/matches.html', owner=venue, kind='artists', seeking=venue.seeking_talent,
+                           matches=matchmaking.best_matches('venues', venue_id))
+
+
+@pages.cli.group('matches')
+def matches_command():
+    """Maintains the best matches of the artists seeking venues and the venues seeking talent."""
+
+
+@matches_command.command('refresh')
+@click.option('--all', 'everything', is_flag=True,
+              help='Recompute every list, not only the ones the changes since the last refresh can reach.')
+@click.option('--every', type=float, default=None,
+              help='Keep running, and refresh every given number of seconds.')
+def refresh_matches_command(everything, every):
+    """Recomputes the match lists of the artists and venues that changed since the last refresh."""
+    while True:
+        artists, venues = matchmaking.refresh(everything)
+        db.session.commit()
+        if artists or venues:
+            click.echo(f'{artists} artists and {venues} venues matched.')
+        if every is None:
+            break
+        everything = False
+        time.sleep(every)
+
+
+#  Genres
+#  ----------------------------------------------------------------
+
+
+@pages.route('/genres')
+def genres():
+    # count venues and artists of every genre, both counted from the genre tables' primary key indexes
+    venue_counts = dict(db.session.query(
+        VenueGenre.genre, func.count()).group_by(VenueGenre.genre))
+    artist_counts = dict(db.session.query(
+        ArtistGenre.genre, func.count()).group_by(ArtistGenre.genre))
+    data = [{
+        'name': genre.value,
+        'venues_count': venue_counts.get(genre.value, 0),
+        'artists_count': artist_counts.get(genre.value, 0)
+    } for genre in Genre]
+    return render_template('pages/genres.html', genres=data)
+
+
+@pages.route('/genres/<genre>/venues')
+def genre_venues(genre):
+    if genre not in [choice.value for choice in Genre]:
+        abort(404)
+    # walk the (genre, venue_id) primary key of venue_genres, one page at a time
+    data = paginate(VenueGenre.query.with_entities(VenueGenre.venue_id, Venue.name).join(
+        Venue, Venue.id == VenueGenre.venue_id).filter(VenueGenre.genre == genre),
+        (VenueGenre.venue_id,), request.args.get('cursor'), current_app.config['PAGE_SIZE'])
+    return render_template('pages/genre.html', genre=genre, kind='venues', items=data, page=data)
+
+
+@pages.route('/genres/<genre>/artists')
+def genre_artists(genre):
+    if genre not in [choice.value for choice in Genre]:
+        abort(404)
+    data = paginate(ArtistGenre.query.with_entities(ArtistGenre.artist_id, Artist.name).join(
+        Artist, Artist.id == ArtistGenre.artist_id).filter(ArtistGenre.genre == genre),
+        (ArtistGenre.artist_id,), request.args.get('cursor'), current_app.config['PAGE_SIZE'])
+    return render_template('pages/genre.html', genre=genre, kind='artists', items=data, page=data)
+
+
+@pages.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@pages.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,111 @@
+# This file contains the directory of areas, the cities and states of venues, behind the venues page.
+# Every area stores its number of venues and the sum of their upcoming shows, the statistics of stats.py.
+# On PostgreSQL, statement level triggers of the venues table add the changes of every statement to the areas
+# of the inserted, deleted and updated venues, so concurrent writes of one area don't race. Other databases
+# recompute the areas of the venues of every flush, of bulk writes of venues, and of refreshed statistics.
+
+from sqlalchemy import DDL, event, func, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from models import db, Venue, Area
+
+# areas recomputed by one statement
+placesPerQuery = 500
+
+# rows of the transition tables of the venues trigger: (state, city, venues, upcoming shows) changes
+changes = {
+    'insert': 'SELECT state, city, 1, upcoming_shows_count FROM new_venues',
+    'delete': 'SELECT state, city, -1, -upcoming_shows_count FROM old_venues',
+    'update': 'SELECT state, city, 1, upcoming_shows_count FROM new_venues '
+              'UNION ALL SELECT state, city, -1, -upcoming_shows_count FROM old_venues'
+}
+
+transitions = {
+    'insert': 'NEW TABLE AS new_venues',
+    'delete': 'OLD TABLE AS old_venues',
+    'update': 'OLD TABLE AS old_venues NEW TABLE AS new_venues'
+}
+
+
+# statements creating the trigger functions and triggers of the areas, also used when tables are created with
+# create_all. triggers with transition tables can't be limited to columns, updates that don't move a venue or
+# change its upcoming shows add nothing
+def postgres_ddl():
+    statements = []
+    for operation, rows in changes.items():
+        body = ('INSERT INTO areas (state, city, venue_count, upcoming_shows_count) '
+                'SELECT state, city, sum(venues), sum(upcoming) '
+                f'FROM ({rows}) AS changes (state, city, venues, upcoming) GROUP BY state, city '
+                'HAVING sum(venues) <> 0 OR sum(upcoming) <> 0 '
+                'ON CONFLICT (state, city) DO UPDATE SET venue_count = areas.venue_count + excluded.venue_count, '
+                'upcoming_shows_count = areas.upcoming_shows_count + excluded.upcoming_shows_count; ')
+        if operation != 'insert':
+            body += 'DELETE FROM areas WHERE venue_count <= 0 AND (state, city) IN (SELECT state, city FROM old_venues); '
+        statements.append(f'CREATE OR REPLACE FUNCTION venues_areas_{operation}() RETURNS trigger AS $$ '
+                          f'BEGIN {body}RETURN NULL; END $$ LANGUAGE plpgsql')
+        statements.append(f'CREATE TRIGGER venues_areas_{operation} AFTER {operation.upper()} ON venues '
+                          f'REFERENCING {transitions[operation]} FOR EACH STATEMENT '
+                          f'EXECUTE PROCEDURE venues_areas_{operation}()')
+    return statements
+
+
+# the triggers write to areas, they're created once every table is
+for statement in postgres_ddl():
+    event.listen(db.metadata, 'after_create',
+                 DDL(statement).execute_if(dialect='postgresql'))
+
+
+def maintained_by_triggers(session=None):
+    return (session or db.session).get_bind(Venue.__mapper__).dialect.name == 'postgresql'
+
+
+def places_of(criterion, session=None):
+    # (state, city) of the venues matching the criterion
+    return set((session or db.session).query(Venue.state, Venue.city).filter(criterion).distinct())
+
+
+def refresh(places, session=None):
+    """
+    Recomputes the given (state, city) areas from their venues.
+    """
+    session = session or db.session
+    places = list(places)
+    for start in range(0, len(places), placesPerQuery):
+        chunk = places[start:start + placesPerQuery]
+        session.execute(Area.__table__.delete().where(
+            tuple_(Area.state, Area.city).in_(chunk)))
+        session.execute(Area.__table__.insert().from_select(
+            ['state', 'city', 'venue_count', 'upcoming_shows_count'],
+            session.query(Venue.state, Venue.city, func.count(Venue.id), func.sum(Venue.upcoming_shows_count)).filter(
+                tuple_(Venue.state, Venue.city).in_(chunk)).group_by(Venue.state, Venue.city).statement))
+
+
+def venues_changed(places, session=None):
+    # areas of venues written without the ORM, where there are no triggers
+    if places and not maintained_by_triggers(session):
+        refresh(places, session)
+
+
+def rebuild():
+    # every area, from all venues
+    db.session.execute(Area.__table__.delete())
+    db.session.execute(Area.__table__.insert().from_select(
+        ['state', 'city', 'venue_count', 'upcoming_shows_count'],
+        db.session.query(Venue.state, Venue.city, func.count(Venue.id), func.sum(Venue.upcoming_shows_count)).group_by(
+            Venue.state, Venue.city).statement))
+
+
+# areas of the venues a flush wrote, their old areas included, on databases without the triggers
+@event.listens_for(Session, 'after_flush')
+def update_areas(session, flush_context):
+    venues = [target for target in list(session.new) + list(session.dirty) + list(session.deleted)
+              if isinstance(target, Venue)]
+    if not venues or maintained_by_triggers(session):
+        return
+    places = set()
+    for venue in venues:
+        states, cities = get_history(venue, 'state'), get_history(venue, 'city')
+        if venue in session.dirty and not (states.has_changes() or cities.has_changes()):
+            continue
+        places.update((state, city) for state in states.sum() for city in cities.sum())
+    refresh(places, session)
@@ -0,0 +1,372 @@
+# This file contains the asyncio serving mode of the read only pages: the venue, artist and show lists,
+# the venue and artist pages and the searches are read through an async database driver and its connection pool,
+# so a single process keeps many requests waiting on the database at once. Every other request, forms,
+# CSRF checks and writes included, is passed on to the Flask app, and served on the usual sync path in a thread.
+# Needs the asgiref package, an ASGI server and the async driver of the database: asyncpg for PostgreSQL,
+# aiosqlite for SQLite.
+#
+#   $ pip install asgiref uvicorn asyncpg
+#   $ uvicorn asgi:application --workers 2
+
+import asyncio
+import io
+import random
+import re
+import sys
+import time
+from collections import namedtuple
+from functools import lru_cache
+from asgiref.wsgi import WsgiToAsgi
+from flask import render_template, request, g
+from sqlalchemy import Numeric
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import Query
+from werkzeug.http import parse_cookie
+from app import create_app, areas_listing, artists_listing, shows_listing, show_tiles, venue_shows, artist_shows, \
+    detail_page
+from api import venueColumns, artistColumns
+from models import db, Venue, Artist, VenueGenre, ArtistGenre
+from pagination import keyset, page_of
+from search import search_statements, search_rows, search_page
+from replicas import primaryCookie
+
+app = create_app()
+
+# dialects statements are compiled with, in the parameter style of the async driver
+dialects = {
+    'postgresql': lambda: postgresql.psycopg2.dialect(paramstyle='numeric'),
+    'sqlite': lambda: sqlite.dialect(paramstyle='qmark')
+}
+
+# (sql, positional parameters, row names, result processors) of a statement, ready for the driver
+Prepared = namedtuple('Prepared', ['sql', 'params', 'names', 'processors'])
+
+
+@lru_cache(maxsize=256)
+def row_type(names):
+    # rows keep the attribute access and _asdict() of query rows, which the views and templates use
+    return namedtuple('Row', names, rename=True)
+
+
+class AsyncDatabase(object):
+    """
+    Pool of connections of an async driver to the database of a SQLAlchemy URL.
+
+    Statements are built with the models, compiled with the dialect of the database,
+    and their rows are converted by the same column types as on the sync path.
+
+    :param url:
+        SQLAlchemy database URL, a postgresql:// or sqlite:// one.
+    :param pool_size:
+        most connections open at once, requests wait for a free one beyond that.
+    """
+
+    def __init__(self, url, pool_size=10):
+        self.url = make_url(url)
+        self.backend = self.url.get_backend_name()
+        if self.backend not in dialects:
+            raise ValueError(
+                f'The async read path supports PostgreSQL and SQLite, not {self.backend}.')
+        self.dialect = dialects[self.backend]()
+        self.pool_size = pool_size
+        self.pool = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self.lock:
+            if self.pool is not None:
+                return
+            if self.backend == 'postgresql':
+                import asyncpg
+                url = make_url(str(self.url))
+                url.drivername = 'postgresql'
+                self.pool = await asyncpg.create_pool(str(url), min_size=1, max_size=self.pool_size)
+                # like the dialect's initialize() on the sync path, literals follow the server's string syntax
+                self.dialect._backslash_escapes = await self.pool.fetchval(
+                    'SHOW standard_conforming_strings') == 'off'
+            else:
+                import aiosqlite
+                # aiosqlite runs every connection in its own thread, the queue hands them out
+                self.pool = asyncio.Queue()
+                for number in range(self.pool_size):
+                    self.pool.put_nowait(await aiosqlite.connect(self.url.database or ':memory:'))
+
+    async def close(self):
+        async with self.lock:
+            if self.pool is None:
+                return
+            if self.backend == 'postgresql':
+                await self.pool.close()
+            else:
+                while not self.pool.empty():
+                    await self.pool.get_nowait().close()
+            self.pool = None
+
+    def prepare(self, statement):
+        # compiles a query or a statement. queries need an app context to be built, compiled statements don't
+        names = None
+        if isinstance(statement, Query):
+            names = tuple(description['name']
+                          for description in statement.column_descriptions)
+            statement = statement.statement
+        compiled = statement.compile(dialect=self.dialect)
+        params = []
+        for name in compiled.positiontup:
+            value = compiled.params[name]
+            bind_type = compiled.binds[name].type.dialect_impl(self.dialect)
+            processor = bind_type.bind_processor(self.dialect)
+            params.append(processor(value) if processor else value)
+        processors = [self.result_processor(column.type) for column in getattr(statement, 'inner_columns', ())]
+        sql = str(compiled)
+        if self.backend == 'postgresql':
+            # asyncpg takes $1 placeholders. statements never hold literals, every value is a parameter
+            sql = re.sub(r'(?<![:\w]):(\d+)', r'$\1', sql)
+        return Prepared(sql, params, names, processors)
+
+    def result_processor(self, type):
+        # asyncpg decodes numbers to their Python types already, the dialect's number processors need the type code
+        # of a psycopg2 cursor description
+        type = type.dialect_impl(self.dialect)
+        if self.backend == 'postgresql' and isinstance(type, Numeric):
+            return None
+        return type.result_processor(self.dialect, None)
+
+    async def fetch(self, prepared):
+        if self.pool is None:
+            await self.connect()
+        if self.backend == 'postgresql':
+            async with self.pool.acquire() as connection:
+                rows = await connection.fetch(prepared.sql, *prepared.params)
+        else:
+            connection = await self.pool.get()
+            try:
+                async with connection.execute(prepared.sql, prepared.params) as cursor:
+                    rows = await cursor.fetchall()
+            finally:
+                self.pool.put_nowait(connection)
+        processors = prepared.processors
+        if any(processors):
+            rows = [[processor(value) if processor else value for processor, value in zip(processors, row)]
+                    for row in rows]
+        if prepared.names:
+            make = row_type(prepared.names)
+            return [make(*row) for row in rows]
+        return [tuple(row) for row in rows]
+
+
+def reads_primary(scope):
+    # users who just wrote read from the primary, through the Flask app
+    return any(name == b'cookie' and primaryCookie in parse_cookie(value.decode('latin-1'))
+               for name, value in scope['headers'])
+
+
+def environ_of(scope):
+    # the WSGI environ of a GET request, Flask's request context is built from it
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = [str(value) for value in scope.get('server') or ('localhost', 80)]
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = [str(value) for value in scope['client']]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+
+class ReadRequest(object):
+    """
+    One request of the async read path.
+
+    Flask's request context is pushed only while the statements of the request are built and its page is rendered,
+    never across an await: Flask keeps contexts per thread, not per task, and requests interleave on the event loop.
+    """
+
+    def __init__(self, scope, database):
+        self.environ = environ_of(scope)
+        self.database = database
+        self.statements = 0
+        self.started = time.perf_counter()
+        self.sql_time = 0
+
+    def context(self):
+        return app.request_context(self.environ)
+
+    async def fetch(self, *queries):
+        # the rows of every prepared query, concurrently on connections of the pool
+        self.statements += len(queries)
+        start = time.perf_counter()
+        try:
+            return await asyncio.gather(*[self.database.fetch(query) for query in queries])
+        finally:
+            self.sql_time += time.perf_counter() - start
+
+    def respond(self, body, status=200):
+        # in a pushed context, the response goes through the after request hooks, which also save the session
+        # and record the metrics of the request. SQL time is the time spent waiting on the database
+        g.query_count = self.statements
+        g.request_start, g.sql_time = self.started, self.sql_time
+        return app.process_response(app.make_response((body, status)))
+
+
+def page_args():
+    return request.args.get('cursor'), app.config['PAGE_SIZE']
+
+
+async def venues(read):
+    with read.context():
+        query, keys = areas_listing()
+        query, direction = keyset(query, keys, *page_args())
+        query = read.database.prepare(query)
+    rows, = await read.fetch(query)
+    with read.context():
+        page = page_of(rows, keys, direction, app.config['PAGE_SIZE'])
+        return read.respond(render_template('pages/venues.html', areas=page, page=page))
+
+
+async def artists(read):
+    with read.context():
+        query, keys = artists_listing()
+        query, direction = keyset(query, keys, *page_args())
+        query = read.database.prepare(query)
+    rows, = await read.fetch(query)
+    with read.context():
+        page = page_of(rows, keys, direction, app.config['PAGE_SIZE'])
+        return read.respond(render_template('pages/artists.html', artists=page, page=page))
+
+
+async def shows(read):
+    with read.context():
+        query, keys = shows_listing()
+        query, direction = keyset(query, keys, *page_args())
+        query = read.database.prepare(query)
+    rows, = await read.fetch(query)
+    with read.context():
+        page = page_of(rows, keys, direction, app.config['PAGE_SIZE'])
+        return read.respond(render_template('pages/shows.html', shows=show_tiles(page), page=page))
+
+
+def search_view(model, template):
+    async def view(read):
+        with read.context():
+            search_term = request.args.get('search_term', '')
+            number, count, ids = search_statements(
+                model, search_term, request.args.get('cursor'))
+            count, ids = read.database.prepare(count), read.database.prepare(ids)
+        count, ids = await read.fetch(count, ids)
+        total, ids = count[0][0], [row[0] for row in ids]
+        rows = []
+        if ids:
+            with read.context():
+                query = read.database.prepare(search_rows(model, ids))
+            rows, = await read.fetch(query)
+        with read.context():
+            page = search_page(number, total, ids, rows)
+            results = {'count': page.total, 'data': [row._asdict() for row in page]}
+            return read.respond(render_template(template, results=results, page=page, search_term=search_term))
+    return view
+
+
+def detail_view(model, columns, genre_model, key, shows_of, template, name):
+    # the row, the genres and the shows of a venue or an artist page, read at once on three connections
+    async def view(read, id):
+        id = int(id)
+        with read.context():
+            queries = [read.database.prepare(query) for query in (
+                db.session.query(*columns).filter(model.id == id),
+                db.session.query(genre_model.genre).filter(
+                    key == id).order_by(genre_model.genre),
+                shows_of(id))]
+        row, genres, shows = await read.fetch(*queries)
+        with read.context():
+            if not row:
+                return read.respond(render_template('errors/404.html'), 404)
+            data = row[0]._asdict()
+            data['genres'] = [genre for genre, in genres]
+            if 'availability_mask' in data:
+                data['availability'] = Artist(
+                    name=data['name'], availability_mask=data.pop('availability_mask')).availability
+            data = detail_page(data, shows)
+            data['past_shows_count'] = len(data['past_shows'])
+            data['upcoming_shows_count'] = len(data['upcoming_shows'])
+            return read.respond(render_template(template, **{name: data}))
+    return view
+
+
+show_venue = detail_view(Venue, venueColumns, VenueGenre, VenueGenre.venue_id, venue_shows,
+                         'pages/show_venue.html', 'venue')
+show_artist = detail_view(Artist, artistColumns, ArtistGenre, ArtistGenre.artist_id, artist_shows,
+                          'pages/show_artist.html', 'artist')
+
+# GET requests of these paths are served on the async read path
+routes = [(re.compile(pattern), view) for pattern, view in (
+    (r'/venues', venues),
+    (r'/venues/search', search_view(Venue, 'pages/search_venues.html')),
+    (r'/venues/(\d+)', show_venue),
+    (r'/artists', artists),
+    (r'/artists/search', search_view(Artist, 'pages/search_artists.html')),
+    (r'/artists/(\d+)', show_artist),
+    (r'/shows', shows),
+)]
+
+# every worker reads from one of the replicas, when there are some
+database = AsyncDatabase(random.choice(app.config['DATABASE_REPLICA_URLS'] or [app.config['SQLALCHEMY_DATABASE_URI']]),
+                         app.config['ASYNC_POOL_SIZE'])
+flask_application = WsgiToAsgi(app)
+
+
+async def send_response(send, response):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.to_wsgi_list()]
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await database.connect()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await database.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['method'] == 'GET' and not (
+            app.config['DATABASE_REPLICA_URLS'] and reads_primary(scope)):
+        for pattern, view in routes:
+            match = pattern.fullmatch(scope['path'])
+            if match:
+                read = ReadRequest(scope, database)
+                try:
+                    response = await view(read, *match.groups())
+                except Exception:
+                    app.logger.exception('Exception on %s [GET]', scope['path'])
+                    with read.context():
+                        response = read.respond(
+                            render_template('errors/500.html'), 500)
+                return await send_response(send, response)
+    return await flask_application(scope, receive, send)
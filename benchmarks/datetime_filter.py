@@ -0,0 +1,67 @@
+# Micro-benchmark of the datetime template filter, formatting the show times of a large /shows page.
+# Compares the previous filter (dateutil parse of an ISO string, babel.dates.format_datetime) with app.format_datetime,
+# for datetime objects and strings, without its memo, and with a cold and a warm memo.
+#
+#   $ python benchmarks/datetime_filter.py [number of show tiles]
+
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import babel.dates  # noqa: E402
+import dateutil.parser  # noqa: E402
+from app import format_datetime  # noqa: E402
+
+
+def previous_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def show_times(count):
+    # shows start on the hour or half hour over a season, so a page repeats some of its times
+    start = datetime(2030, 1, 1, 18)
+    return [start + timedelta(days=number % 120, minutes=30 * (number % 7)) for number in range(count)]
+
+
+def timed(function, values, repeat=5):
+    # best of a few runs, in milliseconds for the whole page
+    return min(timeit.repeat(lambda: [function(value, 'full') for value in values], number=1, repeat=repeat)) * 1000
+
+
+def main(count=5000):
+    times = show_times(count)
+    strings = [time.isoformat() for time in times]
+    assert [previous_format_datetime(value, 'full') for value in strings] == \
+        [format_datetime(value, 'full') for value in times]
+
+    def cold(function, values):
+        format_datetime.cache_clear()
+        return function(values)
+
+    results = [
+        ('previous filter, ISO strings', timed(previous_format_datetime, strings)),
+        # __wrapped__ is the filter without its memo, the gain of the cached pattern and locale alone
+        ('datetimes, no memo', timed(format_datetime.__wrapped__, times)),
+        ('ISO strings, no memo', timed(format_datetime.__wrapped__, strings)),
+        ('datetimes, cold memo', min(cold(lambda values: timed(format_datetime, values, repeat=1), times)
+                                     for run in range(5))),
+        ('ISO strings, cold memo', min(cold(lambda values: timed(format_datetime, values, repeat=1), strings)
+                                       for run in range(5))),
+        ('datetimes, warm memo', timed(format_datetime, times)),
+    ]
+    baseline = results[0][1]
+    print(f'{count} show tiles, {len(set(times))} distinct times')
+    for name, milliseconds in results:
+        print(f'{name:32} {milliseconds:9.2f} ms  {baseline / milliseconds:6.1f}x')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
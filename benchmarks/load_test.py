@@ -0,0 +1,259 @@
+# Load test of the read only pages, served by the sync Flask app (gunicorn, threads) and by the async read path
+# of asgi.py (uvicorn), on the same database with the page cache off. Every request is a page rendered from the
+# database: list pages, venue and artist pages of random ids, and searches. For each server it reports
+# requests per second, latencies, and the resident memory of all its processes, so the worker counts can be
+# set for equal memory, and throughput compared per GB.
+# The database can be put behind a proxy adding a round trip latency, like a database on another host.
+#
+#   $ pip install gunicorn uvicorn asgiref asyncpg
+#   $ DATABASE_URL=postgresql://localhost:5432/fyyur python benchmarks/load_test.py \
+#         --sync-workers 4 --async-workers 2 --concurrency 64 --latency 2
+#
+# This module is also the app module of the servers, see wsgi_application and asgi_application below.
+
+import argparse
+import asyncio
+import os
+import queue
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+# pages are rendered on every request on both paths, the async path has no page cache
+os.environ['PAGE_CACHE_BACKEND'] = ''
+
+from sqlalchemy.engine.url import make_url  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db, Venue, Artist  # noqa: E402
+
+app = wsgi_application = create_app()
+
+servers = {
+    'sync': 'gunicorn --chdir {root} --workers {workers} --threads {threads} --bind 127.0.0.1:{port} '
+            'benchmarks.load_test:wsgi_application',
+    'async': 'uvicorn --app-dir {root} --workers {workers} --port {port} --no-access-log '
+             'benchmarks.load_test:asgi_application'
+}
+
+
+def __getattr__(name):
+    # asgi.py is only imported by the async server, so the sync one doesn't carry its modules
+    if name == 'asgi_application':
+        import asgi
+        return asgi.application
+    raise AttributeError(name)
+
+
+def workload(count=2000, seed=1):
+    # request paths, a few list pages and many detail pages of random venues and artists, plus searches
+    with app.app_context():
+        venue_ids = [row.id for row in db.session.query(Venue.id)]
+        artist_ids = [row.id for row in db.session.query(Artist.id)]
+        words = [row.name.split()[0] for row in db.session.query(Artist.name).limit(200)]
+    rng = random.Random(seed)
+    paths = []
+    for number in range(count):
+        kind = number % 10
+        if kind < 3:
+            paths.append(rng.choice(['/venues', '/artists', '/shows']))
+        elif kind < 6 and venue_ids:
+            paths.append('/venues/%s' % rng.choice(venue_ids))
+        elif kind < 9 and artist_ids:
+            paths.append('/artists/%s' % rng.choice(artist_ids))
+        elif words:
+            paths.append('/artists/search?search_term=%s' % rng.choice(words)[:3].lower())
+    return paths
+
+
+def tree_rss(pid):
+    # resident memory of a process and its descendants, in bytes, from /proc (Linux only)
+    total = 0
+    pending = [pid]
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f'/proc/{pid}/status') as status:
+                total += next(int(line.split()[1]) * 1024 for line in status if line.startswith('VmRSS:'))
+            for task in os.listdir(f'/proc/{pid}/task'):
+                with open(f'/proc/{pid}/task/{task}/children') as children:
+                    pending.extend(int(child) for child in children.read().split())
+        except (OSError, StopIteration):
+            pass
+    return total
+
+
+async def delay_proxy(target, latency):
+    # a TCP proxy to the database adding latency seconds to every round trip, half on the way in and out
+    async def pipe(reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                await asyncio.sleep(latency / 2)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(client_reader, client_writer):
+        if isinstance(target, str):
+            server_reader, server_writer = await asyncio.open_unix_connection(target)
+        else:
+            server_reader, server_writer = await asyncio.open_connection(*target)
+        asyncio.ensure_future(pipe(client_reader, server_writer))
+        asyncio.ensure_future(pipe(server_reader, client_writer))
+    return await asyncio.start_server(handle, '127.0.0.1', 0)
+
+
+def start_proxy(target, latency):
+    # runs the proxy on its own event loop, so the load generator never holds up the database's replies.
+    # returns the port it listens on
+    ports = queue.Queue()
+
+    async def serve():
+        server = await delay_proxy(target, latency)
+        ports.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    return ports.get()
+
+
+def database_address(url):
+    # where the database of a URL listens: a unix socket path or a (host, port) pair
+    url = make_url(url)
+    host = url.query.get('host') or url.host or 'localhost'
+    if host.startswith('/'):
+        return os.path.join(host, '.s.PGSQL.%s' % (url.port or 5432))
+    return host, url.port or 5432
+
+
+def proxied_url(url, port):
+    # the database URL through the proxy listening on the given local port
+    url = make_url(url)
+    url.query = {key: value for key, value in url.query.items() if key != 'host'}
+    url.host, url.port = '127.0.0.1', port
+    return str(url)
+
+
+async def fetch(reader, writer, path):
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def load(port, paths, concurrency, duration):
+    # every connection sends its requests one after another, on a kept alive connection
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client(number):
+        nonlocal errors
+        reader = writer = None
+        index = number
+        while time.monotonic() < deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                start = time.monotonic()
+                status = await fetch(reader, writer, paths[index % len(paths)])
+                latencies.append(time.monotonic() - start)
+                if status >= 500:
+                    errors += 1
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors += 1
+                writer = None
+            index += concurrency
+        if writer is not None:
+            writer.close()
+    started = time.monotonic()
+    await asyncio.gather(*[client(number) for number in range(concurrency)])
+    return latencies, errors, time.monotonic() - started
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'The server did not listen on port {port}.')
+
+
+async def run(mode, workers, args, paths, database_url):
+    port = 8100 + len(mode)
+    command = servers[mode].format(root=root, workers=workers, threads=args.threads, port=port)
+    environment = dict(os.environ, DATABASE_URL=database_url)
+    server = subprocess.Popen(command.split(), env=environment, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        await asyncio.get_event_loop().run_in_executor(None, wait_for, port)
+        await load(port, paths, args.concurrency, args.warmup)
+        peak = tree_rss(server.pid)
+
+        async def sample():
+            nonlocal peak
+            while True:
+                await asyncio.sleep(0.5)
+                peak = max(peak, tree_rss(server.pid))
+        sampler = asyncio.ensure_future(sample())
+        latencies, errors, elapsed = await load(port, paths, args.concurrency, args.duration)
+        sampler.cancel()
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+    latencies.sort()
+    rps = len(latencies) / elapsed
+    gigabytes = peak / 2 ** 30
+
+    def percentile(value):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * value))] * 1000 if latencies else 0
+    print(f'{mode:6} {workers:2} workers {rps:9.1f} req/s  p50 {percentile(0.5):7.1f} ms  '
+          f'p99 {percentile(0.99):7.1f} ms  {peak / 2 ** 20:7.1f} MB  {rps / gigabytes:9.1f} req/s per GB  '
+          f'{errors} errors', flush=True)
+
+
+async def main(args):
+    paths = workload()
+    database_url = app.config['SQLALCHEMY_DATABASE_URI']
+    if args.latency:
+        database_url = proxied_url(database_url, start_proxy(
+            database_address(database_url), args.latency / 1000))
+    print(f'{len(paths)} paths, {args.concurrency} connections, {args.duration}s, '
+          f'{args.latency} ms database round trips', flush=True)
+    for mode, workers in (('sync', args.sync_workers), ('async', args.async_workers)):
+        await run(mode, workers, args, paths, database_url)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sync-workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8,
+                        help='threads of every sync worker')
+    parser.add_argument('--async-workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='milliseconds added to every database round trip')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,100 @@
+# Benchmark of the matchmaking of matchmaking.py, on a synthetic database (see synthetic.py).
+# Times a refresh of every list, the refreshes after a few venues and artists are edited like the app edits them,
+# and the match pages and API reading the stored lists.
+#
+#   $ python benchmarks/matches.py --shows 1m
+#   $ python benchmarks/matches.py --shows 1m --database postgresql://localhost:5432/fyyur_bench
+#
+# The database is emptied and seeded first, unless --reuse is given. Without --database, a SQLite file
+# in the temporary directory is used.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic import scales  # noqa: E402
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def edit(rng, count):
+    # genres of seeking venues and artists replaced by other genres
+    from models import db, Venue, Artist
+    from enums import Genre
+    genres = [genre.value for genre in Genre]
+    for model, seeking in ((Venue, Venue.seeking_talent), (Artist, Artist.seeking_venue)):
+        ids = [row[0] for row in db.session.query(model.id).filter(seeking == True)]
+        for id in rng.sample(ids, min(count, len(ids))):
+            profile = db.session.query(model).get(id)
+            profile.genres = rng.sample([genre for genre in genres if genre not in profile.genres], rng.randint(1, 3))
+    db.session.commit()
+
+
+def percentiles(durations):
+    durations.sort()
+    return durations[len(durations) // 2], durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+
+
+def main(args):
+    shows = scales.get(args.shows.lower()) or int(args.shows)
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.gettempdir(), f'fyyur-matches-{shows}.sqlite')
+    os.environ.update(FYYUR_ENV='test', DATABASE_URL=database, PAGE_CACHE_BACKEND='', METRICS_ENDPOINT='0')
+    from app import create_app
+    import matchmaking
+    from synthetic import seed
+    from models import db, Venue, Artist
+    app = create_app()
+    app.logger.disabled = True
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    with app.app_context():
+        if not args.reuse:
+            started = time.perf_counter()
+            seed(shows, args.seed, app.config['IMPORT_BATCH_SIZE'])
+            print(f'seeded {shows} shows in {time.perf_counter() - started:.1f}s', flush=True)
+        artists = db.session.query(Artist.id).filter(Artist.seeking_venue == True).count()
+        venues = db.session.query(Venue.id).filter(Venue.seeking_talent == True).count()
+        print(f'{artists} artists seeking venues and {venues} venues seeking talent on {db.engine.dialect.name}, '
+              f'{app.config["MATCHES_PER_PROFILE"]} matches a list')
+        duration, refreshed = timed(lambda: matchmaking.refresh(everything=True))
+        db.session.commit()
+        print(f'{"every list":24} {duration:10.1f} ms  {refreshed[0]} artists, {refreshed[1]} venues', flush=True)
+        duration, refreshed = timed(matchmaking.refresh)
+        db.session.commit()
+        print(f'{"nothing changed":24} {duration:10.1f} ms  {refreshed[0]} artists, {refreshed[1]} venues', flush=True)
+        for count in (1, 10, 100):
+            edit(rng, count)
+            duration, refreshed = timed(matchmaking.refresh)
+            db.session.commit()
+            print(f'{f"{count} of each edited":24} {duration:10.1f} ms  {refreshed[0]} artists, {refreshed[1]} venues',
+                  flush=True)
+        artist_ids = [row[0] for row in db.session.query(Artist.id).filter(Artist.seeking_venue == True)]
+        venue_ids = [row[0] for row in db.session.query(Venue.id).filter(Venue.seeking_talent == True)]
+        cases = [
+            ('artist matches page', lambda: client.get(f'/artists/{rng.choice(artist_ids)}/matches').get_data()),
+            ('venue matches page', lambda: client.get(f'/venues/{rng.choice(venue_ids)}/matches').get_data()),
+            ('API artist matches', lambda: client.get(f'/api/v1/artists/{rng.choice(artist_ids)}/matches').get_data()),
+        ]
+        for name, function in cases:
+            function()
+            median, p95 = percentiles([timed(function)[0] for number in range(args.repeat)])
+            print(f'{name:24} p50 {median:8.2f} ms  p95 {p95:8.2f} ms', flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shows', default='100k', help='number of shows, or one of 1k, 100k and 1m')
+    parser.add_argument('--database', help='SQLAlchemy URL of the database, it is emptied')
+    parser.add_argument('--reuse', action='store_true', help='keep the database of an earlier run of the same scale')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=200, help='requests of every page')
+    main(parser.parse_args())
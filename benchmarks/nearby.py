@@ -0,0 +1,109 @@
+# Benchmark of the nearby venues search of geo.py, on a database of synthetic venues only (see synthetic.py).
+# Times the nearest venues of points in cities, where venues are dense, and of points anywhere in the country,
+# where the search reads more cells before it finds them, and searches of a fixed radius, through geo.near() and the API.
+#
+#   $ python benchmarks/nearby.py --venues 1m
+#   $ python benchmarks/nearby.py --venues 1m --database postgresql://localhost:5432/fyyur_bench
+#
+# The database is emptied and seeded first, unless --reuse is given. Without --database, a SQLite file
+# in the temporary directory is used.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# number of venues of the usual scales
+scales = {'10k': 10000, '100k': 100000, '1m': 1000000}
+
+
+def seed_venues(count, seed, batch_size):
+    from synthetic import Places, reset, venue_rows, zipf, insert
+    from enums import Genre
+    from models import db, Venue
+    rng = random.Random(seed)
+    reset()
+    places = Places(rng, seed=seed)
+    genres, weights = zipf(rng, [genre.value for genre in Genre], 0.8)
+    for offset in range(0, count, batch_size):
+        # rows are made a batch at a time, their genres aren't searched
+        venues, venue_genres = venue_rows(rng, min(batch_size, count - offset), places, genres, weights,
+                                          datetime.utcnow(), first=offset + 1)
+        insert(Venue.__table__, venues, batch_size)
+    if db.engine.dialect.name in ('postgresql', 'sqlite'):
+        db.session.execute('ANALYZE')
+        db.session.commit()
+
+
+def points(rng, count, dense):
+    # points near random venues, or anywhere between the coasts of the contiguous states
+    from models import db, Venue
+    if not dense:
+        return [(rng.uniform(25, 49), rng.uniform(-124, -67)) for number in range(count)]
+    last = db.session.query(Venue.id).order_by(Venue.id.desc()).limit(1).scalar()
+    located = []
+    while len(located) < count:
+        row = db.session.query(Venue.latitude, Venue.longitude).filter(Venue.id == rng.randint(1, last)).first()
+        if row and row.latitude is not None:
+            located.append((row.latitude + rng.gauss(0, 0.01), row.longitude + rng.gauss(0, 0.01)))
+    return located
+
+
+def timed(function, arguments):
+    durations = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(*argument)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return durations[len(durations) // 2], durations[min(len(durations) - 1, int(len(durations) * 0.95))], durations[-1]
+
+
+def main(args):
+    count = scales.get(args.venues.lower()) or int(args.venues)
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.gettempdir(), f'fyyur-nearby-{count}.sqlite')
+    os.environ.update(FYYUR_ENV='test', DATABASE_URL=database, PAGE_CACHE_BACKEND='', METRICS_ENDPOINT='0')
+    from app import create_app
+    import geo
+    from models import db
+    app = create_app()
+    app.logger.disabled = True
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    with app.app_context():
+        if not args.reuse:
+            started = time.perf_counter()
+            seed_venues(count, args.seed, app.config['IMPORT_BATCH_SIZE'])
+            print(f'seeded {count} venues in {time.perf_counter() - started:.1f}s', flush=True)
+        dense, sparse = points(rng, args.repeat, True), points(rng, args.repeat, False)
+        radius = app.config['NEARBY_MAX_RADIUS_KM']
+        cases = [
+            ('nearest 10, cities', lambda latitude, longitude: geo.near(latitude, longitude, 10, radius), dense),
+            ('nearest 50, cities', lambda latitude, longitude: geo.near(latitude, longitude, 50, radius), dense),
+            ('nearest 10, anywhere', lambda latitude, longitude: geo.near(latitude, longitude, 10, radius), sparse),
+            ('within 5 km, cities', lambda latitude, longitude: geo.near(latitude, longitude, 50, 5), dense),
+            ('within 25 km, anywhere', lambda latitude, longitude: geo.near(latitude, longitude, 50, 25), sparse),
+            ('API nearest 50, cities', lambda latitude, longitude: client.get(
+                f'/api/v1/venues/near?lat={latitude}&lng={longitude}&limit=50').get_data(), dense),
+        ]
+        print(f'{count} venues on {db.engine.dialect.name}, {args.repeat} points a case')
+        for name, function, arguments in cases:
+            # the first point warms the caches of the database
+            function(*arguments[0])
+            median, p95, slowest = timed(function, arguments)
+            print(f'{name:24} p50 {median:8.2f} ms  p95 {p95:8.2f} ms  max {slowest:8.2f} ms', flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', default='100k', help='number of venues, or one of 10k, 100k and 1m')
+    parser.add_argument('--database', help='SQLAlchemy URL of the database, it is emptied')
+    parser.add_argument('--reuse', action='store_true', help='keep the venues of an earlier run of the same scale')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=200, help='points of every case')
+    main(parser.parse_args())
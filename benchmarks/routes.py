@@ -0,0 +1,173 @@
+# Benchmark of the pages of the app through the Flask test client, on a synthetic database (see synthetic.py).
+# For every route it records the latency of its first request (cold: templates, baked queries and the
+# database's caches not warm yet), the median and 95th percentile of the following ones (warm), the number
+# of SQL statements, the size of the page and the peak of the memory allocated while rendering it.
+# Results are saved as JSON, under the commit they were measured on, and compared with the results of another run:
+#
+#   $ python benchmarks/routes.py --shows 100k
+#   $ python benchmarks/routes.py --shows 100k --compare benchmarks/results/<commit>-sqlite-100000.json
+#   $ python benchmarks/routes.py --shows 100k --database postgresql://localhost:5432/fyyur_bench
+#
+# The page cache is off, so every request renders its page. The database is emptied and seeded first,
+# unless --reuse is given. Without --database, a SQLite file in the temporary directory is used.
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+
+def routes(app, db):
+    # (name, method, path, form) of the pages, detail pages of the venue and artist with the most shows
+    from models import Venue, Artist, Show
+    from sqlalchemy import func
+    with app.app_context():
+        venue_id = db.session.query(Show.venue_id).group_by(Show.venue_id).order_by(
+            func.count().desc()).limit(1).scalar() or 1
+        artist_id = db.session.query(Show.artist_id).group_by(Show.artist_id).order_by(
+            func.count().desc()).limit(1).scalar() or 1
+        name, city, state, latitude, longitude = db.session.query(
+            Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude).filter(
+            Venue.id == venue_id).first() or ('blue', 'Springfield', 'CA', 37.2, -119.4)
+        word = name.split()[0].lower()
+        genre = db.session.query(Artist.search_text).filter(Artist.id == artist_id).scalar().split()[-1]
+    return [
+        ('home', 'GET', '/', None),
+        ('venues', 'GET', '/venues', None),
+        ('area_venues', 'GET', f'/venues/areas/{state}/{city}', None),
+        ('artists', 'GET', '/artists', None),
+        ('shows', 'GET', '/shows', None),
+        ('venue', 'GET', f'/venues/{venue_id}', None),
+        ('artist', 'GET', f'/artists/{artist_id}', None),
+        ('venues_near', 'GET', f'/venues/near?lat={latitude:.4f}&lng={longitude:.4f}', None),
+        ('venue_search', 'POST', '/venues/search', {'search_term': word}),
+        ('artist_search', 'GET', f'/artists/search?search_term={word[:3]}', None),
+        ('api_typeahead', 'GET', f'/api/v1/typeahead?q={word[:3]}', None),
+        ('calendar', 'GET', '/calendar', None),
+        ('venue_calendar', 'GET', f'/venues/{venue_id}/calendar', None),
+        ('genres', 'GET', '/genres', None),
+        ('genre_artists', 'GET', f'/genres/{genre}/artists', None),
+        ('artist_matches', 'GET', f'/artists/{artist_id}/matches', None),
+        ('api_venue_matches', 'GET', f'/api/v1/venues/{venue_id}/matches', None),
+        ('edit_venue', 'GET', f'/venues/{venue_id}/edit', None),
+        ('create_show', 'GET', '/shows/create', None),
+        ('api_venues', 'GET', '/api/v1/venues', None),
+        ('api_shows', 'GET', f'/api/v1/shows?venue_id={venue_id}', None),
+    ]
+
+
+def request(client, method, path, form):
+    start = time.perf_counter()
+    response = client.open(path, method=method, data=form)
+    body = response.get_data()
+    return time.perf_counter() - start, response, body
+
+
+def measure(client, route, repeat):
+    name, method, path, form = route
+    cold, response, body = request(client, method, path, form)
+    warm = sorted(request(client, method, path, form)[0] for number in range(repeat))
+    # memory is traced on a request of its own, tracing slows the timed ones down
+    tracemalloc.start()
+    request(client, method, path, form)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'method': method,
+        'path': path,
+        'status': response.status_code,
+        'cold_ms': round(cold * 1000, 3),
+        'warm_p50_ms': round(warm[len(warm) // 2] * 1000, 3),
+        'warm_p95_ms': round(warm[min(len(warm) - 1, int(len(warm) * 0.95))] * 1000, 3),
+        'queries': int(response.headers.get('X-Query-Count', -1)),
+        'bytes': len(body),
+        'peak_kib': round(peak / 1024, 1)
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, previous, threshold):
+    # warm medians of both runs, routes slower by more than the threshold are flagged
+    print(f'\ncompared with {previous["commit"]} ({previous["date"]})')
+    for name, route in results['routes'].items():
+        before = previous['routes'].get(name)
+        if before is None:
+            continue
+        ratio = route['warm_p50_ms'] / before['warm_p50_ms'] if before['warm_p50_ms'] else 1
+        flag = '  slower' if ratio > 1 + threshold else '  faster' if ratio < 1 - threshold else ''
+        print(f'{name:16} {before["warm_p50_ms"]:9.2f} -> {route["warm_p50_ms"]:9.2f} ms  {ratio:5.2f}x  '
+              f'{before["queries"]:4} -> {route["queries"]:4} queries{flag}')
+
+
+def main(args):
+    from synthetic import scales, seed
+    shows = scales.get(args.shows.lower()) or int(args.shows)
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.gettempdir(), f'fyyur-bench-{shows}.sqlite')
+    # the test profile has no CSRF checks, the page cache is off and every response counts its statements
+    os.environ.update(FYYUR_ENV='test', DATABASE_URL=database, PAGE_CACHE_BACKEND='', QUERY_COUNT_HEADER='1',
+                      METRICS_ENDPOINT='0')
+    from app import create_app
+    app = create_app()
+    from models import db
+    app.logger.disabled = True
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if not args.reuse:
+            started = time.perf_counter()
+            counts = seed(shows, args.seed, app.config['IMPORT_BATCH_SIZE'])
+            print('seeded {} venues, {} artists and {} shows in {:.1f}s'.format(
+                *counts, time.perf_counter() - started), flush=True)
+    client = app.test_client()
+    results = {
+        'commit': commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'database': dialect,
+        'shows': shows,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'python': platform.python_version(),
+        'routes': {}
+    }
+    for route in routes(app, db):
+        result = results['routes'][route[0]] = measure(client, route, args.repeat)
+        print(f'{route[0]:16} {result["status"]}  cold {result["cold_ms"]:9.2f} ms  warm {result["warm_p50_ms"]:9.2f} ms '
+              f'(p95 {result["warm_p95_ms"]:9.2f})  {result["queries"]:4} queries  {result["bytes"]:8} bytes  '
+              f'{result["peak_kib"]:9.1f} KiB peak', flush=True)
+    output = args.output or os.path.join(root, 'benchmarks', 'results', f'{results["commit"]}-{dialect}-{shows}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'results saved to {output}')
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file), args.threshold)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shows', default='1k', help='number of shows, or one of 1k, 100k and 1m')
+    parser.add_argument('--database', help='SQLAlchemy URL of the database, it is emptied')
+    parser.add_argument('--reuse', action='store_true', help='keep the data of an earlier run of the same scale')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=20, help='warm requests of every route')
+    parser.add_argument('--output', help='JSON file of the results')
+    parser.add_argument('--compare', help='JSON file of earlier results')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change of a warm median reported as slower or faster')
+    main(parser.parse_args())
@@ -0,0 +1,222 @@
+# Synthetic data of the benchmarks: venues, artists and shows at a given scale, with skewed distributions
+# like a real site's, where a few states, cities, genres, venues and artists account for most of the rows.
+# States and genres are the values of enums.State and enums.Genre, cities are made up names in every state.
+# Cities lie around the centroids of their states, and venues around the centers of their cities.
+# Shows fall on the days their artists are available, mostly in the evening and on weekends, over two years
+# around the current date. The same scale and seed always make the same rows.
+#
+#   $ DATABASE_URL=sqlite:////tmp/fyyur-bench.sqlite python benchmarks/synthetic.py 100000
+#
+# The database is emptied first.
+
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from enums import State, Genre  # noqa: E402
+from models import db, Venue, Artist, VenueGenre, ArtistGenre, allWeek, search_text_of  # noqa: E402
+from importers import insert_shows  # noqa: E402
+from booking import Slot  # noqa: E402
+import areas  # noqa: E402
+import geo  # noqa: E402
+import matchmaking  # noqa: E402
+
+# number of shows of the usual scales
+scales = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+cityPrefixes = ('Spring', 'River', 'Lake', 'Oak', 'Cedar', 'Maple', 'Fair', 'Green', 'Mill', 'Pine', 'Clear', 'Stone')
+citySuffixes = ('field', 'ville', 'port', ' Falls', ' Heights', 'ton', 'wood', 'burg')
+venueWords = ('Blue', 'Velvet', 'Iron', 'Golden', 'Electric', 'Silver', 'Crimson', 'Broken', 'Lucky', 'Hidden',
+              'Rusty', 'Neon', 'Copper', 'Wild', 'Midnight', 'Painted')
+venueKinds = ('Room', 'Hall', 'Lounge', 'Tavern', 'Theatre', 'Club', 'Garden', 'Stage', 'Cellar', 'Ballroom')
+artistWords = ('Moon', 'Wolves', 'Echo', 'River', 'Static', 'Ghost', 'Harbor', 'Saints', 'Atlas', 'Fever',
+               'Signal', 'Tides', 'Lanterns', 'Comets', 'Prophets', 'Sparrows', 'Cinders', 'Arrows')
+streets = ('Main', 'Market', 'Church', 'Elm', 'Park', 'High', 'Water', 'Union', 'Broad', 'Center')
+
+# weekdays of shows are picked with these weights, most shows are on Friday and Saturday nights
+dayWeights = (5, 5, 7, 10, 25, 30, 18)
+hours = (18, 19, 20, 20, 21, 21, 21, 22, 23)
+
+
+def zipf(rng, values, exponent=1.0):
+    # the values in a random order of popularity, with their cumulative Zipf weights, for rng.choices
+    values = list(values)
+    rng.shuffle(values)
+    return values, list(accumulate(1 / rank ** exponent for rank in range(1, len(values) + 1)))
+
+
+def counts(shows):
+    # number of (venues, artists) of a number of shows
+    return max(10, shows // 50), max(20, shows // 25)
+
+
+class Places(object):
+    """
+    States and their cities, a few states and a few cities of each hold most of the venues and artists.
+    """
+
+    def __init__(self, rng, cities_per_state=6, seed=1):
+        self.rng = rng
+        self.states, self.state_weights = zipf(rng, [state.value for state in State], 1.2)
+        names = [prefix + suffix for prefix in cityPrefixes for suffix in citySuffixes]
+        self.cities = {state: zipf(rng, rng.sample(names, cities_per_state), 1.5) for state in self.states}
+        self.centers = {}
+        # centers and points come from generators of their own, locating venues doesn't change the other values
+        self.spread = random.Random(f'locations {seed}')
+
+    def pick(self):
+        state = self.rng.choices(self.states, cum_weights=self.state_weights)[0]
+        cities, weights = self.cities[state]
+        return self.rng.choices(cities, cum_weights=weights)[0], state
+
+    def locate(self, city, state):
+        # a point of the city, most of its venues are within 15 km of its center
+        if (city, state) not in self.centers:
+            latitude, longitude = geo.geocoder().geocode('', '', state)
+            place = random.Random(f'{city}, {state}')
+            self.centers[city, state] = (latitude + place.uniform(-1.5, 1.5), longitude + place.uniform(-1.5, 1.5))
+        latitude, longitude = self.centers[city, state]
+        return latitude + self.spread.gauss(0, 0.07), longitude + self.spread.gauss(0, 0.09)
+
+
+def pick_genres(rng, genres, weights):
+    # one to three distinct genres
+    return sorted(set(rng.choices(genres, cum_weights=weights, k=rng.choice((1, 1, 2, 2, 3)))))
+
+
+def availability(rng):
+    # half the artists play any day, most others on weekends and a day or two more
+    kind = rng.random()
+    if kind < 0.5:
+        return allWeek
+    if kind < 0.85:
+        return 0b1110000 | sum(1 << day for day in rng.sample(range(4), rng.randint(0, 2)))
+    return sum(1 << day for day in rng.sample(range(7), rng.randint(1, 6)))
+
+
+def venue_rows(rng, count, places, genres, weights, now, first=1):
+    venues, venue_genres = [], []
+    for id in range(first, first + count):
+        city, state = places.pick()
+        name = f'{rng.choice(venueWords)} {rng.choice(venueKinds)} {id}'
+        row_genres = pick_genres(rng, genres, weights)
+        latitude, longitude = places.locate(city, state)
+        venues.append({
+            'id': id, 'name': name, 'city': city, 'state': state,
+            'address': f'{rng.randint(1, 999)} {rng.choice(streets)} Street',
+            'phone': '%03d-%03d-%04d' % (rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+            'image_link': None, 'facebook_link': None, 'website': None,
+            'seeking_talent': rng.random() < 0.3, 'seeking_description': None,
+            'search_text': search_text_of(name, city, state, row_genres), 'updated_at': now,
+            'latitude': latitude, 'longitude': longitude, 'geohash': geo.encode(latitude, longitude)
+        })
+        venue_genres.extend({'genre': genre, 'venue_id': id} for genre in row_genres)
+    return venues, venue_genres
+
+
+def artist_rows(rng, count, places, genres, weights, now, first=1):
+    artists, artist_genres = [], []
+    for id in range(first, first + count):
+        city, state = places.pick()
+        name = f'The {rng.choice(artistWords)} {rng.choice(artistWords)} {id}'
+        row_genres = pick_genres(rng, genres, weights)
+        artists.append({
+            'id': id, 'name': name, 'city': city, 'state': state,
+            'phone': '%03d-%03d-%04d' % (rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+            'image_link': None, 'facebook_link': None, 'website': None,
+            'seeking_venue': rng.random() < 0.4, 'seeking_description': None,
+            'availability_mask': availability(rng),
+            'search_text': search_text_of(name, city, state, row_genres), 'updated_at': now
+        })
+        artist_genres.extend({'genre': genre, 'artist_id': id} for genre in row_genres)
+    return artists, artist_genres
+
+
+def show_slots(rng, count, venue_count, artists, start):
+    # shows of popular venues and artists, on days their artists are available
+    venue_ids, venue_weights = zipf(rng, range(1, venue_count + 1), 0.9)
+    artist_ids, artist_weights = zipf(rng, range(1, len(artists) + 1), 0.9)
+    masks = [0] + [artist['availability_mask'] for artist in artists]
+    for number in range(count):
+        artist_id = rng.choices(artist_ids, cum_weights=artist_weights)[0]
+        mask = masks[artist_id]
+        day = start + timedelta(days=rng.randrange(730))
+        # the nearest available day, from the weekday picked with the weights of the week
+        weekday = rng.choices(range(7), weights=dayWeights)[0]
+        while not mask & (1 << weekday):
+            weekday = (weekday + 1) % 7
+        day += timedelta(days=(weekday - day.weekday()) % 7)
+        yield Slot(artist_id, rng.choices(venue_ids, cum_weights=venue_weights)[0],
+                   day.replace(hour=rng.choice(hours), minute=rng.choice((0, 30))))
+
+
+def reset():
+    # empty schema, the FTS5 tables of SQLite aren't part of the metadata and are dropped by name
+    db.drop_all()
+    if db.engine.dialect.name == 'sqlite':
+        for model in (Venue, Artist):
+            db.session.execute(f'DROP TABLE IF EXISTS {model.__tablename__}_search')
+        db.session.commit()
+    db.create_all()
+
+
+def insert(table, rows, batch_size):
+    for offset in range(0, len(rows), batch_size):
+        db.session.execute(table.insert(), rows[offset:offset + batch_size])
+        db.session.commit()
+
+
+def seed(shows, seed=1, batch_size=5000):
+    """
+    Empties the database of the app context, and fills it with the given number of shows,
+    and the venues and artists of counts(). Returns the (venues, artists, shows) numbers.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    reset()
+    places = Places(rng, seed=seed)
+    genres, weights = zipf(rng, [genre.value for genre in Genre], 0.8)
+    venue_count, artist_count = counts(shows)
+    venues, venue_genres = venue_rows(rng, venue_count, places, genres, weights, now)
+    artists, artist_genres = artist_rows(rng, artist_count, places, genres, weights, now)
+    insert(Venue.__table__, venues, batch_size)
+    insert(VenueGenre.__table__, venue_genres, batch_size)
+    insert(Artist.__table__, artists, batch_size)
+    insert(ArtistGenre.__table__, artist_genres, batch_size)
+    start = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=365)
+    slots = show_slots(rng, shows, venue_count, artists, start)
+    for offset in range(0, shows, batch_size):
+        insert_shows([next(slots) for number in range(min(batch_size, shows - offset))])
+        db.session.commit()
+    # venues were inserted without the ORM, the areas of the ones without shows too
+    areas.rebuild()
+    db.session.commit()
+    matchmaking.refresh(everything=True)
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        # rows were inserted with their ids, the sequences continue after them
+        for table in ('venues', 'artists', 'shows'):
+            db.session.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                               f'(SELECT coalesce(max(id), 1) FROM {table}))')
+        db.session.execute('ANALYZE')
+        db.session.commit()
+    elif db.engine.dialect.name == 'sqlite':
+        db.session.execute('ANALYZE')
+        db.session.commit()
+    return venue_count, artist_count, shows
+
+
+if __name__ == '__main__':
+    from app import create_app
+    app = create_app()
+    shows = sys.argv[1] if len(sys.argv) > 1 else '1k'
+    shows = scales.get(shows.lower()) or int(shows)
+    with app.app_context():
+        started = time.perf_counter()
+        venues, artists, shows = seed(shows, batch_size=app.config['IMPORT_BATCH_SIZE'])
+        print(f'{venues} venues, {artists} artists and {shows} shows in {time.perf_counter() - started:.1f}s')
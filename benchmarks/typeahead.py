@@ -0,0 +1,137 @@
+# Benchmark of the typeahead of typeahead.py, on a database of synthetic artists and venues only (see synthetic.py),
+# half of the names each. Times building the index from the database and its size in memory, the suggestions
+# of the first letters of the words of names, through typeahead.suggest() and the API, and the suggestions
+# once artists were renamed since the index was built.
+#
+#   $ python benchmarks/typeahead.py --names 1m
+#   $ python benchmarks/typeahead.py --names 1m --database postgresql://localhost:5432/fyyur_bench
+#
+# The database is emptied and seeded first, unless --reuse is given. Without --database, a SQLite file
+# in the temporary directory is used.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# number of names of the usual scales
+scales = {'10k': 10000, '100k': 100000, '1m': 1000000}
+
+
+def seed_names(count, seed, batch_size):
+    from synthetic import Places, reset, venue_rows, artist_rows, zipf, insert
+    from enums import Genre
+    from models import db, Venue, Artist
+    import areas
+    rng = random.Random(seed)
+    reset()
+    places = Places(rng, seed=seed)
+    genres, weights = zipf(rng, [genre.value for genre in Genre], 0.8)
+    for model, rows, total in ((Venue, venue_rows, count // 2), (Artist, artist_rows, count - count // 2)):
+        for offset in range(0, total, batch_size):
+            # rows are made a batch at a time, their genres aren't suggested
+            batch = rows(rng, min(batch_size, total - offset), places, genres, weights, datetime.utcnow(),
+                         first=offset + 1)[0]
+            insert(model.__table__, batch, batch_size)
+    areas.rebuild()
+    db.session.commit()
+
+
+def prefixes(rng, count):
+    # the first one to eight letters of a word of random names
+    from models import db, Venue, Artist
+    from typeahead import normalize
+    found = []
+    for model in (Venue, Artist):
+        last = db.session.query(model.id).order_by(model.id.desc()).limit(1).scalar() or 0
+        while last and len(found) < count * (1 if model is Venue else 2) // 2:
+            name = db.session.query(model.name).filter(model.id == rng.randint(1, last)).scalar()
+            if name:
+                words = normalize(name).split(' ')
+                found.append(' '.join(words[rng.randrange(len(words)):])[:rng.randint(1, 8)])
+    return found
+
+
+def timed(function, arguments):
+    durations = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return durations[len(durations) // 2], durations[min(len(durations) - 1, int(len(durations) * 0.95))], durations[-1]
+
+
+def main(args):
+    count = scales.get(args.names.lower()) or int(args.names)
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.gettempdir(), f'fyyur-typeahead-{count}.sqlite')
+    os.environ.update(FYYUR_ENV='test', DATABASE_URL=database, PAGE_CACHE_BACKEND='', METRICS_ENDPOINT='0',
+                      TYPEAHEAD_SYNC_SECONDS='3600')
+    from app import create_app
+    import typeahead
+    from models import db, Artist
+    app = create_app()
+    app.logger.disabled = True
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    with app.app_context():
+        if not args.reuse:
+            started = time.perf_counter()
+            seed_names(count, args.seed, app.config['IMPORT_BATCH_SIZE'])
+            print(f'seeded {count} names in {time.perf_counter() - started:.1f}s', flush=True)
+        index = typeahead.typeahead()
+        started = time.perf_counter()
+        index.build()
+        duration = time.perf_counter() - started
+        # the size of a second index, while the first one is still held
+        tracemalloc.start()
+        other = typeahead.Typeahead()
+        other.build()
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del other
+        names = sum(len(index.indexes[kind].ids) for kind in ('artists', 'venues'))
+        keys = sum(len(index.indexes[kind].key_starts) for kind in ('artists', 'venues'))
+        print(f'{names} names and {keys} words on {db.engine.dialect.name}: built in {duration:.1f}s, '
+              f'{size / 2 ** 20:.1f} MB, {peak / 2 ** 20:.1f} MB at the peak of the build', flush=True)
+        terms = prefixes(rng, args.repeat)
+        with app.test_request_context():
+            cases = [
+                ('suggest, 10', lambda term: typeahead.suggest(term)),
+                ('suggest artists, 50', lambda term: typeahead.suggest(term, ['artists'], 50)),
+            ]
+            for name, function in cases:
+                function(terms[0])
+                median, p95, slowest = timed(function, terms)
+                print(f'{name:24} p50 {median:8.3f} ms  p95 {p95:8.3f} ms  max {slowest:8.3f} ms', flush=True)
+            # renamed artists are put in the overlay of the index
+            ids = [row[0] for row in db.session.query(Artist.id).limit(args.writes)]
+            median, p95, slowest = timed(lambda id: typeahead.written(
+                'artists', id, f'Renamed {id}', 'Springfield', 'IL'), ids)
+            print(f'{f"{len(ids)} renames":24} p50 {median:8.3f} ms  p95 {p95:8.3f} ms  max {slowest:8.3f} ms')
+            median, p95, slowest = timed(lambda term: typeahead.suggest(term), terms + ['renamed'] * 10)
+            print(f'{"suggest after renames":24} p50 {median:8.3f} ms  p95 {p95:8.3f} ms  max {slowest:8.3f} ms')
+
+        def api(term):
+            return client.get('/api/v1/typeahead', query_string={'q': term}).get_data()
+        api(terms[0])
+        median, p95, slowest = timed(api, terms)
+        print(f'{"API, 10":24} p50 {median:8.3f} ms  p95 {p95:8.3f} ms  max {slowest:8.3f} ms', flush=True)
+        db.session.rollback()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--names', default='100k', help='number of artists and venues, or one of 10k, 100k and 1m')
+    parser.add_argument('--database', help='SQLAlchemy URL of the database, it is emptied')
+    parser.add_argument('--reuse', action='store_true', help='keep the names of an earlier run of the same scale')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1000, help='prefixes of every case')
+    parser.add_argument('--writes', type=int, default=10000, help='artists renamed')
+    main(parser.parse_args())
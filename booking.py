@@ -0,0 +1,149 @@
+# This file contains the booking conflict checks of new shows.
+# A show can't be in the past, can't be on a day its artist already plays a show,
+# and can't be on a weekday its artist isn't available on.
+
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from sqlalchemy import MetaData, Table, Column, Integer, DateTime, and_, or_, select, text
+from models import db, Artist, Venue, Show, weekDays
+
+Slot = namedtuple('Slot', ['artist_id', 'venue_id', 'start_time'])
+
+# batches of up to this many (artist, day) pairs are checked with an OR of range predicates
+windowsPerQuery = 50
+
+# (artist, day) pairs of a large batch, in a temporary table of the checking connection.
+# it has its own metadata, so it's never created by create_all or migrations
+bookingWindows = Table('booking_windows', MetaData(),
+                       Column('artist_id', Integer),
+                       Column('day_start', DateTime),
+                       Column('day_end', DateTime))
+
+
+class Verdict(object):
+    """
+    The result of checking one proposed show.
+
+    :param slot:
+        the checked (artist_id, venue_id, start_time) slot.
+    """
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.past = False
+        self.booked = False
+        self.unavailable = False
+        self.unknown_artist = False
+        self.unknown_venue = False
+        self.artist_name = None
+
+    @property
+    def weekday(self):
+        return weekDays[self.slot.start_time.weekday()]
+
+    @property
+    def ok(self):
+        return not (self.past or self.booked or self.unavailable or self.unknown_artist or self.unknown_venue)
+
+    @property
+    def errors(self):
+        errors = []
+        if self.unknown_artist:
+            errors.append(f'There is no artist with id {self.slot.artist_id}.')
+        if self.unknown_venue:
+            errors.append(f'There is no venue with id {self.slot.venue_id}.')
+        if self.past:
+            errors.append('The date you specified is in the past.')
+        if self.booked:
+            errors.append(
+                f'{self.artist_name} is already booked on the specified date')
+        if self.unavailable:
+            errors.append(
+                f'{self.artist_name} is not available on {self.weekday}s.')
+        return errors
+
+
+def day_range(start_time):
+    day = datetime.combine(start_time.date(), time.min)
+    return day, day + timedelta(days=1)
+
+
+def booking_rows(windows):
+    """
+    Returns (id, name, availability_mask, start_time) rows of the artists of the given
+    (artist_id, (day start, day end)) windows, outer joined with their shows inside the windows.
+
+    Every window is one range scan of the shows (artist_id, start_time) index. A few windows are
+    an OR of range predicates in a single query. Large batches are written to a temporary table first
+    and joined against the index, so the query stays the same size whatever the batch size.
+    """
+    columns = [Artist.id, Artist.name,
+               Artist.availability_mask, Show.start_time]
+    if len(windows) <= windowsPerQuery:
+        return db.session.query(*columns).outerjoin(Show, and_(Show.artist_id == Artist.id, or_(*[
+            and_(Show.artist_id == artist_id,
+                 Show.start_time >= start, Show.start_time < end)
+            for artist_id, (start, end) in windows]))).filter(
+            Artist.id.in_(set(artist_id for artist_id, window in windows))).all()
+    db.session.execute(text(
+        'CREATE TEMPORARY TABLE IF NOT EXISTS booking_windows (artist_id INTEGER, day_start TIMESTAMP, day_end TIMESTAMP)'))
+    db.session.execute(bookingWindows.insert(), [
+        {'artist_id': artist_id, 'day_start': start, 'day_end': end} for artist_id, (start, end) in windows])
+    artist_ids = select([bookingWindows.c.artist_id]).distinct()
+    rows = db.session.query(*columns).outerjoin(bookingWindows, bookingWindows.c.artist_id == Artist.id).outerjoin(
+        Show, and_(Show.artist_id == bookingWindows.c.artist_id,
+                   Show.start_time >= bookingWindows.c.day_start, Show.start_time < bookingWindows.c.day_end)
+    ).filter(Artist.id.in_(artist_ids)).all()
+    db.session.execute(bookingWindows.delete())
+    return rows
+
+
+def check_slots(slots, now=None):
+    """
+    Checks a batch of proposed shows, returning a verdict per slot, in order.
+
+    Artists, their availability and their shows on the proposed days come back together in one query,
+    see booking_rows(). Venues are checked with one more query, if any slot has one.
+    Slots of the batch also conflict with each other, the first one of a day wins.
+    """
+    now = now or datetime.now()
+    slots = [slot if isinstance(slot, Slot) else Slot(*slot) for slot in slots]
+    verdicts = [Verdict(slot) for slot in slots]
+    windows = set()
+    for verdict in verdicts:
+        if verdict.slot.start_time <= now:
+            verdict.past = True
+            continue
+        windows.add((verdict.slot.artist_id, day_range(verdict.slot.start_time)))
+    artists = {}
+    booked = set()
+    for row in (booking_rows(sorted(windows)) if windows else []):
+        artists[row.id] = row
+        if row.start_time is not None:
+            booked.add((row.id, row.start_time.date()))
+    venue_ids = set(verdict.slot.venue_id for verdict in verdicts
+                    if verdict.slot.venue_id is not None and not verdict.past)
+    venues = set(row.id for row in db.session.query(Venue.id).filter(
+        Venue.id.in_(venue_ids))) if venue_ids else set()
+    for verdict in verdicts:
+        if verdict.past:
+            continue
+        slot = verdict.slot
+        artist = artists.get(slot.artist_id)
+        if slot.venue_id is not None and slot.venue_id not in venues:
+            verdict.unknown_venue = True
+        if artist is None:
+            verdict.unknown_artist = True
+            continue
+        verdict.artist_name = artist.name
+        if (slot.artist_id, slot.start_time.date()) in booked:
+            verdict.booked = True
+        if not artist.availability_mask & (1 << slot.start_time.weekday()):
+            verdict.unavailable = True
+        if verdict.ok:
+            booked.add((slot.artist_id, slot.start_time.date()))
+    return verdicts
+
+
+def check_slot(artist_id, venue_id, start_time, now=None):
+    return check_slots([Slot(artist_id, venue_id, start_time)], now)[0]
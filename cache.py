@@ -0,0 +1,209 @@
+# This file contains the cache of rendered listing and detail pages, and the conditional request handling of them.
+# Every cached page is stored under the generations of its tags, like 'venues' or 'venue:5'.
+# Invalidating a tag bumps its generation, so all the pages rendered with it (whatever their
+# cursor or arguments) stop being served right away, and age out of the backend later.
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session, g, make_response, abort
+from flask_wtf.csrf import generate_csrf
+from werkzeug.http import is_resource_modified
+from replicas import primary
+
+# stands for the CSRF token of the request in stored pages, swapped for the token of the serving request
+csrfPlaceholder = '__page_cache_csrf_token__'
+
+# generation of all the pages, bumped to clear the whole cache
+allPages = '*'
+
+
+class LRUCache(object):
+    """
+    In process backend, bounded in number of pages and time to live.
+
+    :param max_entries:
+        number of pages kept, the least recently used page is dropped first.
+    :param ttl:
+        seconds a page is kept.
+    """
+
+    def __init__(self, max_entries=500, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.pages = OrderedDict()
+        # generations are not bounded by the LRU, an evicted generation would serve stale pages again
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.pages.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.pages[key]
+                return None
+            self.pages.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.pages[key] = (time.monotonic() + self.ttl, value)
+            self.pages.move_to_end(key)
+            while len(self.pages) > self.max_entries:
+                self.pages.popitem(last=False)
+
+    def get_generations(self, tags):
+        return [self.generations.get(tag, 0) for tag in tags]
+
+    def incr_generations(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.generations[tag] = self.generations.get(tag, 0) + 1
+
+
+class RedisCache(object):
+    """
+    Backend shared by every process using the same redis server. Needs the redis package.
+
+    Pages expire after ttl seconds, generations never expire: run the server with a volatile-* maxmemory-policy,
+    so only pages are evicted under memory pressure.
+    """
+
+    def __init__(self, url, ttl=300, prefix='fyyur:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value.encode('utf-8'), ex=self.ttl)
+
+    def get_generations(self, tags):
+        return [int(value or 0) for value in self.client.mget(['{}generation:{}'.format(self.prefix, tag) for tag in tags])]
+
+    def incr_generations(self, tags):
+        pipeline = self.client.pipeline()
+        for tag in tags:
+            pipeline.incr('{}generation:{}'.format(self.prefix, tag))
+        pipeline.execute()
+
+
+class PageCache(object):
+    """
+    Caches the responses of GET views under their path, query string and tags.
+
+    The backend is picked by the PAGE_CACHE_BACKEND setting: 'memory', a redis:// URL,
+    any object with the methods of LRUCache, or None to disable caching.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('PAGE_CACHE_BACKEND')
+        ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        if backend == 'memory':
+            backend = LRUCache(app.config.get('PAGE_CACHE_SIZE', 500), ttl)
+        elif isinstance(backend, str) and backend.startswith(('redis://', 'rediss://', 'unix://')):
+            backend = RedisCache(backend, ttl)
+        self.backend = backend
+
+    def cached(self, *tags):
+        """
+        Decorates a view with its cache tags, formatted with the view arguments, like 'venue:{venue_id}'.
+        """
+        def decorator(view):
+            @wraps(view)
+            def cached_view(**kwargs):
+                # pages shown with flashed messages are rendered for this user only, they're neither served nor stored
+                if self.backend is None or request.method != 'GET' or '_flashes' in session:
+                    return view(**kwargs)
+                page_tags = [allPages] + [tag.format(**kwargs) for tag in tags]
+                key = 'page:{}:{}'.format(request.full_path, '.'.join(
+                    str(generation) for generation in self.backend.get_generations(page_tags)))
+                # behind conditional(), the page's version is part of the key too, it also moves with time
+                if g.get('page_version') is not None:
+                    key += ':' + page_etag(g.page_version, per_session=False)
+                body = self.backend.get(key)
+                if body is not None:
+                    response = make_response(
+                        body.replace(csrfPlaceholder, generate_csrf()))
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+                # stored pages are rendered from the primary: a lagging replica would store a page from before
+                # the write that bumped its generations, and serve it until it expires
+                with primary():
+                    response = make_response(view(**kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    body = response.get_data(as_text=True)
+                    token = g.get('csrf_token')
+                    if token:
+                        body = body.replace(token, csrfPlaceholder)
+                    self.backend.set(key, body)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return cached_view
+        return decorator
+
+    def invalidate(self, *tags):
+        if self.backend is not None and tags:
+            self.backend.incr_generations(set(tags))
+
+    def clear(self):
+        self.invalidate(allPages)
+
+
+def page_etag(version, per_session=True):
+    # pages hold a CSRF token, so the tag also changes with the session's token, and before the token expires
+    if per_session:
+        time_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+        token_age = int(time.time() // (time_limit / 2)) if time_limit else 0
+        version = (version, session.get('csrf_token'), token_age)
+    key = repr(version)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def conditional(version):
+    """
+    Answers conditional GETs of a view with 304 Not Modified from the version of its page, before running the view.
+
+    :param version:
+        called with the view arguments, returns a tuple of UTC datetimes that changes with the page,
+        the latest of them is the page's Last-Modified. None if there's no such page, answered with 404 Not Found.
+    """
+    def decorator(view):
+        @wraps(view)
+        def conditional_view(**kwargs):
+            # a page shown with flashed messages is not the page the validators stand for
+            if request.method != 'GET' or '_flashes' in session:
+                return view(**kwargs)
+            page_version = version(**kwargs)
+            if page_version is None:
+                abort(404)
+            g.page_version = page_version
+            dates = [date for date in page_version if date is not None]
+            last_modified = max(dates) if dates else None
+            if not is_resource_modified(request.environ, etag=page_etag(page_version), last_modified=last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            # the tag is computed again, rendering the page may have started the session's CSRF token
+            response.set_etag(page_etag(page_version))
+            response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return conditional_view
+    return decorator
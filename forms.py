@@ -1,10 +1,9 @@
 from datetime import datetime
-from sqlalchemy import cast, Date
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField, SubmitField
 from wtforms.validators import ValidationError, DataRequired, Length, AnyOf, URL, InputRequired, optional
 from enums import State, Genre
-from models import Show, Artist
+from booking import check_slot
 
 
 class ValidateValues(object):
@@ -60,24 +59,24 @@ class Available:
             raise ValidationError(
                 field.gettext("Invalid field name '%s'.") % self.fieldname
             )
-        if field.data < datetime.now():
+        # past, booked and unavailable dates are checked together, in a single query
+        verdict = check_slot(id.data, None, field.data)
+        if verdict.past:
             message = self.past_message
             if message is None:
                 message = 'The date you specified is in the past.'
             raise ValidationError(message)
-        show = Show.query.filter(
-            Show.artist_id == id.data).filter(cast(Show.start_time, Date) == field.data.date()).first()
-        if show:
+        if verdict.unknown_artist:
+            raise ValidationError(verdict.errors[0])
+        if verdict.booked:
             message = self.booked_message
             if message is None:
-                message = f'{show.artist.name} is already booked on the specified date'
+                message = f'{verdict.artist_name} is already booked on the specified date'
             raise ValidationError(message)
-        artist = Artist.query.get(id.data)
-        date, str = artist.availableOn(field.data)
-        if not date:
+        if verdict.unavailable:
             message = self.unavailable_message
             if message is None:
-                message = f'{artist.name} is not available on {str}s.'
+                message = f'{verdict.artist_name} is not available on {verdict.weekday}s.'
             raise ValidationError(message)
 
 
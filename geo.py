@@ -0,0 +1,399 @@
+# This file contains the locations of venues and the "venues near me" search.
+# Venues are located by a geocoder picked by the GEOCODER setting, by default CentroidGeocoder: an offline lookup
+# of the centroids of cities and states in data/centroids.csv, so locating a venue never calls a network service.
+# Nearby searches read the venues of the geohash cells around a point, nearest cells first, and rank them by
+# great circle distance. On PostgreSQL a cell is read from a GiST index of the venues' points,
+# on other databases from a b-tree of their geohashes, where every cell is one range of the index.
+
+import csv
+import heapq
+import math
+from flask import current_app
+from sqlalchemy import DDL, Float, and_, bindparam, event, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import PASSIVE_NO_INITIALIZE, get_history
+from werkzeug.utils import import_string
+from models import db, Venue
+
+earthRadiusKm = 6371.0088
+
+# digits of geohashes, in the order of their cells
+geohashAlphabet = '0123456789bcdefghjkmnpqrstuvwxyz'
+geohashPrecision = 9
+
+# cells covering the circle of a search at first, at most
+maxCells = 16
+
+# venues read from a cell at once. cells holding more are read as their 32 cells of the next precision,
+# or in pages of cellRows venues ordered by id at the finest precision
+cellRows = 64
+
+
+def distance(latitude, longitude, other_latitude, other_longitude):
+    # great circle distance in km, by the haversine formula
+    phi, other_phi = math.radians(latitude), math.radians(other_latitude)
+    sine_phi = math.sin((other_phi - phi) / 2)
+    sine_lambda = math.sin(math.radians(other_longitude - longitude) / 2)
+    return 2 * earthRadiusKm * math.asin(min(1.0, math.sqrt(
+        sine_phi * sine_phi + math.cos(phi) * math.cos(other_phi) * sine_lambda * sine_lambda)))
+
+
+def encode(latitude, longitude, precision=geohashPrecision):
+    # geohash of a point: bits of the longitude and the latitude interleaved, longitude first, 5 bits a digit
+    south, north, west, east = -90.0, 90.0, -180.0, 180.0
+    digits, bits, value, even = [], 0, 0, True
+    while len(digits) < precision:
+        if even:
+            middle = (west + east) / 2
+            bit = longitude >= middle
+            west, east = (middle, east) if bit else (west, middle)
+        else:
+            middle = (south + north) / 2
+            bit = latitude >= middle
+            south, north = (middle, north) if bit else (south, middle)
+        value, bits, even = value * 2 + bit, bits + 1, not even
+        if bits == 5:
+            digits.append(geohashAlphabet[value])
+            bits, value = 0, 0
+    return ''.join(digits)
+
+
+def cell_size(precision):
+    # (height, width) in degrees of the geohash cells of a precision
+    latitude_bits = 5 * precision // 2
+    return 180 / 2 ** latitude_bits, 360 / 2 ** (5 * precision - latitude_bits)
+
+
+def bounding_boxes(latitude, longitude, radius):
+    """
+    Returns the (south, west, north, east) boxes holding the circle of the given radius in km around a point,
+    one box, or two split at the antimeridian.
+    """
+    angle = radius / earthRadiusKm
+    south = max(-90.0, latitude - math.degrees(angle))
+    north = min(90.0, latitude + math.degrees(angle))
+    # circles around a pole, or as wide as the earth, hold every longitude
+    if south == -90.0 or north == 90.0 or math.sin(angle) >= math.cos(math.radians(latitude)):
+        return [(south, -180.0, north, 180.0)]
+    span = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(latitude))))
+    west, east = longitude - span, longitude + span
+    if west < -180:
+        return [(south, west + 360, north, 180.0), (south, -180.0, north, east)]
+    if east > 180:
+        return [(south, west, north, 180.0), (south, -180.0, north, east - 360)]
+    return [(south, west, north, east)]
+
+
+def cells(south, west, north, east):
+    """
+    Returns the geohashes of the cells covering a box, of the finest precision covering it with maxCells cells at most.
+    """
+    for precision in range(geohashPrecision, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(int((south + 90) // height), int((min(north, 89.999999) + 90) // height) + 1)
+        columns = range(int((west + 180) // width), int((min(east, 179.999999) + 180) // width) + 1)
+        if len(rows) * len(columns) <= maxCells or precision == 1:
+            return [encode((row + 0.5) * height - 90, (column + 0.5) * width - 180, precision)
+                    for row in rows for column in columns]
+
+
+def cell_box(geohash):
+    # (south, west, north, east) of a geohash cell
+    south, north, west, east = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for digit in geohash:
+        value = geohashAlphabet.index(digit)
+        for shift in range(4, -1, -1):
+            bit = value >> shift & 1
+            if even:
+                middle = (west + east) / 2
+                west, east = (middle, east) if bit else (west, middle)
+            else:
+                middle = (south + north) / 2
+                south, north = (middle, north) if bit else (south, middle)
+            even = not even
+    return south, west, north, east
+
+
+def child_grid(longitude_first):
+    # (rows, columns, (row, column) of every digit) of the 32 cells of a cell, by whether their bits start
+    # with a longitude bit: cells of even precisions are split in 4 rows and 8 columns, the others in 8 and 4
+    rows, columns, positions = 1, 1, []
+    for value in range(32):
+        row, column, longitude = 0, 0, longitude_first
+        for shift in range(4, -1, -1):
+            if longitude:
+                column = column * 2 + (value >> shift & 1)
+            else:
+                row = row * 2 + (value >> shift & 1)
+            longitude = not longitude
+        positions.append((row, column))
+    rows, columns = max(row for row, column in positions) + 1, max(column for row, column in positions) + 1
+    return rows, columns, positions
+
+
+childGrids = {True: child_grid(True), False: child_grid(False)}
+
+
+def children(geohash, box):
+    # (geohash, box) of the 32 cells of a cell
+    south, west, north, east = box
+    rows, columns, positions = childGrids[len(geohash) % 2 == 0]
+    height, width = (north - south) / rows, (east - west) / columns
+    return [(geohash + digit, (south + row * height, west + column * width,
+                               south + (row + 1) * height, west + (column + 1) * width))
+            for digit, (row, column) in zip(geohashAlphabet, positions)]
+
+
+def cell_distance(latitude, longitude, box):
+    """
+    Returns the distance in km from a point to the nearest point of a (south, west, north, east) box.
+    """
+    south, west, north, east = box
+    if west <= longitude <= east:
+        return earthRadiusKm * math.radians(max(0.0, south - latitude, latitude - north))
+    # the nearest meridian of the box, at the latitude of the foot of the point's perpendicular to it,
+    # or at the end of the meridian nearest to the foot. haversine distances grow with the difference of longitudes
+    edge = min((west, east), key=lambda meridian: abs((longitude - meridian + 180) % 360 - 180))
+    difference = math.radians(abs((longitude - edge + 180) % 360 - 180))
+    if difference >= math.pi / 2:
+        foot = 90.0 if latitude >= 0 else -90.0
+    else:
+        foot = math.degrees(math.atan(math.tan(math.radians(latitude)) / math.cos(difference)))
+    return distance(latitude, longitude, min(north, max(south, foot)), edge)
+
+
+# the GiST index of PostgreSQL, also used when tables are created with create_all. queries compare the same expression
+postgresIndex = 'CREATE INDEX ix_venues_location ON venues USING gist (point(longitude, latitude))'
+
+event.listen(Venue.__table__, 'after_create',
+             DDL(postgresIndex).execute_if(dialect='postgresql'))
+
+
+class GeohashIndex(object):
+    """
+    Venues of a geohash cell, one range of the (geohash, latitude, longitude) index.
+    """
+
+    def criterion(self):
+        return and_(Venue.geohash >= bindparam('first'), Venue.geohash < bindparam('last'))
+
+    def params(self, geohash, box):
+        # '{' follows every geohash digit
+        return {'first': geohash, 'last': geohash + '{'}
+
+
+class PostgresIndex(object):
+    """
+    Venues of the box of a geohash cell, from the GiST index of the venues' (longitude, latitude) points.
+    Venues on the edge of two boxes are in both.
+    """
+
+    def criterion(self):
+        return func.point(Venue.longitude, Venue.latitude).op('<@')(func.box(
+            func.point(bindparam('west', type_=Float), bindparam('south', type_=Float)),
+            func.point(bindparam('east', type_=Float), bindparam('north', type_=Float))))
+
+    def params(self, geohash, box):
+        return dict(zip(('south', 'west', 'north', 'east'), box))
+
+
+backends = {
+    'postgresql': PostgresIndex
+}
+
+
+# compiled statements reading a cell, by dialect
+cellStatements = {}
+
+
+def nearest(latitude, longitude, limit, radius):
+    """
+    Returns the (distance, id) of the given number of venues nearest to a point, within a radius in km,
+    nearest first.
+
+    Cells are read nearest first, from the few cells covering the circle: a cell holding more than cellRows venues
+    is replaced by its cells of the next precision, and the search ends when the next cell is farther than the
+    farthest of the nearest venues found. A search reads a few hundred venues of the cells around the point,
+    in a city center or in the countryside. Venues piled up on one point, like the ones of a city located at its
+    centroid, fill a cell of the finest precision, which is read whole, cellRows venues at a time.
+    """
+    # the cells of a search are read by two statements, compiled once, on the connection of the session:
+    # the first cellRows + 1 venues of a cell, and the next page of a cell that can't be split, after an id
+    connection = db.session.connection(mapper=Venue.__mapper__)
+    index = backends.get(connection.dialect.name, GeohashIndex)()
+    statements = cellStatements.get(connection.dialect.name)
+    if statements is None:
+        columns = select([Venue.id, Venue.latitude, Venue.longitude]).where(index.criterion())
+        statements = cellStatements[connection.dialect.name] = (
+            columns.limit(cellRows + 1).compile(dialect=connection.dialect),
+            columns.where(Venue.id > bindparam('after')).order_by(Venue.id).limit(cellRows).compile(
+                dialect=connection.dialect))
+    statement, page_statement = statements
+    boxes = {geohash: cell_box(geohash) for box in bounding_boxes(latitude, longitude, radius)
+             for geohash in cells(*box)}
+    queue = [(cell_distance(latitude, longitude, box), geohash, box) for geohash, box in boxes.items()]
+    heapq.heapify(queue)
+    # the nearest venues found, farthest first
+    found, seen = [], set()
+    while queue:
+        bound, geohash, box = heapq.heappop(queue)
+        if bound > radius or len(found) == limit and bound > -found[0][0]:
+            break
+        rows = connection.execute(statement, index.params(geohash, box)).fetchall()
+        if len(rows) > cellRows and len(geohash) < geohashPrecision:
+            farthest = min(radius, -found[0][0]) if len(found) == limit else radius
+            for child, child_box in children(geohash, box):
+                bound = cell_distance(latitude, longitude, child_box)
+                if bound <= farthest:
+                    heapq.heappush(queue, (bound, child, child_box))
+            continue
+        if len(rows) > cellRows:
+            rows, after = [], 0
+            while True:
+                page = connection.execute(page_statement, dict(index.params(geohash, box), after=after)).fetchall()
+                rows.extend(page)
+                if len(page) < cellRows:
+                    break
+                after = page[-1][0]
+        for id, venue_latitude, venue_longitude in rows:
+            kilometers = distance(latitude, longitude, venue_latitude, venue_longitude)
+            if kilometers > radius or id in seen:
+                continue
+            seen.add(id)
+            if len(found) < limit:
+                heapq.heappush(found, (-kilometers, id))
+            elif kilometers < -found[0][0]:
+                heapq.heapreplace(found, (-kilometers, id))
+    return sorted((-negative, id) for negative, id in found)
+
+
+def near(latitude, longitude, limit, radius, columns=None):
+    """
+    Returns the (row, distance in km) of the venues nearest to a point, see nearest(), nearest first. Rows are
+    projections of the given columns, the id first, by default the id, name, city, state, address and upcoming shows.
+    """
+    found = nearest(latitude, longitude, limit, radius)
+    if not found:
+        return []
+    columns = columns or (Venue.id, Venue.name, Venue.city, Venue.state, Venue.address,
+                          Venue.upcoming_shows_count)
+    rows = {row.id: row for row in db.session.query(*columns).filter(Venue.id.in_([id for kilometers, id in found]))}
+    return [(rows[id], kilometers) for kilometers, id in found if id in rows]
+
+
+def parse_near(args):
+    """
+    Returns the (latitude, longitude, limit, radius) of the query string of a nearby search, or None if it has
+    no point: ?lat= and ?lng=, or the ?city= and ?state= to search around. ?radius= in km and ?limit= are capped by
+    NEARBY_MAX_RADIUS_KM and NEARBY_MAX_RESULTS. Raises ValueError for invalid values.
+    """
+    config = current_app.config
+    if args.get('lat') or args.get('lng'):
+        try:
+            latitude, longitude = float(args.get('lat', '')), float(args.get('lng', ''))
+        except ValueError:
+            raise ValueError('The latitude and longitude must be numbers.')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError('The latitude must be between -90 and 90, the longitude between -180 and 180.')
+    elif args.get('city') or args.get('state'):
+        city, state = args.get('city', ''), args.get('state', '')
+        location = geocoder().geocode('', city, state)
+        if location is None:
+            raise ValueError(f'{", ".join(name for name in (city, state) if name)} could not be located.')
+        latitude, longitude = location
+    else:
+        return None
+    try:
+        radius = float(args.get('radius') or config['NEARBY_MAX_RADIUS_KM'])
+        limit = int(args.get('limit') or config['PAGE_SIZE'])
+    except ValueError:
+        raise ValueError('The radius and limit must be numbers.')
+    if not radius > 0 or limit < 1:
+        raise ValueError('The radius and limit must be positive.')
+    return latitude, longitude, min(limit, config['NEARBY_MAX_RESULTS']), min(radius, config['NEARBY_MAX_RADIUS_KM'])
+
+
+class CentroidGeocoder(object):
+    """
+    Locates addresses at the centroid of their city, or of their state when the city isn't listed, from a CSV table
+    of state, city, latitude and longitude rows. Rows of states have an empty city.
+
+    Geocoders are made with the app's settings, the table is the GEOCODER_CENTROIDS file.
+    """
+
+    def __init__(self, config):
+        self.places = {}
+        with open(config['GEOCODER_CENTROIDS'], newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                self.places[self.key(row['state'], row['city'])] = (
+                    float(row['latitude']), float(row['longitude']))
+
+    @staticmethod
+    def key(state, city):
+        return (state or '').strip().upper(), ' '.join((city or '').split()).casefold()
+
+    def geocode(self, address, city, state):
+        # (latitude, longitude) of an address, or None when neither its city nor its state is known
+        return self.places.get(self.key(state, city)) or self.places.get(self.key(state, ''))
+
+
+def init_app(app):
+    app.extensions['geocoder'] = import_string(app.config['GEOCODER'])(app.config)
+
+
+def geocoder():
+    return current_app.extensions['geocoder']
+
+
+def location_of(address, city, state):
+    # latitude, longitude and geohash column values of an address
+    location = geocoder().geocode(address, city, state)
+    if location is None:
+        return {'latitude': None, 'longitude': None, 'geohash': None}
+    return {'latitude': location[0], 'longitude': location[1], 'geohash': encode(*location)}
+
+
+def locate_venues(everything=False, batch_size=1000):
+    """
+    Geocodes the venues without a location, or every venue, in batches of ids, each in its own transaction.
+    Returns the number of located venues.
+    """
+    table = Venue.__table__
+    update = table.update().where(table.c.id == bindparam('_id')).values(
+        latitude=bindparam('latitude'), longitude=bindparam('longitude'), geohash=bindparam('geohash'))
+    located, last = 0, 0
+    while True:
+        query = db.session.query(Venue.id, Venue.address, Venue.city, Venue.state).filter(Venue.id > last)
+        if not everything:
+            query = query.filter(Venue.latitude.is_(None))
+        rows = query.order_by(Venue.id).limit(batch_size).all()
+        if not rows:
+            return located
+        values = [dict(location_of(row.address, row.city, row.state), _id=row.id) for row in rows]
+        values = [value for value in values if value['latitude'] is not None]
+        if values:
+            db.session.execute(update, values)
+        db.session.commit()
+        located += len(values)
+        last = rows[-1].id
+
+
+# venues are located when they're created or moved, unless their location was set with their address,
+# and their geohash follows their location. attributes that weren't loaded didn't change, they aren't loaded
+@event.listens_for(Session, 'before_flush')
+def update_locations(session, flush_context, instances):
+    for target in list(session.new) + list(session.dirty):
+        if not isinstance(target, Venue):
+            continue
+        moved = any(get_history(target, name, PASSIVE_NO_INITIALIZE).has_changes()
+                    for name in ('address', 'city', 'state'))
+        placed = any(get_history(target, name, PASSIVE_NO_INITIALIZE).has_changes()
+                     for name in ('latitude', 'longitude'))
+        if not (moved or placed):
+            continue
+        if not placed:
+            target.latitude, target.longitude = geocoder().geocode(
+                target.address, target.city, target.state) or (None, None)
+        target.geohash = encode(target.latitude, target.longitude) \
+            if target.latitude is not None and target.longitude is not None else None
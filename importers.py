@@ -0,0 +1,316 @@
+# This file contains bulk imports of shows, venues and artists from CSV or JSON lines files.
+# Files are streamed in batches: every batch of shows is validated with one pass of the booking checks,
+# and its valid rows are inserted with COPY on PostgreSQL, or a batched executemany insert elsewhere.
+# Venues and artists are validated with the rules of their forms, and upserted by name, city and state.
+
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import bindparam, select
+from werkzeug.datastructures import MultiDict
+from wtforms import BooleanField, SelectMultipleField
+from booking import Slot, check_slots
+from forms import VenueForm, ArtistForm
+from models import db, Show, Venue, Artist, VenueGenre, ArtistGenre, weekDays, search_text_of, touch
+from stats import shows_changed
+import areas
+import geo
+
+showColumns = ('artist_id', 'venue_id', 'start_time')
+
+# (model, genre model, form) of every kind of upserted record
+catalogues = {
+    'venues': (Venue, VenueGenre, VenueForm),
+    'artists': (Artist, ArtistGenre, ArtistForm)
+}
+
+# (other model, own show key, other show key) of venues and artists, whose pages show each other
+counterparts = {
+    Venue: (Artist, Show.venue_id, Show.artist_id),
+    Artist: (Venue, Show.artist_id, Show.venue_id)
+}
+
+# number of names matched by one query
+keysPerQuery = 1000
+
+# values of boolean columns read as unchecked boxes
+falseValues = ('', '0', 'false', 'no', 'n', 'off')
+
+
+class ImportReport(object):
+    """
+    Counts and per row errors of an import.
+
+    :param errors:
+        list of (line number, list of messages) of the rejected rows.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0
+
+    def summary(self):
+        updated = f'{self.updated} updated, ' if self.updated else ''
+        return (f'{self.rows} rows read, {self.inserted} inserted, {updated}{len(self.errors)} rejected '
+                f'in {self.elapsed:.2f}s ({self.rate:.0f} rows/s)')
+
+
+def file_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+# yields (line number, row dictionary) of a text stream, without reading it all in memory
+def read_rows(stream, format='csv'):
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError:
+                    yield number, None
+
+
+# yields lists of at most batch_size (line number, row dictionary), counting them in the report
+def read_batches(stream, format, batch_size, report):
+    rows = read_rows(stream, format)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        report.rows += len(batch)
+        yield batch
+
+
+def parse_show(row):
+    if not isinstance(row, dict):
+        raise ValueError('The line is not a JSON object.')
+    try:
+        artist_id = int(row['artist_id'])
+        venue_id = int(row['venue_id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('artist_id and venue_id must be integers.')
+    try:
+        start_time = datetime.fromisoformat(str(row['start_time']).strip())
+    except (KeyError, ValueError):
+        raise ValueError('start_time must be a date and time like 2030-05-21 21:30:00.')
+    return Slot(artist_id, venue_id, start_time)
+
+
+def insert_shows(slots):
+    if not slots:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        # COPY through the session's own connection, so the rows are part of the batch's transaction
+        data = io.StringIO()
+        writer = csv.writer(data)
+        for slot in slots:
+            writer.writerow(
+                [slot.artist_id, slot.venue_id, slot.start_time.isoformat(sep=' ')])
+        data.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert(
+            f'COPY shows ({", ".join(showColumns)}) FROM STDIN WITH (FORMAT csv)', data)
+    else:
+        # one statement executed for every row by the driver's executemany
+        db.session.execute(Show.__table__.insert(), [
+                           slot._asdict() for slot in slots])
+        # PostgreSQL's triggers update the show statistics of COPY inserts, here they're recomputed
+        shows_changed((slot.venue_id for slot in slots), (slot.artist_id for slot in slots))
+
+
+def import_shows(stream, format='csv', batch_size=5000, report=None):
+    """
+    Imports shows from a text stream of CSV (with an artist_id,venue_id,start_time header) or JSON lines.
+
+    Each batch is validated against existing artists, venues, bookings and availability,
+    and committed in its own transaction. Rejected rows don't stop the import, they're listed in the report.
+    """
+    report = report or ImportReport()
+    now = datetime.now()
+    for batch in read_batches(stream, format, batch_size, report):
+        lines, slots = [], []
+        for number, row in batch:
+            try:
+                slots.append(parse_show(row))
+                lines.append(number)
+            except ValueError as error:
+                report.errors.append((number, [str(error)]))
+        valid = []
+        for number, verdict in zip(lines, check_slots(slots, now)):
+            if verdict.ok:
+                valid.append((number, verdict.slot))
+            else:
+                report.errors.append((number, verdict.errors))
+        try:
+            insert_shows([slot for number, slot in valid])
+            # new shows change the pages of their venues and artists
+            if valid:
+                touch(Venue, Venue.id.in_(
+                    set(slot.venue_id for number, slot in valid)))
+                touch(Artist, Artist.id.in_(
+                    set(slot.artist_id for number, slot in valid)))
+            db.session.commit()
+            report.inserted += len(valid)
+        except Exception as error:
+            db.session.rollback()
+            report.errors.extend((number, [f'The batch could not be inserted: {error}'])
+                                 for number, slot in valid)
+    report.errors.sort(key=lambda error: error[0])
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def form_data(form, row):
+    """
+    Returns a row as the form data a browser would post for it.
+    Missing columns take the defaults of their fields, multiple choices can be a list or comma separated.
+    """
+    data = MultiDict()
+    for name, field in form._fields.items():
+        value = row.get(name)
+        if value is None:
+            value = field.default
+        if value is None:
+            continue
+        if isinstance(field, SelectMultipleField):
+            values = value if isinstance(value, list) else str(value).split(',')
+            data.setlist(name, [str(value).strip()
+                                for value in values if str(value).strip()])
+        elif isinstance(field, BooleanField):
+            data[name] = 'false' if str(value).strip().lower() in falseValues else 'y'
+        else:
+            data[name] = str(value)
+    return data
+
+
+def parse_record(form, table, row):
+    if not isinstance(row, dict):
+        raise ValueError('The line is not a JSON object.')
+    form.process(form_data(form, row))
+    if not form.validate():
+        raise ValueError(' '.join(f'{form[name].label.text}: {message}'
+                                  for name, messages in form.errors.items() for message in messages))
+    values = {name: value for name, value in form.data.items()
+              if name in table.c and name != 'id'}
+    if 'availability_mask' in table.c:
+        values['availability_mask'] = sum(1 << bit for bit, day in enumerate(weekDays)
+                                          if form.data.get(day, True))
+    if 'geohash' in table.c:
+        values.update(geo.location_of(values['address'], values['city'], values['state']))
+    genres = list(dict.fromkeys(form.genres.data))
+    values['search_text'] = search_text_of(
+        values['name'], values['city'], values['state'], genres)
+    return values, genres
+
+
+def match_records(table, keys):
+    # ids of the records with the given (name, city, state) keys, the oldest record of a key wins.
+    # names are looked up on the leading column of the (name, city, state) index, with a single expanding parameter
+    ids = {}
+    keys = set(keys)
+    names = sorted(set(name for name, city, state in keys))
+    query = select([table.c.id, table.c.name, table.c.city, table.c.state]).where(
+        table.c.name.in_(bindparam('names', expanding=True))).order_by(table.c.id.desc())
+    for start in range(0, len(names), keysPerQuery):
+        for row in db.session.execute(query, {'names': names[start:start + keysPerQuery]}):
+            key = (row.name, row.city, row.state)
+            if key in keys:
+                ids[key] = row.id
+    return ids
+
+
+def upsert_records(model, genre_model, records):
+    """
+    Inserts or updates a batch of (values, genres) records, unique by name, city and state,
+    with executemany statements: one update and one insert of the records, then a delete and an insert of their genres.
+
+    Returns the numbers of inserted and updated records.
+    """
+    table = model.__table__
+    genre_table = genre_model.__table__
+    owner_key = [column for column in genre_table.c if column.foreign_keys][0]
+    ids = match_records(table, records)
+    now = datetime.utcnow()
+    for values, genres in records.values():
+        values['updated_at'] = now
+    updates = [dict(values, _id=ids[key])
+               for key, (values, genres) in records.items() if key in ids]
+    inserts = [values for key, (values, genres) in records.items()
+               if key not in ids]
+    if updates:
+        columns = [name for name in updates[0] if name != '_id']
+        db.session.execute(table.update().where(table.c.id == bindparam('_id')).values(
+            {name: bindparam(name) for name in columns}), updates)
+        other, key, other_key = counterparts[model]
+        for start in range(0, len(updates), keysPerQuery):
+            updated_ids = [values['_id']
+                           for values in updates[start:start + keysPerQuery]]
+            db.session.execute(genre_table.delete().where(
+                owner_key.in_(updated_ids)))
+            # pages of the other side show updated records with their shows
+            touch(other, other.id.in_(select([other_key]).where(
+                key.in_(updated_ids))))
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+        ids.update(match_records(table, [key for key in records if key not in ids]))
+    genre_rows = [{'genre': genre, owner_key.name: ids[key]}
+                  for key, (values, genres) in records.items() for genre in genres]
+    if genre_rows:
+        db.session.execute(genre_table.insert(), genre_rows)
+    if model is Venue:
+        # records are matched by name, city and state, updated venues stay in their areas
+        areas.venues_changed(set((values['state'], values['city']) for values, genres in records.values()))
+    return len(inserts), len(updates)
+
+
+def import_records(kind, stream, format='csv', batch_size=5000, report=None):
+    """
+    Imports venues or artists from a text stream of CSV or JSON lines, with the columns of their forms.
+
+    Rows are validated with the rules of VenueForm or ArtistForm, through a single form processed again for every row.
+    A row with the name, city and state of an existing record updates it, including its genres.
+    Each batch is upserted in its own transaction, rejected rows are listed in the report.
+    """
+    model, genre_model, form_class = catalogues[kind]
+    report = report or ImportReport()
+    form = form_class(formdata=None, meta={'csrf': False})
+    for batch in read_batches(stream, format, batch_size, report):
+        lines, records = [], {}
+        for number, row in batch:
+            try:
+                values, genres = parse_record(form, model.__table__, row)
+            except ValueError as error:
+                report.errors.append((number, [str(error)]))
+                continue
+            # a later row of the same record in the batch wins, the record is inserted or updated once
+            records[(values['name'], values['city'], values['state'])] = (
+                values, genres)
+            lines.append(number)
+        try:
+            inserted, updated = upsert_records(
+                model, genre_model, records) if records else (0, 0)
+            db.session.commit()
+            report.inserted += inserted
+            report.updated += updated
+        except Exception as error:
+            db.session.rollback()
+            report.errors.extend((number, [f'The batch could not be saved: {error}'])
+                                 for number in lines)
+    report.errors.sort(key=lambda error: error[0])
+    report.elapsed = time.perf_counter() - report.started
+    return report
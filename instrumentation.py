@@ -0,0 +1,213 @@
+# This file contains request level instrumentation: the statements, SQL time, render time and response size
+# of every request, kept in Prometheus histograms per endpoint and served on /metrics, the log of slow
+# statements and requests, and the connection pool logging checkouts that waited for a connection.
+
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left
+from flask import g, current_app, has_app_context, has_request_context, request, Response
+from jinja2 import Template
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+# statements listed in the log line of a slow request, the slowest first
+slowStatements = 5
+
+timeBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram(object):
+    """
+    Prometheus histogram of this process, with a series per (endpoint, method) of the requests.
+    """
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # labels -> [observations per bucket..., above the last bucket, sum]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def exposition(self):
+        # the lines of the histogram in the Prometheus text format, buckets are cumulative
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted((labels, list(values)) for labels, values in self.series.items())
+        for (endpoint, method), values in series:
+            labels = 'endpoint="{}",method="{}"'.format(label_value(endpoint), label_value(method))
+            count = 0
+            for bound, observations in zip(self.buckets + ('+Inf',), values):
+                count += observations
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+def label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+requestDuration = Histogram('fyyur_request_duration_seconds', 'Time to handle a request.', timeBuckets)
+requestQueries = Histogram('fyyur_request_queries', 'SQL statements of a request.',
+                           (0, 1, 2, 3, 5, 10, 20, 50, 100, 200))
+requestSqlTime = Histogram('fyyur_request_sql_seconds', 'Time a request spent in SQL statements.', timeBuckets)
+requestRenderTime = Histogram('fyyur_request_render_seconds', 'Time a request spent rendering templates.',
+                              timeBuckets)
+responseSize = Histogram('fyyur_response_size_bytes', 'Size of a response body.',
+                         (1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+histograms = (requestDuration, requestQueries, requestSqlTime, requestRenderTime, responseSize)
+
+
+def app_logger():
+    # the app's logger, error.log outside of debug mode
+    return current_app.logger if has_app_context() else logging.getLogger(__name__)
+
+
+# count and time every statement sent to the database while a request is being handled
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+        g.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def time_query(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or g.get('query_start') is None:
+        return
+    elapsed = time.perf_counter() - g.pop('query_start')
+    g.sql_time = g.get('sql_time', 0) + elapsed
+    # a heap of the slowest statements of the request, for the log line of a slow request
+    slowest = g.setdefault('slowest_statements', [])
+    if len(slowest) < slowStatements:
+        heapq.heappush(slowest, (elapsed, statement))
+    else:
+        heapq.heappushpop(slowest, (elapsed, statement))
+    if elapsed >= current_app.config['SLOW_QUERY_SECONDS']:
+        app_logger().warning('Slow query, %.0f ms in %s %s:\n%s', elapsed * 1000,
+                             request.method, request.path, statement)
+
+
+# returns the number of statements the current request issued so far
+def query_count():
+    return g.get('query_count', 0)
+
+
+class TimedTemplate(Template):
+    """
+    Template adding the time of its renders to the render time of the request.
+    """
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            if has_request_context():
+                g.render_time = g.get('render_time', 0) + time.perf_counter() - start
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool logging the checkouts that waited for a connection, and the moments every connection is in use
+    and free again, with the state of the pool.
+
+    :param wait_warning:
+        seconds of waiting logged as a warning, the wait_warning option of create_engine().
+    """
+
+    def __init__(self, creator, wait_warning=0.1, **kw):
+        super().__init__(creator, **kw)
+        self.wait_warning = wait_warning
+        self.saturated = False
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_warning = self.wait_warning
+        return pool
+
+    def _do_get(self):
+        start = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            app_logger().error('No database connection after waiting %.0f ms. %s',
+                                (time.monotonic() - start) * 1000, self.status())
+            raise
+        waited = time.monotonic() - start
+        if waited >= self.wait_warning:
+            app_logger().warning('Waited %.0f ms for a database connection. %s',
+                                  waited * 1000, self.status())
+        if not self.saturated and self._max_overflow >= 0 and self.checkedout() >= self.size() + self._max_overflow:
+            self.saturated = True
+            app_logger().warning('Every database connection is in use. %s', self.status())
+        return connection
+
+    def _do_return_conn(self, conn):
+        super()._do_return_conn(conn)
+        if self.saturated:
+            self.saturated = False
+            app_logger().info('Database connections are free again. %s', self.status())
+
+
+def start_request():
+    g.request_start = time.perf_counter()
+
+
+def record_request(response):
+    # the metrics of the request, and a log line if it was slow
+    start = g.get('request_start')
+    if start is None:
+        return response
+    duration = time.perf_counter() - start
+    labels = (request.endpoint or 'unmatched', request.method)
+    sql_time = g.get('sql_time', 0)
+    render_time = g.get('render_time', 0)
+    requestDuration.observe(labels, duration)
+    requestQueries.observe(labels, query_count())
+    requestSqlTime.observe(labels, sql_time)
+    requestRenderTime.observe(labels, render_time)
+    # streamed responses have no size before they're sent
+    if response.content_length is not None:
+        responseSize.observe(labels, response.content_length)
+    if duration >= current_app.config['SLOW_REQUEST_SECONDS']:
+        statements = ''.join('\n%.0f ms: %s' % (elapsed * 1000, statement)
+                             for elapsed, statement in sorted(g.get('slowest_statements', []), reverse=True))
+        app_logger().warning('Slow request, %.0f ms for %s %s, %d queries in %.0f ms, rendering %.0f ms, %s bytes.%s',
+                             duration * 1000, request.method, request.full_path.rstrip('?'), query_count(),
+                             sql_time * 1000, render_time * 1000, response.content_length, statements)
+    return response
+
+
+def metrics():
+    lines = [line for histogram in histograms for line in histogram.exposition()]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    # the clock starts before the other hooks, like the CSRF check, which may answer the request
+    app.before_request_funcs.setdefault(None, []).insert(0, start_request)
+    app.after_request(record_request)
+    app.jinja_env.template_class = TimedTemplate
+    if app.config.get('METRICS_ENDPOINT'):
+        app.add_url_rule('/metrics', 'metrics', metrics)
+
+    # report the query count of every response in a header, so N+1 patterns show up in the browser's devtools
+    if app.config.get('QUERY_COUNT_HEADER'):
+        @app.after_request
+        def add_query_count(response):
+            response.headers['X-Query-Count'] = str(query_count())
+            return response
@@ -0,0 +1,398 @@
+# This file contains the matchmaking of the artists seeking venues and the venues seeking talent.
+# Every seeking artist is scored against every seeking venue on the overlap of their genres, being in the same
+# city or state, the artist's weekdays against the days the venue holds its shows, and the genres of the venues
+# the artist played at against the venue's. Profiles are read as arrays, genres and weekdays as 0/1 columns and
+# places as codes, and scored in blocks of NumPy matrix operations.
+# The best matches of every artist and venue are stored in artist_matches and venue_matches, pages read a list
+# with one range of their primary key. refresh() recomputes the lists that the profiles changed since the previous
+# refresh can reach, found by digests of the profiles it scored, it's run periodically by "flask matches refresh".
+# NumPy is imported by refreshes, not by the servers.
+
+from datetime import datetime
+from hashlib import blake2b
+from flask import current_app
+from sqlalchemy import Integer, bindparam, cast, extract, func, select
+from models import db, Venue, Artist, Show, VenueGenre, ArtistGenre, ArtistMatch, VenueMatch, MatchProfile
+from enums import Genre
+
+# weights of the features of a score, scores are between 0 and 1
+weights = {'genres': 0.4, 'place': 0.3, 'days': 0.15, 'history': 0.15}
+
+# scores computed by one block of matrix operations, every intermediate matrix of a block takes 4 bytes a score
+blockScores = 1 << 20
+
+# owners of the lists deleted or looked up by one statement
+idsPerQuery = 500
+
+# column of every genre in the genre matrices
+genreColumns = {genre.value: column for column, genre in enumerate(Genre)}
+
+# (owner key, matched key, matched model, criterion of the matched profiles still seeking) of the two kinds of lists
+listSides = {
+    ArtistMatch: (ArtistMatch.artist_id, ArtistMatch.venue_id, Venue, Venue.seeking_talent == True),
+    VenueMatch: (VenueMatch.venue_id, VenueMatch.artist_id, Artist, Artist.seeking_venue == True)
+}
+listModels = {'artists': ArtistMatch, 'venues': VenueMatch}
+
+
+class Profiles(object):
+    """
+    Seeking artists or venues as arrays, row i of every array is the profile of ids[i]: genres, 0/1 columns of
+    the genres of enums.Genre, states and places, codes of the state and of the city shared by both sides, and traits,
+    columns whose products with the traits of the other side are scores: the weekdays and the genre history of
+    artists, weighted, against the days of the shows and the unit genre vector of venues.
+    digests are 64 bit digests of all of it, the lists of a profile can only change when its digest or the
+    digest of a profile of the other side does.
+    """
+
+    def __init__(self, ids, genres, states, places, traits, keys):
+        import numpy as np
+        self.ids = ids
+        self.genres = genres
+        self.genre_counts = genres.sum(axis=1)
+        self.states = states
+        self.places = places
+        self.traits = traits
+        data = np.ascontiguousarray(np.hstack([genres, traits]), dtype=np.float32)
+        width, raw = data.shape[1] * data.itemsize, data.tobytes()
+        self.digests = np.array([int.from_bytes(blake2b(
+            key.encode() + raw[row * width:(row + 1) * width], digest_size=8).digest(), 'big', signed=True)
+            for row, key in enumerate(keys)], dtype=np.int64)
+
+
+def unit_rows(matrix):
+    import numpy as np
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-9)
+
+
+def genre_matrix(ids, rows):
+    # 0/1 genre columns of the (owner id, genre) rows, in the order of the sorted owner ids
+    import numpy as np
+    matrix = np.zeros((len(ids), len(genreColumns)), dtype=np.float32)
+    if rows:
+        matrix[np.searchsorted(ids, [row[0] for row in rows]), [genreColumns[row[1]] for row in rows]] = 1
+    return matrix
+
+
+def load_profiles(now):
+    """
+    Returns the (artists, venues) Profiles of the seeking artists and venues, with the history of the shows
+    that started by now.
+    """
+    import numpy as np
+    artist_rows = db.session.execute(select([Artist.id, Artist.state, Artist.city, Artist.availability_mask]).where(
+        Artist.seeking_venue == True).order_by(Artist.id)).fetchall()
+    venue_rows = db.session.execute(select([Venue.id, Venue.state, Venue.city]).where(
+        Venue.seeking_talent == True).order_by(Venue.id)).fetchall()
+    artist_ids = np.array([row.id for row in artist_rows], dtype=np.int64)
+    venue_ids = np.array([row.id for row in venue_rows], dtype=np.int64)
+    rows = artist_rows + venue_rows
+    keys = [f'{row.state} {row.city.strip().lower()}' for row in rows]
+    states = np.unique(np.array([row.state for row in rows], dtype=object),
+                       return_inverse=True)[1].astype(np.int32)
+    places = np.unique(np.array(keys, dtype=object), return_inverse=True)[1].astype(np.int32)
+    # genres
+    artist_genres = genre_matrix(artist_ids, db.session.execute(select([ArtistGenre.artist_id, ArtistGenre.genre]).where(
+        ArtistGenre.artist_id == Artist.id).where(Artist.seeking_venue == True)).fetchall())
+    venue_genres = genre_matrix(venue_ids, db.session.execute(select([VenueGenre.venue_id, VenueGenre.genre]).where(
+        VenueGenre.venue_id == Venue.id).where(Venue.seeking_talent == True)).fetchall())
+    # weekdays of artists, bit n of the availability mask is the weekday n of datetime.weekday()
+    masks = np.array([row.availability_mask for row in artist_rows], dtype=np.int64)
+    artist_days = ((masks[:, None] >> np.arange(7)) & 1).astype(np.float32)
+    # share of the shows of venues held on every weekday, venues without shows are open any day.
+    # dow counts from Sunday on both databases
+    weekday = cast(extract('dow', Show.start_time), Integer)
+    days = np.array(db.session.execute(select([Show.venue_id, weekday, func.count()]).where(
+        Show.venue_id == Venue.id).where(Venue.seeking_talent == True).group_by(Show.venue_id, weekday)).fetchall(),
+        dtype=np.int64).reshape(-1, 3)
+    venue_days = np.zeros((len(venue_ids), 7), dtype=np.float32)
+    np.add.at(venue_days, (np.searchsorted(venue_ids, days[:, 0]), (days[:, 1] + 6) % 7), days[:, 2])
+    totals = venue_days.sum(axis=1, keepdims=True)
+    venue_days = np.where(totals > 0, venue_days / np.maximum(totals, 1), np.float32(1 / 7))
+    # genres of the venues of the artists' past shows, a venue of many genres counts in each
+    history = db.session.execute(select([Show.artist_id, VenueGenre.genre, func.count()]).where(
+        Show.artist_id == Artist.id).where(VenueGenre.venue_id == Show.venue_id).where(
+        Artist.seeking_venue == True).where(Show.start_time <= now).group_by(Show.artist_id, VenueGenre.genre)).fetchall()
+    artist_history = np.zeros((len(artist_ids), len(genreColumns)), dtype=np.float32)
+    if history:
+        np.add.at(artist_history, (np.searchsorted(artist_ids, [row[0] for row in history]),
+                                   [genreColumns[row[1]] for row in history]), [row[2] for row in history])
+    split = len(artist_rows)
+    artists = Profiles(artist_ids, artist_genres, states[:split], places[:split], np.hstack([
+        artist_days * weights['days'], unit_rows(artist_history) * weights['history']]).astype(np.float32),
+        keys[:split])
+    venues = Profiles(venue_ids, venue_genres, states[split:], places[split:], np.hstack([
+        venue_days, unit_rows(venue_genres)]).astype(np.float32), keys[split:])
+    return artists, venues
+
+
+def score(artists, venues, rows, columns):
+    """
+    Returns the scores of the given rows of artists against the given columns of venues, as a float32 matrix.
+    """
+    import numpy as np
+    # genre overlap is the Jaccard index of the genre sets, their shared genres over the genres of either.
+    # the matrices of a block are updated in place, a score matrix is allocated once for each step
+    scores = artists.genres[rows] @ venues.genres[columns].T
+    union = np.add.outer(artists.genre_counts[rows], venues.genre_counts[columns])
+    union -= scores
+    np.maximum(union, 1, out=union)
+    np.divide(scores, union, out=scores)
+    scores *= np.float32(weights['genres'])
+    # half the weight of places for the same state, all of it for the same city
+    half = np.float32(weights['place'] / 2)
+    np.add(scores, half, out=scores, where=np.equal.outer(artists.states[rows], venues.states[columns]))
+    np.add(scores, half, out=scores, where=np.equal.outer(artists.places[rows], venues.places[columns]))
+    # days and history
+    scores += artists.traits[rows] @ venues.traits[columns].T
+    return scores
+
+
+def best(scores, ids, count):
+    """
+    Returns the (ids, scores) of the count best columns of every row of a score matrix, best first.
+    ids are the ids of the columns, or of the columns of every row.
+    """
+    import numpy as np
+    count = min(count, scores.shape[1])
+    if count < scores.shape[1]:
+        top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+    else:
+        top = np.broadcast_to(np.arange(count), (len(scores), count))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_ids = ids[top] if ids.ndim == 1 else np.take_along_axis(ids, top, axis=1)
+    return top_ids, np.take_along_axis(top_scores, order, axis=1)
+
+
+def lists(artists, venues, rows, columns, count):
+    """
+    Scores the given rows of artists against the given columns of venues, blockScores scores at a time.
+    Returns the best venues of every row and the best artists of every column, as (ids, scores) pairs of arrays.
+    """
+    import numpy as np
+    width, column_width = min(count, len(columns)), min(count, len(rows))
+    row_ids, row_scores = [np.empty((0, width), np.int64)], [np.empty((0, width), np.float32)]
+    column_ids, column_scores = np.empty((len(columns), 0), np.int64), np.empty((len(columns), 0), np.float32)
+    step = max(1, blockScores // max(1, len(columns)))
+    for start in range(0, len(rows), step):
+        block = rows[start:start + step]
+        scores = score(artists, venues, block, columns)
+        ids, values = best(scores, venues.ids[columns], count)
+        row_ids.append(ids)
+        row_scores.append(values)
+        # the best artists of the block, merged with the ones of the previous blocks
+        if column_scores.shape[1] < column_width:
+            ids, values = best(scores.T, artists.ids[block], count)
+            column_ids, column_scores = best(np.hstack([column_scores, values]), np.hstack([column_ids, ids]), count)
+        elif len(columns):
+            column_ids, column_scores = merge(column_ids, column_scores, scores, artists.ids[block])
+    return (np.vstack(row_ids), np.vstack(row_scores)), (column_ids, column_scores)
+
+
+def merge(column_ids, column_scores, scores, ids):
+    """
+    Merges the scores of a block with the full lists of its columns: only the scores above the lowest of a list
+    can enter it, the lists they enter are sorted again with them, the ones already listed first on ties.
+    """
+    import numpy as np
+    block_rows, block_columns = np.nonzero(scores > column_scores[:, -1])
+    if not len(block_rows):
+        return column_ids, column_scores
+    width = column_scores.shape[1]
+    touched = np.unique(block_columns)
+    owners = np.concatenate([np.repeat(touched, width), block_columns])
+    candidates = np.concatenate([column_ids[touched].ravel(), ids[block_rows]])
+    values = np.concatenate([column_scores[touched].ravel(), scores[block_rows, block_columns]])
+    order = np.lexsort((-values, owners))
+    keep = order[(np.searchsorted(owners[order], touched)[:, None] + np.arange(width)).ravel()]
+    column_ids[touched] = candidates[keep].reshape(-1, width)
+    column_scores[touched] = values[keep].reshape(-1, width)
+    return column_ids, column_scores
+
+
+def first_scores(lists):
+    # best score of every list, lists of nothing score below anything
+    import numpy as np
+    ids, scores = lists
+    return scores[:, 0] if scores.shape[1] else np.full(len(scores), -np.inf, dtype=np.float32)
+
+
+def store(model, owners, lists, everything=False):
+    """
+    Replaces the lists of the given owner ids with the given (ids, scores) lists, row i is the list of owners[i],
+    or every list of the model.
+    """
+    owner, matched, other, seeking = listSides[model]
+    table = model.__table__
+    owners = owners.tolist()
+    if everything:
+        db.session.execute(table.delete())
+    else:
+        delete = table.delete().where(owner.in_(bindparam('owners', expanding=True)))
+        for start in range(0, len(owners), idsPerQuery):
+            db.session.execute(delete, {'owners': owners[start:start + idsPerQuery]})
+    ids, scores = lists
+    owner_name, matched_name = owner.key, matched.key
+    rows = [{owner_name: owner_id, 'rank': rank, matched_name: id, 'score': value}
+            for owner_id, matches, values in zip(owners, ids.tolist(), scores.tolist())
+            for rank, (id, value) in enumerate(zip(matches, values))]
+    if rows:
+        db.session.execute(table.insert(), rows)
+
+
+def drop_stale():
+    # lists of the artists and venues that stopped seeking, or were deleted where foreign keys don't cascade
+    db.session.execute(ArtistMatch.__table__.delete().where(ArtistMatch.artist_id.notin_(
+        select([Artist.id]).where(Artist.seeking_venue == True))))
+    db.session.execute(VenueMatch.__table__.delete().where(VenueMatch.venue_id.notin_(
+        select([Venue.id]).where(Venue.seeking_talent == True))))
+
+
+def list_ends(model, profiles):
+    """
+    Returns the number of matches still seeking in the lists of the given profiles, and their lowest score, as arrays.
+    """
+    import numpy as np
+    owner, matched, other, seeking = listSides[model]
+    rows = np.array(db.session.execute(select([owner, func.count(), func.min(model.score)]).where(
+        matched == other.id).where(seeking).group_by(owner)).fetchall(), dtype=np.float64).reshape(-1, 3)
+    counts = np.zeros(len(profiles.ids), dtype=np.int64)
+    lowest = np.zeros(len(profiles.ids), dtype=np.float32)
+    rows = rows[np.isin(rows[:, 0].astype(np.int64), profiles.ids)]
+    positions = np.searchsorted(profiles.ids, rows[:, 0].astype(np.int64))
+    counts[positions] = rows[:, 1]
+    lowest[positions] = rows[:, 2]
+    return counts, lowest
+
+
+def holders(model, ids):
+    # owners of the lists holding any of the given matched ids
+    owner, matched, other, seeking = listSides[model]
+    query = select([owner]).where(matched.in_(bindparam('ids', expanding=True))).distinct()
+    found = set()
+    for start in range(0, len(ids), idsPerQuery):
+        found.update(row[0] for row in db.session.execute(query, {'ids': ids[start:start + idsPerQuery]}).fetchall())
+    return list(found)
+
+
+def stored_digests(kind):
+    # {id: digest} of the artists or venues the stored lists were scored from
+    return dict(db.session.query(MatchProfile.id, MatchProfile.digest).filter(MatchProfile.kind == kind).all())
+
+
+def changes(profiles, stored):
+    """
+    Returns the positions of the profiles whose digest differs from the stored one, new profiles included,
+    and the ids of the stored profiles that stopped seeking or were deleted.
+    """
+    import numpy as np
+    changed = np.array([stored.get(id) != digest for id, digest in zip(
+        profiles.ids.tolist(), profiles.digests.tolist())], dtype=bool)
+    return np.flatnonzero(changed), list(set(stored).difference(profiles.ids.tolist()))
+
+
+def store_digests(kind, profiles, rows, gone=(), everything=False):
+    # replaces the stored digests of the profiles at the given positions, and deletes the ones of the gone ids,
+    # or replaces every digest of the kind
+    table = MatchProfile.__table__
+    ids, digests = profiles.ids[rows].tolist(), profiles.digests[rows].tolist()
+    if everything:
+        db.session.execute(table.delete().where(MatchProfile.kind == kind))
+    else:
+        delete = table.delete().where(MatchProfile.kind == kind).where(
+            MatchProfile.id.in_(bindparam('ids', expanding=True)))
+        old = ids + list(gone)
+        for start in range(0, len(old), idsPerQuery):
+            db.session.execute(delete, {'ids': old[start:start + idsPerQuery]})
+    if ids:
+        db.session.execute(table.insert(), [{'kind': kind, 'id': id, 'digest': digest}
+                                            for id, digest in zip(ids, digests)])
+
+
+def positions(profiles, ids):
+    import numpy as np
+    return np.flatnonzero(np.isin(profiles.ids, ids))
+
+
+def rebuild(artists, venues, count):
+    # scores every seeking artist against every seeking venue, and replaces every list and digest
+    import numpy as np
+    artist_lists, venue_lists = lists(artists, venues, np.arange(len(artists.ids)), np.arange(len(venues.ids)), count)
+    store(ArtistMatch, artists.ids, artist_lists, everything=True)
+    store(VenueMatch, venues.ids, venue_lists, everything=True)
+    store_digests('artists', artists, slice(None), everything=True)
+    store_digests('venues', venues, slice(None), everything=True)
+    return len(artists.ids), len(venues.ids)
+
+
+def refresh_changes(artists, venues, stored, count):
+    """
+    Recomputes the lists that the profiles changed since they were stored can reach: the lists of the changed
+    artists and venues, the lists holding them, and the lists they now score high enough to enter. Lists missing
+    matches, of new profiles or of matches that stopped seeking, are recomputed too.
+    Returns the numbers of (artists, venues) recomputed, or None when the changes reach more than half of the
+    lists of a side, and scoring everything at once is cheaper.
+    """
+    import numpy as np
+    drop_stale()
+    rows, gone_artists = changes(artists, stored['artists'])
+    columns, gone_venues = changes(venues, stored['venues'])
+    artist_ids = artists.ids[rows].tolist() + gone_artists
+    venue_ids = venues.ids[columns].tolist() + gone_venues
+    changed_rows, changed_columns = rows, columns
+    every_artist, every_venue = np.arange(len(artists.ids)), np.arange(len(venues.ids))
+    artist_counts, artist_lowest = list_ends(ArtistMatch, artists)
+    venue_counts, venue_lowest = list_ends(VenueMatch, venues)
+    # lists of the changed venues, with the best score of every artist against them
+    entering, venue_lists = lists(artists, venues, every_artist, columns, count)
+    rows = np.union1d(rows, np.concatenate([
+        positions(artists, holders(ArtistMatch, venue_ids)),
+        np.flatnonzero(first_scores(entering) > artist_lowest),
+        np.flatnonzero(artist_counts < min(count, len(venues.ids)))])).astype(np.int64)
+    if len(rows) * 2 > len(artists.ids):
+        return None
+    artist_lists, entering = lists(artists, venues, rows, every_venue, count)
+    others = np.setdiff1d(np.concatenate([
+        positions(venues, holders(VenueMatch, artist_ids)),
+        np.flatnonzero(first_scores(entering) > venue_lowest),
+        np.flatnonzero(venue_counts < min(count, len(artists.ids)))]), columns).astype(np.int64)
+    if (len(columns) + len(others)) * 2 > len(venues.ids):
+        return None
+    other_lists = lists(artists, venues, every_artist, others, count)[1]
+    store(ArtistMatch, artists.ids[rows], artist_lists)
+    store(VenueMatch, venues.ids[columns], venue_lists)
+    store(VenueMatch, venues.ids[others], other_lists)
+    store_digests('artists', artists, changed_rows, gone_artists)
+    store_digests('venues', venues, changed_columns, gone_venues)
+    return len(rows), len(columns) + len(others)
+
+
+def refresh(everything=False):
+    """
+    Recomputes the match lists that the profiles changed since the last refresh can reach, or every list on the
+    first refresh and with everything. Returns the numbers of (artists, venues) whose lists were recomputed.
+    """
+    count = current_app.config['MATCHES_PER_PROFILE']
+    artists, venues = load_profiles(datetime.today())
+    stored = {kind: stored_digests(kind) for kind in listModels}
+    refreshed = None
+    if not everything and any(stored.values()):
+        refreshed = refresh_changes(artists, venues, stored, count)
+    if refreshed is None:
+        refreshed = rebuild(artists, venues, count)
+    return refreshed
+
+
+def best_matches(kind, id, columns=None):
+    """
+    Returns the stored best matches of an artist or a venue, kind is 'artists' or 'venues': rows of the given
+    columns of the matched venues or artists, by default their id, name, city and state, and their score, best first.
+    Matches that stopped seeking since the last refresh are left out.
+    """
+    model = listModels[kind]
+    owner, matched, other, seeking = listSides[model]
+    columns = columns or (other.id, other.name, other.city, other.state)
+    return db.session.query(*columns, model.score.label('score')).join(model, matched == other.id).filter(
+        owner == id, seeking).order_by(model.rank).all()
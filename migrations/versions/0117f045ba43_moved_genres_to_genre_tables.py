@@ -0,0 +1,56 @@
+"""Moved comma joined genres of artists and venues to indexed genre tables
+
+Revision ID: 0117f045ba43
+Revises: 3069377137d8
+Create Date: 2026-10-17 11:02:47.519350
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0117f045ba43'
+down_revision = '3069377137d8'
+branch_labels = None
+depends_on = None
+
+# (owner table, genre table, foreign key column)
+tables = (('artists', 'artist_genres', 'artist_id'),
+          ('venues', 'venue_genres', 'venue_id'))
+
+
+def upgrade():
+    bind = op.get_bind()
+    for owner, table, key in tables:
+        genres = op.create_table(table,
+                                 sa.Column('genre', sa.String(length=30), nullable=False),
+                                 sa.Column(key, sa.Integer(), nullable=False),
+                                 sa.ForeignKeyConstraint([key], [owner + '.id'], ondelete='CASCADE'),
+                                 sa.PrimaryKeyConstraint('genre', key)
+                                 )
+        op.create_index(op.f(f'ix_{table}_{key}'), table, [key], unique=False)
+        # genres were stored as ', '.join() of the selected Genre values
+        rows = []
+        for id, joined in bind.execute(sa.text(f'SELECT id, genres FROM {owner}')):
+            for genre in set((joined or '').split(', ')):
+                if genre.strip():
+                    rows.append({'genre': genre.strip(), key: id})
+        if rows:
+            op.bulk_insert(genres, rows)
+        op.drop_column(owner, 'genres')
+
+
+def downgrade():
+    bind = op.get_bind()
+    for owner, table, key in tables:
+        op.add_column(owner, sa.Column('genres', sa.String(length=150),
+                                       server_default='', nullable=False))
+        joined = {}
+        for id, genre in bind.execute(sa.text(f'SELECT {key}, genre FROM {table} ORDER BY {key}, genre')):
+            joined.setdefault(id, []).append(genre)
+        for id, genres in joined.items():
+            bind.execute(sa.text(f'UPDATE {owner} SET genres = :genres WHERE id = :id'),
+                         genres=', '.join(genres), id=id)
+        op.drop_index(op.f(f'ix_{table}_{key}'), table_name=table)
+        op.drop_table(table)
@@ -0,0 +1,25 @@
+"""Added a composite (artist_id, start_time) index to shows for booking checks
+
+Revision ID: 1f790dfb88d7
+Revises: a62348228841
+Create Date: 2026-10-17 12:20:44.118862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f790dfb88d7'
+down_revision = 'a62348228841'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_artist_id_start_time', 'shows',
+                    ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
@@ -0,0 +1,61 @@
+"""Added search text to artists and venues, with full text and trigram indexes
+
+Revision ID: 3069377137d8
+Revises: 3343aeed5b8b
+Create Date: 2026-10-17 10:12:31.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3069377137d8'
+down_revision = '3343aeed5b8b'
+branch_labels = None
+depends_on = None
+
+tables = ('artists', 'venues')
+
+
+def upgrade():
+    for table in tables:
+        op.add_column(table, sa.Column('search_text', sa.String(length=400),
+                                       server_default='', nullable=False))
+        op.execute(f"UPDATE {table} SET search_text = name || ' ' || city || ' ' || state || ' ' || genres")
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in tables:
+            op.execute(f'ALTER TABLE {table} ADD COLUMN search_vector tsvector')
+            op.execute(f'CREATE TRIGGER {table}_search_vector_update BEFORE INSERT OR UPDATE OF search_text ON {table} '
+                       f"FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.simple', search_text)")
+            op.execute(f"UPDATE {table} SET search_vector = to_tsvector('pg_catalog.simple', search_text)")
+            op.execute(f'CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)')
+            op.execute(f'CREATE INDEX ix_{table}_search_text_trgm ON {table} USING gin (search_text gin_trgm_ops)')
+    elif dialect == 'sqlite':
+        for table in tables:
+            op.execute(f"CREATE VIRTUAL TABLE {table}_search USING fts5(search_text, content='{table}', content_rowid='id', prefix='2 3')")
+            op.execute(f'CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN '
+                       f'INSERT INTO {table}_search(rowid, search_text) VALUES (new.id, new.search_text); END')
+            op.execute(f'CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN '
+                       f"INSERT INTO {table}_search({table}_search, rowid, search_text) VALUES ('delete', old.id, old.search_text); END")
+            op.execute(f'CREATE TRIGGER {table}_search_update AFTER UPDATE OF search_text ON {table} BEGIN '
+                       f"INSERT INTO {table}_search({table}_search, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+                       f'INSERT INTO {table}_search(rowid, search_text) VALUES (new.id, new.search_text); END')
+            op.execute(f"INSERT INTO {table}_search({table}_search) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in tables:
+        if dialect == 'postgresql':
+            op.execute(f'DROP INDEX ix_{table}_search_text_trgm')
+            op.execute(f'DROP INDEX ix_{table}_search_vector')
+            op.execute(f'DROP TRIGGER {table}_search_vector_update ON {table}')
+            op.drop_column(table, 'search_vector')
+        elif dialect == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute(f'DROP TRIGGER {table}_search_{trigger}')
+            op.execute(f'DROP TABLE {table}_search')
+        op.drop_column(table, 'search_text')
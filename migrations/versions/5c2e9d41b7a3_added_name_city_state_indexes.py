@@ -0,0 +1,28 @@
+"""Added (name, city, state) indexes to venues and artists for bulk import matching
+
+Revision ID: 5c2e9d41b7a3
+Revises: 1f790dfb88d7
+Create Date: 2026-10-17 13:05:12.402417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e9d41b7a3'
+down_revision = '1f790dfb88d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venues_name_city_state', 'venues',
+                    ['name', 'city', 'state'], unique=False)
+    op.create_index('ix_artists_name_city_state', 'artists',
+                    ['name', 'city', 'state'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artists_name_city_state', table_name='artists')
+    op.drop_index('ix_venues_name_city_state', table_name='venues')
@@ -0,0 +1,25 @@
+"""Added a start_time index to shows for site wide calendars
+
+Revision ID: 8e3f6a2c91d5
+Revises: d4b18c07e2f6
+Create Date: 2026-10-17 14:22:09.518240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3f6a2c91d5'
+down_revision = 'd4b18c07e2f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # shows(venue_id, start_time) and shows(artist_id, start_time) exist since d4b18c07e2f6 and 1f790dfb88d7
+    op.create_index(op.f('ix_shows_start_time'), 'shows', ['start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_shows_start_time'), table_name='shows')
@@ -0,0 +1,40 @@
+"""Merged the weekday columns of artists (added in 3343aeed5b8b) into one availability bitmask
+
+Revision ID: a62348228841
+Revises: 0117f045ba43
+Create Date: 2026-10-17 11:48:05.903127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a62348228841'
+down_revision = '0117f045ba43'
+branch_labels = None
+depends_on = None
+
+# bit n of the mask is the day returned by datetime.weekday() == n
+weekDays = ('monday', 'tuesday', 'wednesday',
+            'thursday', 'friday', 'saturday', 'sunday')
+
+
+def upgrade():
+    op.add_column('artists', sa.Column('availability_mask', sa.SmallInteger(),
+                                       server_default='127', nullable=False))
+    op.execute('UPDATE artists SET availability_mask = ' + ' + '.join(
+        f'(CASE WHEN {day} THEN {1 << bit} ELSE 0 END)' for bit, day in enumerate(weekDays)))
+    for day in weekDays:
+        op.drop_column('artists', day)
+    op.create_index('ix_artists_seeking_venue_availability', 'artists',
+                    ['seeking_venue', 'availability_mask'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artists_seeking_venue_availability', table_name='artists')
+    for bit, day in enumerate(weekDays):
+        op.add_column('artists', sa.Column(day, sa.Boolean(),
+                                           server_default='true', nullable=False))
+        op.execute(f'UPDATE artists SET {day} = (availability_mask & {1 << bit}) != 0')
+    op.drop_column('artists', 'availability_mask')
@@ -0,0 +1,81 @@
+"""Added show statistics to venues and artists, maintained by triggers on PostgreSQL
+
+Revision ID: b7c5d0e3a914
+Revises: 8e3f6a2c91d5
+Create Date: 2026-10-17 23:05:41.318204
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c5d0e3a914'
+down_revision = '8e3f6a2c91d5'
+branch_labels = None
+depends_on = None
+
+# (table, show key) of the tables holding statistics
+tables = (('venues', 'venue_id'), ('artists', 'artist_id'))
+columns = ('upcoming_shows_count', 'past_shows_count', 'next_show_time', 'last_show_time')
+operations = ('insert', 'delete', 'update')
+
+
+def stats(shows):
+    return (f'count(*) FILTER (WHERE start_time > LOCALTIMESTAMP), '
+            f'count(*) FILTER (WHERE start_time <= LOCALTIMESTAMP), '
+            f'min(start_time) FILTER (WHERE start_time > LOCALTIMESTAMP), '
+            f'max(start_time) FILTER (WHERE start_time <= LOCALTIMESTAMP) FROM {shows}')
+
+
+def upgrade():
+    for table, key in tables:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('next_show_time', sa.DateTime(), nullable=True))
+        op.add_column(table, sa.Column('last_show_time', sa.DateTime(), nullable=True))
+        op.create_index(op.f(f'ix_{table}_next_show_time'), table, ['next_show_time'], unique=False)
+        op.get_bind().execute(sa.text(
+            f'UPDATE {table} SET '
+            f'upcoming_shows_count = (SELECT count(*) FROM shows WHERE {key} = {table}.id AND start_time > :now), '
+            f'past_shows_count = (SELECT count(*) FROM shows WHERE {key} = {table}.id AND start_time <= :now), '
+            f'next_show_time = (SELECT min(start_time) FROM shows WHERE {key} = {table}.id AND start_time > :now), '
+            f'last_show_time = (SELECT max(start_time) FROM shows WHERE {key} = {table}.id AND start_time <= :now)'),
+            now=datetime.today())
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, key in tables:
+            recompute = (f'UPDATE {table} SET ({", ".join(columns)}) = '
+                         f'(SELECT {stats("shows")} WHERE {key} = {table}.id) WHERE id IN ')
+            functions = {
+                'insert': f'UPDATE {table} SET upcoming_shows_count = {table}.upcoming_shows_count + added.upcoming, '
+                          f'past_shows_count = {table}.past_shows_count + added.past, '
+                          f'next_show_time = least({table}.next_show_time, added.next_show_time), '
+                          f'last_show_time = greatest({table}.last_show_time, added.last_show_time) '
+                          f'FROM (SELECT {key} AS id, {stats("new_shows")} GROUP BY {key}) '
+                          f'AS added (id, upcoming, past, next_show_time, last_show_time) WHERE {table}.id = added.id',
+                'delete': recompute + f'(SELECT {key} FROM old_shows)',
+                'update': recompute + f'(SELECT {key} FROM old_shows UNION SELECT {key} FROM new_shows)'
+            }
+            transitions = {
+                'insert': 'NEW TABLE AS new_shows',
+                'delete': 'OLD TABLE AS old_shows',
+                'update': 'OLD TABLE AS old_shows NEW TABLE AS new_shows'
+            }
+            for operation in operations:
+                op.execute(f'CREATE FUNCTION {table}_show_stats_{operation}() RETURNS trigger AS $$ '
+                           f'BEGIN {functions[operation]}; RETURN NULL; END $$ LANGUAGE plpgsql')
+                op.execute(f'CREATE TRIGGER {table}_show_stats_{operation} AFTER {operation.upper()} ON shows '
+                           f'REFERENCING {transitions[operation]} FOR EACH STATEMENT '
+                           f'EXECUTE PROCEDURE {table}_show_stats_{operation}()')
+
+
+def downgrade():
+    for table, key in tables:
+        if op.get_bind().dialect.name == 'postgresql':
+            for operation in operations:
+                op.execute(f'DROP TRIGGER {table}_show_stats_{operation} ON shows')
+                op.execute(f'DROP FUNCTION {table}_show_stats_{operation}()')
+        op.drop_index(op.f(f'ix_{table}_next_show_time'), table_name=table)
+        for column in reversed(columns):
+            op.drop_column(table, column)
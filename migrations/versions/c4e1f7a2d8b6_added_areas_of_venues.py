@@ -0,0 +1,67 @@
+"""Added the areas of venues, maintained by triggers on PostgreSQL, and a (state, city, name) index to venues
+
+Revision ID: c4e1f7a2d8b6
+Revises: b7c5d0e3a914
+Create Date: 2026-10-18 00:12:07.842916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e1f7a2d8b6'
+down_revision = 'b7c5d0e3a914'
+branch_labels = None
+depends_on = None
+
+changes = {
+    'insert': 'SELECT state, city, 1, upcoming_shows_count FROM new_venues',
+    'delete': 'SELECT state, city, -1, -upcoming_shows_count FROM old_venues',
+    'update': 'SELECT state, city, 1, upcoming_shows_count FROM new_venues '
+              'UNION ALL SELECT state, city, -1, -upcoming_shows_count FROM old_venues'
+}
+
+transitions = {
+    'insert': 'NEW TABLE AS new_venues',
+    'delete': 'OLD TABLE AS old_venues',
+    'update': 'OLD TABLE AS old_venues NEW TABLE AS new_venues'
+}
+
+
+def upgrade():
+    op.create_table('areas',
+                    sa.Column('state', sa.String(length=50), nullable=False),
+                    sa.Column('city', sa.String(length=50), nullable=False),
+                    sa.Column('venue_count', sa.Integer(), server_default='0', nullable=False),
+                    sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False),
+                    sa.PrimaryKeyConstraint('state', 'city')
+                    )
+    op.execute('INSERT INTO areas (state, city, venue_count, upcoming_shows_count) '
+               'SELECT state, city, count(id), sum(upcoming_shows_count) FROM venues GROUP BY state, city')
+    op.create_index('ix_venues_state_city_name', 'venues', ['state', 'city', 'name'], unique=False)
+    if op.get_bind().dialect.name == 'postgresql':
+        for operation, rows in changes.items():
+            body = ('INSERT INTO areas (state, city, venue_count, upcoming_shows_count) '
+                    'SELECT state, city, sum(venues), sum(upcoming) '
+                    f'FROM ({rows}) AS changes (state, city, venues, upcoming) GROUP BY state, city '
+                    'HAVING sum(venues) <> 0 OR sum(upcoming) <> 0 '
+                    'ON CONFLICT (state, city) DO UPDATE SET venue_count = areas.venue_count + excluded.venue_count, '
+                    'upcoming_shows_count = areas.upcoming_shows_count + excluded.upcoming_shows_count; ')
+            if operation != 'insert':
+                body += ('DELETE FROM areas WHERE venue_count <= 0 AND '
+                         '(state, city) IN (SELECT state, city FROM old_venues); ')
+            op.execute(f'CREATE OR REPLACE FUNCTION venues_areas_{operation}() RETURNS trigger AS $$ '
+                       f'BEGIN {body}RETURN NULL; END $$ LANGUAGE plpgsql')
+            op.execute(f'CREATE TRIGGER venues_areas_{operation} AFTER {operation.upper()} ON venues '
+                       f'REFERENCING {transitions[operation]} FOR EACH STATEMENT '
+                       f'EXECUTE PROCEDURE venues_areas_{operation}()')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for operation in changes:
+            op.execute(f'DROP TRIGGER venues_areas_{operation} ON venues')
+            op.execute(f'DROP FUNCTION venues_areas_{operation}()')
+    op.drop_index('ix_venues_state_city_name', table_name='venues')
+    op.drop_table('areas')
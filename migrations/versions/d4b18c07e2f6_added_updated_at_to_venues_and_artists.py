@@ -0,0 +1,32 @@
+"""Added updated_at to venues and artists, and a (venue_id, start_time) index to shows, for conditional requests
+
+Revision ID: d4b18c07e2f6
+Revises: 5c2e9d41b7a3
+Create Date: 2026-10-17 13:41:27.665093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b18c07e2f6'
+down_revision = '5c2e9d41b7a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(),
+                                       server_default=sa.func.now(), nullable=False))
+        op.create_index(op.f(f'ix_{table}_updated_at'), table, ['updated_at'], unique=False)
+    op.create_index('ix_shows_venue_id_start_time', 'shows',
+                    ['venue_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
+    for table in ('artists', 'venues'):
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        op.drop_column(table, 'updated_at')
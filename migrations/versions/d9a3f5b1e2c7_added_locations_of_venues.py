@@ -0,0 +1,35 @@
+"""Added the locations of venues, and their spatial indexes: a GiST index on PostgreSQL, a geohash index elsewhere
+
+Revision ID: d9a3f5b1e2c7
+Revises: c4e1f7a2d8b6
+Create Date: 2026-10-18 01:26:53.104387
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a3f5b1e2c7'
+down_revision = 'c4e1f7a2d8b6'
+branch_labels = None
+depends_on = None
+
+
+# existing venues are located by "flask geocode"
+def upgrade():
+    op.add_column('venues', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venues', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('venues', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index('ix_venues_geohash', 'venues', ['geohash', 'latitude', 'longitude'], unique=False)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE INDEX ix_venues_location ON venues USING gist (point(longitude, latitude))')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX ix_venues_location')
+    op.drop_index('ix_venues_geohash', table_name='venues')
+    op.drop_column('venues', 'geohash')
+    op.drop_column('venues', 'longitude')
+    op.drop_column('venues', 'latitude')
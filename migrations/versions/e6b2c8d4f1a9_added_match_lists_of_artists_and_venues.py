@@ -0,0 +1,54 @@
+"""Added the lists of best matches of artists and venues, and the digests of the profiles they were scored from
+
+Revision ID: e6b2c8d4f1a9
+Revises: d9a3f5b1e2c7
+Create Date: 2026-10-18 03:41:27.519204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b2c8d4f1a9'
+down_revision = 'd9a3f5b1e2c7'
+branch_labels = None
+depends_on = None
+
+
+# the lists are computed by "flask matches refresh"
+def upgrade():
+    op.create_table('artist_matches',
+                    sa.Column('artist_id', sa.Integer(), nullable=False),
+                    sa.Column('rank', sa.SmallInteger(), autoincrement=False, nullable=False),
+                    sa.Column('venue_id', sa.Integer(), nullable=False),
+                    sa.Column('score', sa.Float(), nullable=False),
+                    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ondelete='CASCADE'),
+                    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('artist_id', 'rank')
+                    )
+    op.create_index(op.f('ix_artist_matches_venue_id'), 'artist_matches', ['venue_id'], unique=False)
+    op.create_table('venue_matches',
+                    sa.Column('venue_id', sa.Integer(), nullable=False),
+                    sa.Column('rank', sa.SmallInteger(), autoincrement=False, nullable=False),
+                    sa.Column('artist_id', sa.Integer(), nullable=False),
+                    sa.Column('score', sa.Float(), nullable=False),
+                    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ondelete='CASCADE'),
+                    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('venue_id', 'rank')
+                    )
+    op.create_index(op.f('ix_venue_matches_artist_id'), 'venue_matches', ['artist_id'], unique=False)
+    op.create_table('match_profiles',
+                    sa.Column('kind', sa.String(length=10), nullable=False),
+                    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+                    sa.Column('digest', sa.BigInteger(), nullable=False),
+                    sa.PrimaryKeyConstraint('kind', 'id')
+                    )
+
+
+def downgrade():
+    op.drop_table('match_profiles')
+    op.drop_index(op.f('ix_venue_matches_artist_id'), table_name='venue_matches')
+    op.drop_table('venue_matches')
+    op.drop_index(op.f('ix_artist_matches_venue_id'), table_name='artist_matches')
+    op.drop_table('artist_matches')
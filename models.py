@@ -1,10 +1,75 @@
 # This file contains all models of the database, and their helper functions
 
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import bindparam, case, event, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext import baked
+from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session, sessionmaker
+from instrumentation import TimedQueuePool
+from replicas import RoutingSession
+
+
+class Database(SQLAlchemy):
+    """
+    Flask-SQLAlchemy, with the connection pool settings of config.py on server databases,
+    and sessions reading from the replicas in GET requests. SQLite keeps the pool Flask-SQLAlchemy picks for it.
+    """
+
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        super().apply_driver_hacks(app, sa_url, options)
+        if sa_url.get_backend_name() != 'sqlite':
+            options.update({
+                'poolclass': TimedQueuePool,
+                'pool_size': app.config['DATABASE_POOL_SIZE'],
+                'max_overflow': app.config['DATABASE_POOL_MAX_OVERFLOW'],
+                'pool_timeout': app.config['DATABASE_POOL_TIMEOUT'],
+                'pool_recycle': app.config['DATABASE_POOL_RECYCLE'],
+                'pool_pre_ping': app.config['DATABASE_POOL_PRE_PING'],
+                'wait_warning': app.config['DATABASE_POOL_WAIT_WARNING']
+            })
+
+
+db = Database()
+
+
+# SQLite enforces foreign keys, and runs their ON DELETE CASCADE, only on the connections that turn them on
+@event.listens_for(Engine, 'connect')
+def enable_foreign_keys(connection, record):
+    if isinstance(connection, sqlite3.Connection):
+        connection.execute('PRAGMA foreign_keys = ON')
+
+# the hot queries of every page view are baked: their SQL is compiled once, and cached under their lambdas
+# and arguments, values change through bound parameters
+bakery = baked.bakery()
+
+# days of the week, in the order of datetime.weekday(). bit n of an artist's availability is weekDays[n]
+weekDays = ('monday', 'tuesday', 'wednesday',
+            'thursday', 'friday', 'saturday', 'sunday')
+allWeek = (1 << len(weekDays)) - 1
+
+
+# a boolean attribute for one bit of the availability mask, so forms can keep editing days one by one
+def weekday_property(weekday):
+    bit = 1 << weekday
+
+    def fget(self):
+        return bool(self.availability_mask & bit) if self.availability_mask is not None else True
+
+    def fset(self, value):
+        mask = self.availability_mask if self.availability_mask is not None else allWeek
+        self.availability_mask = mask | bit if value else mask & ~bit
+
+    def expr(cls):
+        return cls.available_on(weekday)
+    return hybrid_property(fget, fset, expr=expr)
 
-db = SQLAlchemy()
 
 # Declaring models
 
@@ -16,88 +81,109 @@ class Artist(db.Model):
     city = db.Column(db.String(50), nullable=False)
     state = db.Column(db.String(50), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(150), nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(
         db.Boolean, nullable=False, default=False, server_default='false')
     seeking_description = db.Column(db.String(500))
-    monday = db.Column(db.Boolean, nullable=False,
-                       default=True, server_default='true')
-    tuesday = db.Column(db.Boolean, nullable=False,
-                        default=True, server_default='true')
-    wednesday = db.Column(db.Boolean, nullable=False,
-                          default=True, server_default='true')
-    thursday = db.Column(db.Boolean, nullable=False,
-                         default=True, server_default='true')
-    friday = db.Column(db.Boolean, nullable=False,
-                       default=True, server_default='true')
-    saturday = db.Column(db.Boolean, nullable=False,
-                         default=True, server_default='true')
-    sunday = db.Column(db.Boolean, nullable=False,
-                       default=True, server_default='true')
+    # weekly availability, one bit per day of weekDays
+    availability_mask = db.Column(
+        db.SmallInteger, nullable=False, default=allWeek, server_default=str(allWeek))
+    monday = weekday_property(0)
+    tuesday = weekday_property(1)
+    wednesday = weekday_property(2)
+    thursday = weekday_property(3)
+    friday = weekday_property(4)
+    saturday = weekday_property(5)
+    sunday = weekday_property(6)
+    # name, city, state and genres, indexed by the search engine in search.py
+    search_text = db.Column(db.String(400), nullable=False, server_default='')
+    # UTC time of the last change of the artist's page, validators of conditional requests are made of it
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, server_default=func.now())
+    # show statistics, kept up to date on write and rolled forward with time by stats.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_time = db.Column(db.DateTime, index=True)
+    last_show_time = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_artists_seeking_venue_availability',
+                 'seeking_venue', 'availability_mask'),
+        # bulk imports match existing artists by name, city and state
+        db.Index('ix_artists_name_city_state', 'name', 'city', 'state'),
+    )
+
     venues = db.relationship('Venue', secondary='shows',
                              backref='artist', lazy=True)
     shows = db.relationship('Show', backref='artist',
                             lazy=True, cascade='all, delete-orphan', passive_deletes=True)
-
-    # query shows table for number of past shows for the given artist
-    @hybrid_property
-    def past_shows_count(self):
-        return len(list(filter(lambda x: x.start_time < datetime.today(), self.shows)))
-
-    # query shows table for number of upcomming shows for the given artist
-    @hybrid_property
-    def upcoming_shows_count(self):
-        return len(list(filter(lambda x: x.start_time > datetime.today(), self.shows)))
+    # genres are rows of the artist_genres table, exposed as a list of Genre values
+    genre_rows = db.relationship('ArtistGenre', lazy='selectin', order_by='ArtistGenre.genre',
+                                 cascade='all, delete-orphan', passive_deletes=True)
+    genres = association_proxy(
+        'genre_rows', 'genre', creator=lambda genre: ArtistGenre(genre=genre))
 
     # query artists table for availability on weekdays, returning a string to frontEnd
     @hybrid_property
     def availability(self):
-        weekDays = ['monday', 'tuesday', 'wednesday',
-                    'thursday', 'friday', 'saturday', 'sunday']
-        daylist = []
-        for day in weekDays:
-            if getattr(self, day):
-                daylist.append(day)
+        daylist = [day for weekday, day in enumerate(
+            weekDays) if self.availableOn(weekday)[0]]
         if not daylist:
             return f'but haven\'t specified weekly availability dates. Please contact {self.name} for more details.'
-        elif daylist == weekDays:
+        elif len(daylist) == len(weekDays):
             return 'all week!'
+        elif len(daylist) == 1:
+            return 'on ' + daylist[0]
         daylist.insert(-1, 'and')
         return 'on ' + ', '.join(daylist[:-2]) + ' ' + ' '.join(daylist[-2:])
 
     # returns a dictionary for the given artist
     def dict(self):
+        upcoming_shows_count, past_shows_count = show_counts(self, Show.artist_id)
         return {
             'id': self.id,
             'name': self.name,
             'city': self.city,
             'state': self.state,
             'phone': self.phone,
-            'genres': self.genres.split(),  # convert string to list
+            'genres': list(self.genres),
             'image_link': self.image_link,
             'facebook_link': self.facebook_link,
             'website': self.website,
             'seeking_venue': self.seeking_venue,
             'seeking_description': self.seeking_description,
             'availability': self.availability,
-            'upcoming_shows_count': self.upcoming_shows_count,
-            'past_shows_count': self.past_shows_count
+            'upcoming_shows_count': upcoming_shows_count,
+            'past_shows_count': past_shows_count
         }
 
     # Check availability for validation on shows form, returns a tuple of true / false, and the specified date in the form to the frontEnd
+    # accepts a date, or a weekday number as returned by date.weekday()
     def availableOn(self, date):
-        weekDays = ('monday', 'tuesday', 'wednesday',
-                    'thursday', 'friday', 'saturday', 'sunday')
-        weekDate = date.weekday()
-        weekDateStr = weekDays[weekDate]
-        checkDate = getattr(self, weekDateStr)
-        if checkDate:
-            return True, weekDateStr
-        else:
-            return False, weekDateStr
+        weekDate = date if isinstance(date, int) else date.weekday()
+        mask = self.availability_mask if self.availability_mask is not None else allWeek
+        return bool(mask & (1 << weekDate)), weekDays[weekDate]
+
+    # criterion of artists available on the given weekday, a single bitwise predicate on the availability mask
+    @classmethod
+    def available_on(cls, weekday):
+        return cls.availability_mask.op('&')(1 << weekday) != 0
+
+    # query of artists seeking venues who are free on the given weekday. the predicate is evaluated on the
+    # (seeking_venue, availability_mask) index, without loading artists
+    @classmethod
+    def free_on(cls, weekday):
+        return cls.query.filter(cls.seeking_venue == True, cls.available_on(weekday))
+
+    # (updated_at, start of the latest past show) of an artist's page, in UTC, or None if there's no such artist
+    @classmethod
+    def version(cls, artist_id):
+        query = bakery(lambda session: session.query(cls.updated_at, Show.last_started(
+            Show.artist_id == cls.id, bindparam('now'))).filter(cls.id == bindparam('id')), cls)
+        row = query(db.session()).params(id=artist_id, now=datetime.today()).first()
+        return row and (row[0], utc(row[1]))
 
 
 class Venue(db.Model):
@@ -108,25 +194,40 @@ class Venue(db.Model):
     state = db.Column(db.String(50), nullable=False)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(150), nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(
         db.Boolean, nullable=False, default=False, server_default='false')
     seeking_description = db.Column(db.String(500))
+    search_text = db.Column(db.String(400), nullable=False, server_default='')
+    # UTC time of the last change of the venue's page, validators of conditional requests are made of it
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, server_default=func.now())
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_time = db.Column(db.DateTime, index=True)
+    last_show_time = db.Column(db.DateTime)
+    # location of the venue, from the geocoder of geo.py, and its geohash, the key of nearby searches
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    # bulk imports match existing venues by name, city and state, the venues of an area are listed by name.
+    # nearby searches read ranges of geohashes, with the locations in the index
+    __table_args__ = (
+        db.Index('ix_venues_name_city_state', 'name', 'city', 'state'),
+        db.Index('ix_venues_state_city_name', 'state', 'city', 'name'),
+        db.Index('ix_venues_geohash', 'geohash', 'latitude', 'longitude'),
+    )
     shows = db.relationship('Show', backref='venue',
                             lazy=True, cascade='all, delete-orphan', passive_deletes=True)
-
-    @hybrid_property
-    def past_shows_count(self):
-        return len(list(filter(lambda x: x.start_time < datetime.today(), self.shows)))
-
-    @hybrid_property
-    def upcoming_shows_count(self):
-        return len(list(filter(lambda x: x.start_time > datetime.today(), self.shows)))
+    genre_rows = db.relationship('VenueGenre', lazy='selectin', order_by='VenueGenre.genre',
+                                 cascade='all, delete-orphan', passive_deletes=True)
+    genres = association_proxy(
+        'genre_rows', 'genre', creator=lambda genre: VenueGenre(genre=genre))
 
     def dict(self):
+        upcoming_shows_count, past_shows_count = show_counts(self, Show.venue_id)
         return {
             'id': self.id,
             'name': self.name,
@@ -134,16 +235,24 @@ class Venue(db.Model):
             'state': self.state,
             'phone': self.phone,
             'address': self.address,
-            'genres': self.genres.split(),
+            'genres': list(self.genres),
             'image_link': self.image_link,
             'facebook_link': self.facebook_link,
             'website': self.website,
             'seeking_talent': self.seeking_talent,
             'seeking_description': self.seeking_description,
-            'upcoming_shows_count': self.upcoming_shows_count,
-            'past_shows_count': self.past_shows_count
+            'upcoming_shows_count': upcoming_shows_count,
+            'past_shows_count': past_shows_count
         }
 
+    # (updated_at, start of the latest past show) of a venue's page, in UTC, or None if there's no such venue
+    @classmethod
+    def version(cls, venue_id):
+        query = bakery(lambda session: session.query(cls.updated_at, Show.last_started(
+            Show.venue_id == cls.id, bindparam('now'))).filter(cls.id == bindparam('id')), cls)
+        row = query(db.session()).params(id=venue_id, now=datetime.today()).first()
+        return row and (row[0], utc(row[1]))
+
 
 class Show(db.Model):
     __tablename__ = 'shows'
@@ -152,20 +261,163 @@ class Show(db.Model):
         'artists.id', ondelete='CASCADE'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey(
         'venues.id', ondelete='CASCADE'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
+    # site wide calendars read one range of this index
+    start_time = db.Column(db.DateTime, nullable=False, index=True)
 
-    def venueDict(self):
-        return {
-            'venue_id': self.venue.id,
-            'venue_name': self.venue.name,
-            'venue_image_link': self.venue.image_link,
-            'start_time': self.start_time.strftime('%Y-%m-%d %H:%M')
-        }
+    # serve the booking checks, the latest past show lookups and the venue and artist calendars,
+    # an artist's or a venue's shows between two times are one range of these indexes
+    __table_args__ = (
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+    )
 
-    def artistDict(self):
-        return {
-            'artist_id': self.artist.id,
-            'artist_name': self.artist.name,
-            'artist_image_link': self.artist.image_link,
-            'start_time': self.start_time.strftime('%Y-%m-%d %H:%M')
-        }
+    # past or upcoming criterion against the current time, or against a bound parameter of baked queries.
+    # a show starting right now is past already, as for the counts of stats.py
+    @classmethod
+    def window(cls, upcoming, now=None):
+        now = datetime.today() if now is None else now
+        return cls.start_time > now if upcoming else cls.start_time <= now
+
+    # count shows of a single artist or venue. if its shows are already loaded, count them in memory,
+    # otherwise let the database count them instead of loading every show row
+    @classmethod
+    def count_for(cls, owner, key, upcoming):
+        if 'shows' in owner.__dict__:
+            now = datetime.today()
+            return len([show for show in owner.shows if (show.start_time > now if upcoming else show.start_time <= now)])
+        query = bakery(lambda session: session.query(func.count(cls.id)).filter(
+            key == bindparam('id'), cls.window(upcoming, bindparam('now'))), key, upcoming)
+        return query(db.session()).params(id=owner.id, now=datetime.today()).scalar()
+
+    # scalar subquery of the start time of the latest show that already started. detail pages change
+    # when a show moves from upcoming to past, so their version includes it
+    @classmethod
+    def last_started(cls, criterion, now=None):
+        return select([func.max(cls.start_time)]).where(criterion).where(cls.window(False, now)).as_scalar()
+
+    # (latest venue update, latest artist update) in UTC, the version of the shows list. show creation and
+    # venue deletion touch the artists and venues of their shows, so every change of the list moves it
+    @classmethod
+    def list_version(cls):
+        query = bakery(lambda session: session.query(select([func.max(Venue.updated_at)]).as_scalar(),
+                                                     select([func.max(Artist.updated_at)]).as_scalar()))
+        return query(db.session()).one()
+
+    # one grouped aggregate of past and upcoming show counts per venue or artist, keyed by the given
+    # foreign key column. listing pages outer join it to get every count in a single query
+    @classmethod
+    def counts_by(cls, key):
+        now = datetime.today()
+        return db.session.query(
+            key.label('id'),
+            func.sum(case([(cls.start_time > now, 1)], else_=0)).label(
+                'upcoming_shows_count'),
+            func.sum(case([(cls.start_time <= now, 1)], else_=0)).label(
+                'past_shows_count')
+        ).group_by(key).subquery()
+
+
+# cities and states of venues, with their numbers of venues and upcoming shows, maintained by areas.py.
+# the primary key is the order of the venues page, its pages are ranges of the primary key index
+class Area(db.Model):
+    __tablename__ = 'areas'
+    state = db.Column(db.String(50), primary_key=True)
+    city = db.Column(db.String(50), primary_key=True)
+    venue_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+# best matches of the artists seeking venues and of the venues seeking talent, scored and refreshed by
+# matchmaking.py. a list is one range of the primary key, best match first. the matched side is indexed,
+# refreshes find the lists holding the venues or artists that changed
+class ArtistMatch(db.Model):
+    __tablename__ = 'artist_matches'
+    artist_id = db.Column(db.Integer, db.ForeignKey(
+        'artists.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey(
+        'venues.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+
+class VenueMatch(db.Model):
+    __tablename__ = 'venue_matches'
+    venue_id = db.Column(db.Integer, db.ForeignKey(
+        'venues.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey(
+        'artists.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+
+# digests of the profiles the stored matches were scored from, by kind ('artists' or 'venues') and id.
+# refreshes recompute the lists that the profiles whose digest changed can reach
+class MatchProfile(db.Model):
+    __tablename__ = 'match_profiles'
+    kind = db.Column(db.String(10), primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    digest = db.Column(db.BigInteger, nullable=False)
+
+
+# genres of artists and venues, one row per genre. the primary keys lead with the genre,
+# so browsing a genre is a range scan of the primary key index
+class ArtistGenre(db.Model):
+    __tablename__ = 'artist_genres'
+    genre = db.Column(db.String(30), primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey(
+        'artists.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+
+class VenueGenre(db.Model):
+    __tablename__ = 'venue_genres'
+    genre = db.Column(db.String(30), primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey(
+        'venues.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+
+# naive local time, like show start times, to naive UTC
+def utc(local):
+    return datetime.utcfromtimestamp(local.timestamp()) if local is not None else None
+
+
+# (upcoming, past) show counts of an artist or venue. the stored ones are exact until its next show starts,
+# after that they're counted until the next roll of stats.py
+def show_counts(owner, key):
+    if owner.next_show_time is not None and owner.next_show_time <= datetime.today():
+        return Show.count_for(owner, key, upcoming=True), Show.count_for(owner, key, upcoming=False)
+    return owner.upcoming_shows_count, owner.past_shows_count
+
+
+# the artist or venue with the given id, from the session's identity map or a baked query
+def get(model, id):
+    return bakery(lambda session: session.query(model), model)(db.session()).get(id)
+
+
+# bumps updated_at of the artists or venues matching the criterion, when something they show changed
+def touch(model, criterion):
+    db.session.query(model).filter(criterion).update(
+        {model.updated_at: datetime.utcnow()}, synchronize_session=False)
+
+
+def search_text_of(name, city, state, genres):
+    return ' '.join([name or '', city or '', state or ''] + list(genres))
+
+
+# keep the text indexed by the search engine in sync with the searchable columns.
+# this runs before every flush rather than on update, since changing genres only touches the genre tables
+@event.listens_for(Session, 'before_flush')
+def update_search_text(session, flush_context, instances):
+    for target in list(session.new) + list(session.dirty):
+        if isinstance(target, (Artist, Venue)):
+            search_text = search_text_of(
+                target.name, target.city, target.state, target.genres)
+            if target.search_text != search_text:
+                target.search_text = search_text
+
+
+# changed artists and venues get a new updated_at, genre changes included
+@event.listens_for(Session, 'before_flush')
+def update_updated_at(session, flush_context, instances):
+    for target in session.dirty:
+        if isinstance(target, (Artist, Venue)) and session.is_modified(target):
+            target.updated_at = datetime.utcnow()
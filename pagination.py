@@ -0,0 +1,101 @@
+# This file contains keyset (cursor based) pagination for the listing pages
+
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+
+class Page(object):
+    """
+    A single page of a keyset paginated query.
+
+    :param items:
+        rows of the page, in display order.
+    :param next_cursor:
+        opaque cursor of the following page, None on the last page.
+    :param prev_cursor:
+        opaque cursor of the preceding page, None on the first page.
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+# cursors are the sort key of the first or last row of a page, plus the direction to move in
+def encode_cursor(direction, values):
+    values = [{'dt': value.isoformat()} if isinstance(value, datetime)
+              else value for value in values]
+    raw = json.dumps([direction, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(raw)
+        values = [datetime.fromisoformat(value['dt']) if isinstance(value, dict)
+                  else value for value in values]
+    except (ValueError, TypeError, KeyError):
+        return None, None
+    if direction not in ('next', 'prev'):
+        return None, None
+    return direction, values
+
+
+def keyset(query, keys, cursor=None, per_page=50):
+    """
+    Returns the query of one page, ordered by the given key columns, and the direction of the cursor.
+
+    The last key must be unique (usually the primary key), so the order is stable.
+    Instead of an OFFSET, pages continue from the sort key of the row they start after,
+    so every page is a bounded index range scan no matter how deep it is.
+    """
+    direction, values = decode_cursor(cursor) if cursor else (None, None)
+    if values is not None and len(values) != len(keys):
+        direction, values = None, None
+    if direction == 'prev':
+        query = query.filter(tuple_(*keys) < tuple_(*values)
+                             ).order_by(*[key.desc() for key in keys])
+    else:
+        if direction == 'next':
+            query = query.filter(tuple_(*keys) > tuple_(*values))
+        query = query.order_by(*keys)
+    # fetch one extra row to know whether there is another page in the same direction
+    return query.limit(per_page + 1), direction
+
+
+def page_of(rows, keys, direction, per_page=50):
+    # the page of the rows fetched by a keyset() query, with the cursors of its neighbours
+    rows = list(rows)
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+    if not rows:
+        return Page(rows)
+
+    def key_of(row):
+        return [getattr(row, key.key) for key in keys]
+    next_cursor = prev_cursor = None
+    if more or direction == 'prev':
+        next_cursor = encode_cursor('next', key_of(rows[-1]))
+    if (direction == 'next') or (direction == 'prev' and more):
+        prev_cursor = encode_cursor('prev', key_of(rows[0]))
+    return Page(rows, next_cursor, prev_cursor)
+
+
+def paginate(query, keys, cursor=None, per_page=50):
+    """
+    Fetches one page of the given query, ordered by the given key columns, see keyset().
+    """
+    query, direction = keyset(query, keys, cursor, per_page)
+    return page_of(query.all(), keys, direction, per_page)
@@ -0,0 +1,68 @@
+# This file contains the routing of reads to the replicas of the database.
+# GET and HEAD requests read from one of the DATABASE_REPLICA_URLS, picked once per request, every other
+# request, forms and their validators included, runs on the primary. A request that committed a write sends
+# a cookie, and the user's requests read from the primary while it lasts, so the redirect to a new venue's
+# page doesn't race the replication of the venue.
+
+import random
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SignallingSession, get_state
+from sqlalchemy import event
+
+# the cookie of users who wrote in the last READ_YOUR_WRITES_SECONDS
+primaryCookie = 'read_primary'
+
+readMethods = ('GET', 'HEAD')
+
+
+def replica_binds(app):
+    # bind keys of the replica engines, see SQLALCHEMY_BINDS in config.py
+    return [bind for bind in app.config.get('SQLALCHEMY_BINDS') or {} if bind.startswith('replica')]
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session reading from the replica picked for the request, if any. Flushes always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('replica') if has_request_context() else None
+        if replica is not None and not self._flushing:
+            return get_state(self.app).db.get_engine(self.app, bind=replica)
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def remember_write(session):
+    if has_request_context():
+        g.wrote = True
+
+
+@contextmanager
+def primary():
+    # runs the block on the primary, in a request reading from a replica
+    replica = g.pop('replica', None) if has_request_context() else None
+    try:
+        yield
+    finally:
+        if replica is not None:
+            g.replica = replica
+
+
+def init_app(app):
+    binds = replica_binds(app)
+    if not binds:
+        return
+
+    @app.before_request
+    def pick_replica():
+        if request.method in readMethods and primaryCookie not in request.cookies:
+            g.replica = random.choice(binds)
+
+    @app.after_request
+    def read_your_writes(response):
+        if g.get('wrote'):
+            response.set_cookie(primaryCookie, '1', max_age=app.config['READ_YOUR_WRITES_SECONDS'],
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,69 @@
+# This file contains the show calendar: the shows between two dates, grouped by day,
+# for the whole site or a single venue or artist. A date range is one range scan of the shows
+# (start_time), (venue_id, start_time) or (artist_id, start_time) index.
+
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from itertools import groupby
+from sqlalchemy import bindparam
+from models import Venue, Artist, Show, bakery, db
+
+# longest range of a calendar request, so a request never reads more than a quarter of shows
+maxDays = 92
+
+tileColumns = (Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'), Show.artist_id,
+               Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'))
+
+Day = namedtuple('Day', ['date', 'shows'])
+
+
+def month_range(day):
+    first = day.replace(day=1)
+    return first, (first + timedelta(days=32)).replace(day=1)
+
+
+def parse_range(start=None, end=None):
+    """
+    Returns the (start, end) dates of a calendar, from ISO dates, the end excluded.
+    Defaults to the month of the start date, or the current month.
+
+    Raises ValueError for invalid dates, an end before the start, or a range of more than maxDays days.
+    """
+    try:
+        start = date.fromisoformat(start) if start else month_range(date.today())[0]
+        end = date.fromisoformat(end) if end else month_range(start)[1]
+    except ValueError:
+        raise ValueError('Dates must be like 2030-05-21.')
+    if end <= start:
+        raise ValueError('The end date must be after the start date.')
+    if (end - start).days > maxDays:
+        raise ValueError(f'A calendar covers at most {maxDays} days.')
+    return start, end
+
+
+def neighbours(start, end):
+    # the ranges before and after a calendar, whole months for a month
+    if start.day == 1 and end == month_range(start)[1]:
+        return month_range(start - timedelta(days=1)), month_range(end)
+    length = end - start
+    return (start - length, start), (end, end + length)
+
+
+def shows_between(start, end, venue_id=None, artist_id=None, columns=tileColumns):
+    # projected shows starting from the start date to the end date, excluded, in start time order.
+    # a baked query, one cached statement per set of columns and filters
+    query = bakery(lambda session: session.query(*columns).join(Venue, Venue.id == Show.venue_id).join(
+        Artist, Artist.id == Show.artist_id).filter(
+        Show.start_time >= bindparam('start'), Show.start_time < bindparam('end')), columns)
+    if venue_id is not None:
+        query += lambda query: query.filter(Show.venue_id == bindparam('venue_id'))
+    if artist_id is not None:
+        query += lambda query: query.filter(Show.artist_id == bindparam('artist_id'))
+    query += lambda query: query.order_by(Show.start_time, Show.id)
+    return query(db.session()).params(start=datetime.combine(start, time.min), end=datetime.combine(end, time.min),
+                                      venue_id=venue_id, artist_id=artist_id)
+
+
+def by_day(shows):
+    # days with shows only, each with its shows in start time order
+    return [Day(day, list(group)) for day, group in groupby(shows, lambda show: show.start_time.date())]
@@ -0,0 +1,190 @@
+# This file contains the search engine behind the venue and artist search pages.
+# Searches run against the search_text column of venues and artists, which is kept in sync by models.py.
+# On PostgreSQL it's served by a trigger maintained tsvector column and a trigram index,
+# on SQLite by an FTS5 table kept in sync with triggers. Other databases fall back to a plain ILIKE scan.
+
+import re
+from flask import current_app
+from sqlalchemy import DDL, event, func, literal_column, or_, text
+from models import db, Venue, Artist
+from pagination import Page
+
+searchable = (Venue, Artist)
+
+
+def tokens(term):
+    return re.findall(r'\w+', term.lower())
+
+
+# statements creating the index structures of the given table, also used when tables are created with create_all
+def postgres_ddl(table):
+    return [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        f'ALTER TABLE {table} ADD COLUMN search_vector tsvector',
+        f'CREATE TRIGGER {table}_search_vector_update BEFORE INSERT OR UPDATE OF search_text ON {table} '
+        f"FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.simple', search_text)",
+        f"UPDATE {table} SET search_vector = to_tsvector('pg_catalog.simple', search_text)",
+        f'CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)',
+        f'CREATE INDEX ix_{table}_search_text_trgm ON {table} USING gin (search_text gin_trgm_ops)'
+    ]
+
+
+def sqlite_ddl(table):
+    return [
+        f"CREATE VIRTUAL TABLE {table}_search USING fts5(search_text, content='{table}', content_rowid='id', prefix='2 3')",
+        f'CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {table}_search(rowid, search_text) VALUES (new.id, new.search_text); END',
+        f'CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {table}_search({table}_search, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+        f'CREATE TRIGGER {table}_search_update AFTER UPDATE OF search_text ON {table} BEGIN '
+        f"INSERT INTO {table}_search({table}_search, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+        f'INSERT INTO {table}_search(rowid, search_text) VALUES (new.id, new.search_text); END',
+        f"INSERT INTO {table}_search({table}_search) VALUES ('rebuild')"
+    ]
+
+
+for model in searchable:
+    for statement in postgres_ddl(model.__tablename__):
+        event.listen(model.__table__, 'after_create',
+                     DDL(statement).execute_if(dialect='postgresql'))
+    for statement in sqlite_ddl(model.__tablename__):
+        event.listen(model.__table__, 'after_create',
+                     DDL(statement).execute_if(dialect='sqlite'))
+
+
+class SearchBackend(object):
+    """
+    Runs the statements of a search engine: the number of matches, capped, and a page of ranked ids.
+    """
+
+    def count(self, model, term, cap):
+        return db.session.execute(self.count_statement(model, term, cap)).scalar()
+
+    def ids(self, model, term, offset, limit):
+        return [row[0] for row in db.session.execute(self.ids_statement(model, term, offset, limit))]
+
+
+class PostgresSearch(SearchBackend):
+    """
+    Full text matches on word prefixes, or substring matches served by the trigram index,
+    ranked by text rank plus name similarity.
+    """
+
+    def match(self, model, term):
+        query = func.to_tsquery(
+            'pg_catalog.simple', ' & '.join(token + ':*' for token in tokens(term)))
+        vector = literal_column(model.__tablename__ + '.search_vector')
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', term) + '%'
+        criterion = or_(vector.op('@@')(query),
+                        model.search_text.ilike(pattern, escape='\\'))
+        rank = func.ts_rank(vector, query) + func.similarity(model.name, term)
+        return criterion, rank
+
+    def count_statement(self, model, term, cap):
+        criterion, rank = self.match(model, term)
+        matches = db.session.query(model.id).filter(criterion).limit(cap).subquery()
+        return db.session.query(func.count()).select_from(matches).statement
+
+    def ids_statement(self, model, term, offset, limit):
+        criterion, rank = self.match(model, term)
+        return db.session.query(model.id).filter(criterion).order_by(
+            rank.desc(), model.id).offset(offset).limit(limit).statement
+
+
+class SqliteSearch(SearchBackend):
+    """
+    FTS5 matches on word prefixes, ranked by bm25.
+    """
+
+    def match(self, term):
+        return ' '.join('"' + token + '"*' for token in tokens(term))
+
+    def count_statement(self, model, term, cap):
+        table = model.__tablename__ + '_search'
+        return text(f'SELECT count(*) FROM (SELECT 1 FROM {table} WHERE {table} MATCH :q LIMIT :cap)').bindparams(
+            q=self.match(term), cap=cap)
+
+    def ids_statement(self, model, term, offset, limit):
+        table = model.__tablename__ + '_search'
+        return text(f'SELECT rowid FROM {table} WHERE {table} MATCH :q ORDER BY rank, rowid LIMIT :limit OFFSET :offset'
+                    ).bindparams(q=self.match(term), limit=limit, offset=offset)
+
+
+class LikeSearch(SearchBackend):
+    """
+    Unindexed substring matches, for databases without a full text engine.
+    """
+
+    def match(self, model, term):
+        return model.search_text.ilike('%' + term + '%')
+
+    def count_statement(self, model, term, cap):
+        matches = db.session.query(model.id).filter(
+            self.match(model, term)).limit(cap).subquery()
+        return db.session.query(func.count()).select_from(matches).statement
+
+    def ids_statement(self, model, term, offset, limit):
+        return db.session.query(model.id).filter(self.match(model, term)).order_by(
+            model.name, model.id).offset(offset).limit(limit).statement
+
+
+backends = {
+    'postgresql': PostgresSearch,
+    'sqlite': SqliteSearch
+}
+
+
+def backend():
+    return backends.get(db.engine.dialect.name, LikeSearch)()
+
+
+def search_statements(model, term, cursor=None):
+    """
+    Returns the page number of the cursor, and the statements counting the matches of the search term
+    and selecting the ids of that page, in relevance order.
+
+    Results are capped at SEARCH_MAX_RESULTS, so the total is counted by the index
+    and the page cursor (the page number) never reaches an unbounded offset.
+    """
+    cap = current_app.config['SEARCH_MAX_RESULTS']
+    per_page = current_app.config['PAGE_SIZE']
+    number = int(cursor) if cursor and cursor.isdigit() else 1
+    number = max(1, min(number, -(-cap // per_page)))
+    offset = (number - 1) * per_page
+    if tokens(term):
+        engine = backend()
+        return number, engine.count_statement(model, term, cap), engine.ids_statement(
+            model, term, offset, min(per_page, cap - offset))
+    # nothing to search for, list everything in name order
+    matches = db.session.query(model.id).limit(cap).subquery()
+    return number, db.session.query(func.count()).select_from(matches).statement, db.session.query(
+        model.id).order_by(model.name, model.id).offset(offset).limit(min(per_page, cap - offset)).statement
+
+
+def search_rows(model, ids, columns=None):
+    # the query of the page's rows, by default the id, the name and the number of upcoming shows
+    columns = columns or (model.id, model.name,
+                          model.upcoming_shows_count.label('num_upcoming_shows'))
+    return db.session.query(*columns).filter(model.id.in_(ids))
+
+
+def search_page(number, total, ids, rows):
+    # the page of the ranked ids, with the rows of the ids in rank order
+    per_page = current_app.config['PAGE_SIZE']
+    rows = {row.id: row for row in rows}
+    page = Page([rows[id] for id in ids if id in rows],
+                str(number + 1) if number * per_page < total else None,
+                str(number - 1) if number > 1 else None)
+    page.total = total
+    return page
+
+
+def search(model, term, cursor=None, columns=None):
+    """
+    Returns one page of the given model's rows matching the search term, in relevance order, see search_statements().
+    The page's rows are projections of the given columns, the id first.
+    """
+    number, count, ids = search_statements(model, term, cursor)
+    total = db.session.execute(count).scalar()
+    ids = [row[0] for row in db.session.execute(ids)]
+    return search_page(number, total, ids, search_rows(model, ids, columns) if ids else [])
@@ -2,3 +2,60 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// the venues of an area of the venues page are loaded when the area is opened
+document.addEventListener('toggle', function (event) {
+  var area = event.target;
+  if (!area.open || !area.dataset || !area.dataset.venues || area.dataset.loaded) {
+    return;
+  }
+  area.dataset.loaded = 'true';
+  fetch(area.dataset.venues).then(function (response) {
+    return response.ok ? response.text() : Promise.reject(response);
+  }).then(function (html) {
+    area.querySelector('.items').outerHTML = html;
+  }, function () {
+    delete area.dataset.loaded;
+  });
+}, true);
+
+// the nearby venues search sends the location of the browser, when it's shared
+document.addEventListener('click', function (event) {
+  if (!event.target.classList || !event.target.classList.contains('locate') || !navigator.geolocation) {
+    return;
+  }
+  var form = event.target.form;
+  navigator.geolocation.getCurrentPosition(function (position) {
+    form.elements.lat.value = position.coords.latitude.toFixed(5);
+    form.elements.lng.value = position.coords.longitude.toFixed(5);
+    form.elements.city.value = '';
+    form.elements.state.value = '';
+    form.submit();
+  });
+});
+
+// search boxes suggest names, cities and genres from the first letters typed
+document.addEventListener('input', function (event) {
+  var input = event.target;
+  if (!input.dataset || !input.dataset.typeahead || !input.list) {
+    return;
+  }
+  var term = input.value;
+  if (!term.trim()) {
+    return;
+  }
+  fetch('/api/v1/typeahead?kinds=' + input.dataset.typeahead + '&q=' + encodeURIComponent(term)).then(function (response) {
+    return response.ok ? response.json() : Promise.reject(response);
+  }).then(function (result) {
+    // answers to earlier letters are dropped
+    if (input.value !== term) {
+      return;
+    }
+    input.list.innerHTML = '';
+    result.data.forEach(function (suggestion) {
+      var option = document.createElement('option');
+      option.value = suggestion.label;
+      input.list.appendChild(option);
+    });
+  }, function () {});
+});
@@ -0,0 +1,159 @@
+# This file contains the show statistics stored on venues and artists: their upcoming and past show counts,
+# the start of their next show and of their last past one. Pages and listings read them instead of counting shows.
+# On PostgreSQL, statement level triggers of the shows table keep them up to date, inserts add to the counts of
+# the inserted shows' venues and artists, deletes and updates recompute the affected ones. Other databases
+# recompute them after every flush of shows, and after the bulk inserts of importers.py.
+# The statistics are split at the time they were last written, so time moves upcoming shows into the past:
+# roll() recomputes the venues and artists whose next show started, it's run periodically by "flask stats roll".
+
+from datetime import datetime
+from sqlalchemy import DDL, and_, event, func, or_, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from models import db, Venue, Artist, Show
+import areas
+
+# (model, show key) of the venues and artists holding statistics
+owners = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+statColumns = ('upcoming_shows_count', 'past_shows_count', 'next_show_time', 'last_show_time')
+
+
+# the aggregates of a set of shows, split at the current time of the database. show times are naive local
+# times, the database's TimeZone setting has to be the one of the app's servers
+def postgres_stats(shows):
+    return (f'count(*) FILTER (WHERE start_time > LOCALTIMESTAMP), '
+            f'count(*) FILTER (WHERE start_time <= LOCALTIMESTAMP), '
+            f'min(start_time) FILTER (WHERE start_time > LOCALTIMESTAMP), '
+            f'max(start_time) FILTER (WHERE start_time <= LOCALTIMESTAMP) FROM {shows}')
+
+
+# statements creating the trigger functions and triggers of the given table's statistics, also used when
+# tables are created with create_all. drop_all leaves the functions, they are replaced. transition tables need PostgreSQL 10
+def postgres_ddl(table, key):
+    recompute = (f'UPDATE {table} SET ({", ".join(statColumns)}) = '
+                 f'(SELECT {postgres_stats("shows")} WHERE {key} = {table}.id) WHERE id IN ')
+    functions = {
+        'insert': f'UPDATE {table} SET upcoming_shows_count = {table}.upcoming_shows_count + added.upcoming, '
+                  f'past_shows_count = {table}.past_shows_count + added.past, '
+                  f'next_show_time = least({table}.next_show_time, added.next_show_time), '
+                  f'last_show_time = greatest({table}.last_show_time, added.last_show_time) '
+                  f'FROM (SELECT {key} AS id, {postgres_stats("new_shows")} GROUP BY {key}) '
+                  f'AS added (id, upcoming, past, next_show_time, last_show_time) WHERE {table}.id = added.id',
+        'delete': recompute + f'(SELECT {key} FROM old_shows)',
+        'update': recompute + f'(SELECT {key} FROM old_shows UNION SELECT {key} FROM new_shows)'
+    }
+    transitions = {
+        'insert': 'NEW TABLE AS new_shows',
+        'delete': 'OLD TABLE AS old_shows',
+        'update': 'OLD TABLE AS old_shows NEW TABLE AS new_shows'
+    }
+    statements = []
+    for operation, body in functions.items():
+        statements.append(f'CREATE OR REPLACE FUNCTION {table}_show_stats_{operation}() RETURNS trigger AS $$ '
+                          f'BEGIN {body}; RETURN NULL; END $$ LANGUAGE plpgsql')
+        statements.append(f'CREATE TRIGGER {table}_show_stats_{operation} AFTER {operation.upper()} ON shows '
+                          f'REFERENCING {transitions[operation]} FOR EACH STATEMENT '
+                          f'EXECUTE PROCEDURE {table}_show_stats_{operation}()')
+    return statements
+
+
+for model, key in owners:
+    for statement in postgres_ddl(model.__tablename__, key.name):
+        event.listen(Show.__table__, 'after_create',
+                     DDL(statement).execute_if(dialect='postgresql'))
+
+
+def maintained_by_triggers(session=None):
+    return (session or db.session).get_bind(Show.__mapper__).dialect.name == 'postgresql'
+
+
+# correlated subqueries of the statistics of a venue or artist, split at the given time
+def stats_values(model, key, now):
+    owned = key == model.id
+    return {
+        model.upcoming_shows_count: select([func.count(Show.id)]).where(
+            and_(owned, Show.start_time > now)).as_scalar(),
+        model.past_shows_count: select([func.count(Show.id)]).where(
+            and_(owned, Show.start_time <= now)).as_scalar(),
+        model.next_show_time: select([func.min(Show.start_time)]).where(
+            and_(owned, Show.start_time > now)).as_scalar(),
+        model.last_show_time: select([func.max(Show.start_time)]).where(
+            and_(owned, Show.start_time <= now)).as_scalar()
+    }
+
+
+def refresh(model, criterion, now=None, session=None):
+    """
+    Recomputes the statistics of the venues or artists matching the criterion, returns their number.
+    """
+    key = dict(owners)[model]
+    session = session or db.session
+    values = stats_values(model, key, now or datetime.today())
+    # the areas of venues sum their upcoming shows
+    places = areas.places_of(criterion, session) if model is Venue and not maintained_by_triggers(session) else None
+    count = session.query(model).filter(criterion).update(values, synchronize_session=False)
+    if places:
+        areas.refresh(places, session)
+    return count
+
+
+def shows_changed(venue_ids, artist_ids):
+    # statistics of the venues and artists of shows written without the ORM, where there are no triggers
+    if maintained_by_triggers():
+        return
+    for model, ids in ((Venue, venue_ids), (Artist, artist_ids)):
+        ids = set(ids)
+        if ids:
+            refresh(model, model.id.in_(ids))
+
+
+def roll(now=None):
+    """
+    Moves the shows that started since the last roll from upcoming to past, in the statistics of their
+    venues and artists. Returns the number of (venues, artists) that changed.
+    """
+    now = now or datetime.today()
+    return tuple(refresh(model, model.next_show_time <= now, now) for model, key in owners)
+
+
+def drift(model, now=None):
+    """
+    Recomputes the statistics of every venue or artist with one grouped aggregate of the shows, and returns
+    the (id, stored, actual) rows of the ones whose stored statistics differ.
+    """
+    key = dict(owners)[model]
+    now = now or datetime.today()
+    actual = db.session.query(
+        key.label('id'),
+        func.count(Show.id).filter(Show.start_time > now).label('upcoming_shows_count'),
+        func.count(Show.id).filter(Show.start_time <= now).label('past_shows_count'),
+        func.min(Show.start_time).filter(Show.start_time > now).label('next_show_time'),
+        func.max(Show.start_time).filter(Show.start_time <= now).label('last_show_time')
+    ).group_by(key).subquery()
+    stored = [getattr(model, column) for column in statColumns]
+    computed = [getattr(actual.c, column) for column in statColumns]
+    # rows without shows have no aggregate row, their actual statistics are zero counts and no times
+    expected = [func.coalesce(computed[0], 0), func.coalesce(computed[1], 0), computed[2], computed[3]]
+    differs = [stored_value != expected_value for stored_value, expected_value in zip(stored[:2], expected[:2])]
+    differs += [func.coalesce(stored_value != expected_value, stored_value.isnot(None) | expected_value.isnot(None))
+                for stored_value, expected_value in zip(stored[2:], expected[2:])]
+    rows = db.session.query(model.id, *stored, *expected).outerjoin(actual, actual.c.id == model.id).filter(
+        or_(*differs)).order_by(model.id)
+    return [(row[0], tuple(row[1:5]), tuple(row[5:9])) for row in rows]
+
+
+# statistics of the venues and artists of the shows a flush wrote, on databases without the triggers
+@event.listens_for(Session, 'after_flush')
+def update_show_stats(session, flush_context):
+    shows = [target for target in list(session.new) + list(session.dirty) + list(session.deleted)
+             if isinstance(target, Show)]
+    if not shows or maintained_by_triggers(session):
+        return
+    for model, key in owners:
+        ids = set()
+        for show in shows:
+            history = get_history(show, key.name)
+            ids.update(id for id in history.sum() if id is not None)
+        if ids:
+            refresh(model, model.id.in_(ids), session=session)
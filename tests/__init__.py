@@ -0,0 +1,19 @@
+# Tests of the app, run from the root of the repository:
+#
+#   $ python -m unittest discover tests
+#
+# Apps are made with the settings of the test profile, and the overrides of every test.
+
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault('FYYUR_ENV', 'test')
+
+
+def create_test_app(**settings):
+    # an app with the settings of config.py, and the given ones instead
+    import config
+    from app import create_app
+    values = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    values.update(settings)
+    return create_app(SimpleNamespace(**values))
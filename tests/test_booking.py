@@ -0,0 +1,93 @@
+# Booking checks of proposed shows, at a fixed time: Monday 7 January 2030 at noon.
+# Numbat Trio doesn't play on Sundays and has a show on the Wednesday evening,
+# Echidna Band plays any day and has a show at midnight starting the Thursday.
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from tests import create_test_app
+from models import db, Venue, Artist, Show, allWeek
+from booking import Slot, check_slots, windowsPerQuery
+
+now = datetime(2030, 1, 7, 12)
+
+
+class CheckSlotsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_test_app(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory, 'fyyur.sqlite'))
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        venue = Venue(name='Quokka Hall', city='Perth', state='WA', address='1 Primary Street')
+        trio = Artist(name='Numbat Trio', city='Perth', state='WA', availability_mask=allWeek & ~(1 << 6))
+        band = Artist(name='Echidna Band', city='Perth', state='WA', availability_mask=allWeek)
+        db.session.add_all([venue, trio, band])
+        db.session.flush()
+        db.session.add_all([Show(artist_id=trio.id, venue_id=venue.id, start_time=datetime(2030, 1, 9, 20)),
+                            Show(artist_id=band.id, venue_id=venue.id, start_time=datetime(2030, 1, 10))])
+        db.session.commit()
+        self.venue_id, self.trio_id, self.band_id = venue.id, trio.id, band.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.context.pop()
+        shutil.rmtree(self.directory)
+
+    def flags(self, verdict):
+        return [name for name in ('past', 'booked', 'unavailable', 'unknown_artist', 'unknown_venue')
+                if getattr(verdict, name)]
+
+    def test_batch_verdicts(self):
+        trio, venue = self.trio_id, self.venue_id
+        verdicts = check_slots([
+            (trio, venue, now),
+            (trio, venue, datetime(2030, 1, 8, 20)),
+            (trio, venue, datetime(2030, 1, 8, 22)),
+            (trio, venue, datetime(2030, 1, 9, 10)),
+            (trio, venue, datetime(2030, 1, 13, 20)),
+            (999, venue, datetime(2030, 1, 8, 20)),
+            (self.band_id, 999, datetime(2030, 1, 8, 20)),
+        ], now)
+        # a show starting right now is in the past, and the first slot of a day in the batch wins it
+        self.assertEqual([self.flags(verdict) for verdict in verdicts],
+                         [['past'], [], ['booked'], ['booked'], ['unavailable'], ['unknown_artist'], ['unknown_venue']])
+        self.assertEqual(verdicts[1].slot, Slot(trio, venue, datetime(2030, 1, 8, 20)))
+        self.assertTrue(verdicts[1].ok)
+        self.assertEqual(verdicts[3].errors, ['Numbat Trio is already booked on the specified date'])
+        self.assertEqual(verdicts[4].errors, ['Numbat Trio is not available on sundays.'])
+
+    def test_back_to_back_days(self):
+        # the show at midnight is on the Thursday only, the last instant of the Wednesday and the Friday are free
+        band, venue = self.band_id, self.venue_id
+        verdicts = check_slots([
+            (band, venue, datetime(2030, 1, 9, 23, 59, 59)),
+            (band, venue, datetime(2030, 1, 10, 23, 59, 59)),
+            (band, venue, datetime(2030, 1, 11)),
+            (band, venue, datetime(2030, 1, 11, 23, 59, 59)),
+        ], now)
+        self.assertEqual([self.flags(verdict) for verdict in verdicts], [[], ['booked'], [], ['booked']])
+
+    def test_temporary_table(self):
+        # more windows than an OR of predicates holds, the same verdicts as checking them in small batches
+        slots = [Slot(artist_id, self.venue_id, datetime(2030, 1, 8, 20) + timedelta(days=day))
+                 for day in range(40) for artist_id in (self.trio_id, self.band_id)]
+        self.assertGreater(len(slots), windowsPerQuery)
+        verdicts = [self.flags(verdict) for verdict in check_slots(slots, now)]
+        self.assertEqual(verdicts, [self.flags(verdict) for start in range(0, len(slots), 10)
+                                    for verdict in check_slots(slots[start:start + 10], now)])
+        self.assertEqual(verdicts[:6], [[], [], ['booked'], [], [], ['booked']])
+        self.assertEqual(verdicts.count(['unavailable']), 5)
+        # the windows are gone from the table, the next batch doesn't see them
+        self.assertEqual(db.session.execute(text('SELECT count(*) FROM booking_windows')).scalar(), 0)
+        self.assertEqual([self.flags(verdict) for verdict in check_slots(slots, now)], verdicts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# Page cache of the in process backend: generations of the tags bumped by writes, the CSRF token of cached pages,
+# and pages shown with flashed messages. Two venues, an artist playing at the first one, and another not playing
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from tests import create_test_app
+from models import db, Venue, Artist, Show
+from app import page_cache
+from cache import csrfPlaceholder
+
+venueForm = {'name': 'Platypus Club', 'city': 'Perth', 'state': 'WA', 'address': '3 Primary Street',
+             'phone': '415-555-1234', 'genres': ['Jazz'], 'facebook_link': '', 'image_link': '', 'website': '',
+             'seeking_description': ''}
+
+tags = ['venues', 'venue:1', 'venue:2', 'artists', 'artist:1', 'artist:2', 'shows']
+
+
+class PageCacheTest(unittest.TestCase):
+
+    def setUp(self, **settings):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_test_app(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory, 'fyyur.sqlite'),
+            PAGE_CACHE_BACKEND='memory', **settings)
+        with self.app.app_context():
+            db.create_all()
+            venues = [Venue(name=name, city='Perth', state='WA', address='1 Primary Street', genres=['Jazz'])
+                      for name in ('Quokka Hall', 'Wombat Room')]
+            artists = [Artist(name=name, city='Perth', state='WA', genres=['Jazz'])
+                       for name in ('Numbat Trio', 'Echidna Band')]
+            db.session.add_all(venues + artists)
+            db.session.flush()
+            db.session.add(Show(artist_id=artists[0].id, venue_id=venues[0].id,
+                                start_time=datetime.today() + timedelta(days=3)))
+            db.session.commit()
+            db.session.remove()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def bumped(self, write):
+        # the tags whose generation the given write bumps
+        before = page_cache.backend.get_generations(tags)
+        write()
+        after = page_cache.backend.get_generations(tags)
+        return {tag for tag, old, new in zip(tags, before, after) if new != old}
+
+    def cache_status(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, path)
+        return response.headers.get('X-Cache')
+
+    def test_writes_bump_tags(self):
+        self.assertEqual(self.bumped(lambda: self.client.post('/venues/create', data=venueForm)), {'venues'})
+        edit = dict(venueForm, name='Quokka Club')
+        self.assertEqual(self.bumped(lambda: self.client.post('/venues/1/edit', data=edit)),
+                         {'venues', 'venue:1', 'artist:1', 'shows'})
+        self.assertEqual(self.bumped(lambda: self.client.post('/venues/2/edit', data=venueForm)),
+                         {'venues', 'venue:2'})
+        self.assertEqual(self.bumped(lambda: self.client.delete('/venues/1')),
+                         {'venues', 'venue:1', 'artist:1', 'shows'})
+
+    def test_only_affected_pages_miss(self):
+        paths = ['/venues/1', '/venues/2', '/artists/1', '/artists/2', '/venues']
+        self.assertEqual([self.cache_status(path) for path in paths], ['MISS'] * 5)
+        self.assertEqual([self.cache_status(path) for path in paths], ['HIT'] * 5)
+        self.client.post('/venues/1/edit', data=dict(venueForm, name='Quokka Club'), follow_redirects=True)
+        self.assertEqual([self.cache_status(path) for path in paths], ['MISS', 'HIT', 'MISS', 'HIT', 'MISS'])
+
+    def test_flashed_message_skips_cache(self):
+        self.assertEqual(self.cache_status('/venues/1'), 'MISS')
+        with self.client.session_transaction() as session:
+            session['_flashes'] = [('message', 'Venue Quokka Hall was listed successfully!')]
+        response = self.client.get('/venues/1')
+        self.assertNotIn('X-Cache', response.headers)
+        self.assertIn('Venue Quokka Hall was listed successfully!', response.get_data(as_text=True))
+        # neither served nor stored: the next request gets the page stored before, without the message
+        response = self.client.get('/venues/1')
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        self.assertNotIn('listed successfully', response.get_data(as_text=True))
+
+
+class CsrfPlaceholderTest(PageCacheTest):
+
+    def setUp(self):
+        super().setUp(WTF_CSRF_ENABLED=True)
+
+    def token(self, response):
+        return re.search(r'name="csrf_token" value="([^"]+)"', response.get_data(as_text=True)).group(1)
+
+    def test_token_of_serving_session(self):
+        other = self.app.test_client()
+        stored = other.get('/venues/1')
+        self.assertEqual(stored.headers['X-Cache'], 'MISS')
+        served = self.client.get('/venues/1')
+        self.assertEqual(served.headers['X-Cache'], 'HIT')
+        self.assertNotIn(csrfPlaceholder, served.get_data(as_text=True))
+        self.assertNotEqual(self.token(served), self.token(stored))
+        # the stored page holds the placeholder instead of the token it was rendered with
+        pages = [body for expires, body in page_cache.backend.pages.values()]
+        self.assertTrue(all(csrfPlaceholder in body and self.token(stored) not in body for body in pages))
+        # the served token is the one of this session, the stored one isn't
+        response = self.client.post('/venues/create', data=dict(venueForm, csrf_token=self.token(stored)))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/venues/create', data=dict(venueForm, csrf_token=self.token(served)))
+        self.assertEqual(response.status_code, 302)
+
+    # the other tests run once, without CSRF tokens, in PageCacheTest
+    test_writes_bump_tags = test_only_affected_pages_miss = test_flashed_message_skips_cache = None
+
+
+if __name__ == '__main__':
+    unittest.main()
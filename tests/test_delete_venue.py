@@ -0,0 +1,57 @@
+# Deleting a venue, on a SQLite file of the test profile in the temporary directory: its shows and genres go with it
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from tests import create_test_app
+from models import db, Venue, Artist, Show, VenueGenre
+
+
+class DeleteVenueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_test_app(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory, 'fyyur.sqlite'))
+        with self.app.app_context():
+            db.create_all()
+            artist = Artist(name='Numbat Trio', city='Perth', state='WA', genres=['Jazz'])
+            venues = [Venue(name=name, city='Perth', state='WA', address='1 Primary Street', genres=['Jazz'])
+                      for name in ('Quokka Hall', 'Wombat Room')]
+            db.session.add_all([artist] + venues)
+            db.session.flush()
+            db.session.add_all([Show(artist_id=artist.id, venue_id=venue.id,
+                                     start_time=datetime.today() + timedelta(days=days))
+                                for venue in venues for days in (-2, 3)])
+            db.session.commit()
+            self.venue_id, self.artist_id = venues[0].id, artist.id
+            db.session.remove()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def test_delete(self):
+        response = self.client.delete(f'/venues/{self.venue_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'success': True})
+        with self.app.app_context():
+            self.assertIsNone(db.session.query(Venue).get(self.venue_id))
+            self.assertEqual(db.session.query(Show).filter(Show.venue_id == self.venue_id).count(), 0)
+            self.assertEqual(db.session.query(VenueGenre).filter(VenueGenre.venue_id == self.venue_id).count(), 0)
+            artist = db.session.query(Artist).get(self.artist_id)
+            self.assertEqual((artist.upcoming_shows_count, artist.past_shows_count), (1, 1))
+        with self.client.session_transaction() as session:
+            self.assertEqual(session['_flashes'], [('message', 'venue Quokka Hall was deleted successfully.')])
+
+    def test_unknown_venue(self):
+        self.assertEqual(self.client.delete('/venues/999').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
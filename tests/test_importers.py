@@ -0,0 +1,131 @@
+# Imports of venues and shows from CSV and JSON lines streams, into a SQLite file of the test profile.
+# Quokka Hall of Perth exists before every import, with Numbat Trio and no shows.
+
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from tests import create_test_app
+from models import db, Venue, Artist, Show
+from importers import import_records, import_shows
+
+venueColumns = ['name', 'city', 'state', 'address', 'genres']
+
+
+def venues_csv(*rows):
+    # a CSV stream of venues, rows of venueColumns values
+    stream = io.StringIO()
+    writer = csv.writer(stream)
+    writer.writerow(venueColumns)
+    writer.writerows(rows)
+    stream.seek(0)
+    return stream
+
+
+class ImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_test_app(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory, 'fyyur.sqlite'))
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        venue = Venue(name='Quokka Hall', city='Perth', state='WA', address='1 Primary Street', genres=['Jazz'])
+        artist = Artist(name='Numbat Trio', city='Perth', state='WA', genres=['Jazz'])
+        db.session.add_all([venue, artist])
+        db.session.commit()
+        self.venue_id, self.artist_id = venue.id, artist.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.context.pop()
+        shutil.rmtree(self.directory)
+
+    def venues(self):
+        return [(venue.id, venue.name, venue.city, venue.address, sorted(venue.genres))
+                for venue in db.session.query(Venue).order_by(Venue.id)]
+
+    def test_upsert_by_name_city_state(self):
+        report = import_records('venues', venues_csv(
+            ['Quokka Hall', 'Perth', 'WA', '2 Secondary Street', 'Folk,Blues'],
+            ['Quokka Hall', 'Fremantle', 'WA', '3 Tertiary Street', 'Jazz'],
+            ['Wombat Room', 'Perth', 'WA', '4 Quaternary Street', 'Jazz']))
+        self.assertEqual((report.rows, report.inserted, report.updated, report.errors), (3, 2, 1, []))
+        db.session.expire_all()
+        self.assertEqual(self.venues(), [
+            (self.venue_id, 'Quokka Hall', 'Perth', '2 Secondary Street', ['Blues', 'Folk']),
+            (self.venue_id + 1, 'Quokka Hall', 'Fremantle', '3 Tertiary Street', ['Jazz']),
+            (self.venue_id + 2, 'Wombat Room', 'Perth', '4 Quaternary Street', ['Jazz'])])
+
+    def test_duplicate_rows_of_batch(self):
+        # a new venue twice and an existing one: the later row wins, and the new venue isn't an update
+        report = import_records('venues', venues_csv(
+            ['Wombat Room', 'Perth', 'WA', '4 Quaternary Street', 'Jazz'],
+            ['Wombat Room', 'Perth', 'WA', '5 Quinary Street', 'Jazz'],
+            ['Quokka Hall', 'Perth', 'WA', '2 Secondary Street', 'Jazz']))
+        self.assertEqual((report.rows, report.inserted, report.updated, report.errors), (3, 1, 1, []))
+        self.assertTrue(report.summary().startswith('3 rows read, 1 inserted, 1 updated, 0 rejected'))
+        db.session.expire_all()
+        self.assertEqual([venue[3] for venue in self.venues()], ['2 Secondary Street', '5 Quinary Street'])
+
+    def test_row_errors(self):
+        # lines of the CSV file count from the header
+        report = import_records('venues', venues_csv(
+            ['Wombat Room', 'Perth', 'WA', '4 Quaternary Street', 'Jazz'],
+            ['', 'Perth', 'WA', '5 Quinary Street', 'Jazz'],
+            ['Platypus Club', 'Perth', 'XX', '6 Senary Street', 'Jazz'],
+            ['Dingo Bar', 'Perth', 'WA', '7 Septenary Street', 'Polka']))
+        self.assertEqual((report.rows, report.inserted, report.updated), (4, 1, 0))
+        self.assertEqual([number for number, messages in report.errors], [3, 4, 5])
+        self.assertTrue(report.errors[0][1][0].startswith('Venue name: Please enter a venue name'))
+        self.assertIn('State:', report.errors[1][1][0])
+        self.assertIn('Genres:', report.errors[2][1][0])
+
+    def test_show_row_errors(self):
+        start = datetime.today() + timedelta(days=3)
+        lines = [{'artist_id': self.artist_id, 'venue_id': self.venue_id, 'start_time': str(start)},
+                 {'artist_id': 'one', 'venue_id': self.venue_id, 'start_time': str(start)},
+                 {'artist_id': self.artist_id, 'venue_id': self.venue_id, 'start_time': 'tomorrow'},
+                 {'artist_id': self.artist_id, 'venue_id': 999, 'start_time': str(start + timedelta(days=1))},
+                 {'artist_id': self.artist_id, 'venue_id': self.venue_id, 'start_time': str(start - timedelta(days=6))},
+                 {'artist_id': self.artist_id, 'venue_id': self.venue_id, 'start_time': str(start)}]
+        stream = io.StringIO('\n'.join(json.dumps(line) for line in lines) + '\n[]\n')
+        report = import_shows(stream, 'jsonl')
+        self.assertEqual((report.rows, report.inserted), (7, 1))
+        self.assertEqual(report.errors, [
+            (2, ['artist_id and venue_id must be integers.']),
+            (3, ['start_time must be a date and time like 2030-05-21 21:30:00.']),
+            (4, ['There is no venue with id 999.']),
+            (5, ['The date you specified is in the past.']),
+            (6, ['Numbat Trio is already booked on the specified date']),
+            (7, ['The line is not a JSON object.'])])
+        self.assertEqual(db.session.query(Show).count(), 1)
+
+    def test_failed_batch(self):
+        # the database rejects one venue, its batch is rolled back and reported, the other batches are saved
+        db.session.execute(text("CREATE TRIGGER reject_venue BEFORE INSERT ON venues WHEN NEW.name = 'Dingo Bar' "
+                                "BEGIN SELECT RAISE(ABORT, 'rejected venue'); END"))
+        db.session.commit()
+        report = import_records('venues', venues_csv(
+            ['Wombat Room', 'Perth', 'WA', '4 Quaternary Street', 'Jazz'],
+            ['Quokka Hall', 'Perth', 'WA', '2 Secondary Street', 'Jazz'],
+            ['Platypus Club', 'Perth', 'WA', '6 Senary Street', 'Jazz'],
+            ['Dingo Bar', 'Perth', 'WA', '7 Septenary Street', 'Jazz'],
+            ['Bilby Lounge', 'Perth', 'WA', '8 Octonary Street', 'Jazz']), batch_size=2)
+        self.assertEqual((report.rows, report.inserted, report.updated), (5, 2, 1))
+        self.assertEqual([number for number, messages in report.errors], [4, 5])
+        self.assertTrue(all(messages[0].startswith('The batch could not be saved:') and 'rejected venue' in messages[0]
+                            for number, messages in report.errors))
+        db.session.expire_all()
+        self.assertEqual([venue[1] for venue in self.venues()], ['Quokka Hall', 'Wombat Room', 'Bilby Lounge'])
+
+
+if __name__ == '__main__':
+    unittest.main()
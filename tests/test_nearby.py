@@ -0,0 +1,57 @@
+# Nearby venues search, on venues located at the centroids of their cities: more venues than geo.cellRows
+# piled up on the point of San Francisco, and fewer on the one of Oakland, about 13 km away
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests import create_test_app
+from models import db, Venue
+import geo
+
+sanFrancisco = (37.77, -122.42)
+
+
+class NearbyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_test_app(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory, 'fyyur.sqlite'))
+        with self.app.app_context():
+            db.create_all()
+            # venues of both cities alternate, so neither one has the lowest ids
+            db.session.add_all([Venue(name=f'{city} Hall {number}', city=city, state='CA',
+                                      address=f'{number} Primary Street')
+                                for number in range(200) for city in ('San Francisco', 'Oakland')
+                                if city == 'San Francisco' or number % 4 == 0])
+            db.session.commit()
+            self.sf_ids = {id for id, in db.session.query(Venue.id).filter(Venue.city == 'San Francisco')}
+            db.session.remove()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def test_pile_is_read_whole(self):
+        self.assertGreater(len(self.sf_ids), geo.cellRows)
+        with self.app.app_context():
+            found = geo.nearest(*sanFrancisco, 100, 50)
+        self.assertEqual(len(found), 100)
+        self.assertTrue({id for kilometers, id in found} <= self.sf_ids)
+
+    def test_every_venue_within_radius(self):
+        with self.app.app_context():
+            found = geo.nearest(*sanFrancisco, 1000, 50)
+        self.assertEqual(len(found), 250)
+        self.assertEqual({id for kilometers, id in found[:200]}, self.sf_ids)
+        self.assertTrue(all(12 < kilometers < 15 for kilometers, id in found[200:]))
+        # and Oakland is out of a smaller circle
+        with self.app.app_context():
+            self.assertEqual(len(geo.nearest(*sanFrancisco, 1000, 10)), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
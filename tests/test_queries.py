@@ -0,0 +1,59 @@
+# Number of queries of the pages, counted by the X-Query-Count header, at two sizes of the synthetic database
+
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import func
+from tests import create_test_app
+from models import db, Show
+from benchmarks.synthetic import seed
+
+
+class QueryCountTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # a page holds the whole table, queries made for every row would add up. rendering it is slow,
+        # and isn't logged
+        self.app = create_test_app(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory, 'fyyur.sqlite'), PAGE_SIZE=10000,
+            SLOW_QUERY_SECONDS=60, SLOW_REQUEST_SECONDS=60)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def seed(self, shows):
+        # seeds the given number of shows, returns the ids of the venue and the artist with the most shows
+        with self.app.app_context():
+            seed(shows)
+            ids = [db.session.query(key).group_by(key).order_by(func.count().desc(), key).limit(1).scalar()
+                   for key in (Show.venue_id, Show.artist_id)]
+            db.session.remove()
+        return ids
+
+    def query_count(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, path)
+        return int(response.headers['X-Query-Count'])
+
+    def test_shows_list(self):
+        self.seed(1000)
+        small = self.query_count('/shows')
+        self.seed(10000)
+        self.assertEqual(self.query_count('/shows'), small)
+
+    def test_detail_pages(self):
+        # the busiest venue and artist have a few dozen shows, then hundreds
+        venue_id, artist_id = self.seed(1000)
+        small = self.query_count(f'/venues/{venue_id}'), self.query_count(f'/artists/{artist_id}')
+        venue_id, artist_id = self.seed(10000)
+        self.assertEqual((self.query_count(f'/venues/{venue_id}'), self.query_count(f'/artists/{artist_id}')), small)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# Routing of reads to a replica, with two SQLite files standing in for the primary and the replica.
+# The replica is a copy of the primary where the venue has another name, so pages show which one they read.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from tests import create_test_app
+from models import db, Venue
+from replicas import primaryCookie
+
+venueForm = {'name': 'Quokka Hall', 'city': 'Perth', 'state': 'WA', 'address': '100 Alpha Street',
+             'phone': '415-555-1234', 'genres': ['Jazz'], 'facebook_link': '', 'image_link': '', 'website': '',
+             'seeking_description': ''}
+
+
+class ReplicaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.primary = os.path.join(self.directory, 'primary.sqlite')
+        self.replica = os.path.join(self.directory, 'replica.sqlite')
+        replica_url = 'sqlite:///' + self.replica
+        self.app = create_test_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + self.primary,
+                                   DATABASE_REPLICA_URLS=[replica_url],
+                                   SQLALCHEMY_BINDS={'replica0': replica_url})
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Venue(name='Primary Hall', city='Perth', state='WA', address='1 Primary Street'))
+            db.session.commit()
+            db.session.remove()
+            db.get_engine(self.app).dispose()
+        shutil.copy(self.primary, self.replica)
+        with sqlite3.connect(self.replica) as connection:
+            connection.execute("UPDATE venues SET name = 'Replica Hall'")
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            for bind in (None, 'replica0'):
+                db.get_engine(self.app, bind=bind).dispose()
+        shutil.rmtree(self.directory)
+
+    def venue_names(self, path):
+        # names of the venues in a database file
+        with sqlite3.connect(path) as connection:
+            return [name for name, in connection.execute('SELECT name FROM venues ORDER BY id')]
+
+    def test_get_reads_replica(self):
+        page = self.client.get('/venues/1').get_data(as_text=True)
+        self.assertIn('Replica Hall', page)
+        self.assertNotIn('Primary Hall', page)
+
+    def test_write_goes_to_primary(self):
+        response = self.client.post('/venues/create', data=venueForm)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.venue_names(self.primary), ['Primary Hall', 'Quokka Hall'])
+        self.assertEqual(self.venue_names(self.replica), ['Replica Hall'])
+        self.assertIn(primaryCookie + '=', response.headers['Set-Cookie'])
+
+    def test_reads_follow_own_writes(self):
+        # the new venue is on the primary only, the redirect to its page reads from there
+        response = self.client.post('/venues/create', data=venueForm, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Quokka Hall', response.get_data(as_text=True))
+        self.assertIn('Primary Hall', self.client.get('/venues/1').get_data(as_text=True))
+        # and the replica again, once the cookie is gone
+        self.client.delete_cookie('localhost', primaryCookie)
+        self.assertIn('Replica Hall', self.client.get('/venues/1').get_data(as_text=True))
+
+    def test_flush_goes_to_primary(self):
+        # a GET request writing something reads from the replica, and flushes to the primary
+        with self.app.test_request_context('/venues/1'):
+            self.app.preprocess_request()
+            self.assertEqual(db.session.query(Venue.name).filter(Venue.id == 1).scalar(), 'Replica Hall')
+            db.session.add(Venue(name='Flushed Hall', city='Perth', state='WA', address='2 Primary Street'))
+            db.session.commit()
+            db.session.remove()
+        self.assertEqual(self.venue_names(self.primary), ['Primary Hall', 'Flushed Hall'])
+        self.assertEqual(self.venue_names(self.replica), ['Replica Hall'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+# This file contains the typeahead of the search boxes: the artists, venues, cities and genres with a word starting
+# with what was typed, served from memory by /api/v1/typeahead.
+# Every kind of suggestion is a PrefixIndex: the normalized labels of the suggestions in one byte string, and the
+# offsets of their word starts in it, sorted by the text from there to the end of the label, searched by bisection.
+# An index is a handful of large objects rather than millions of small ones, so the workers forked from a preloaded
+# app keep sharing its pages, reference counts aren't written to them.
+# Writes go to a small overlay of every index: the create and edit routes put their artist or venue right away,
+# and every process reads the artists and venues written by the others by their updated_at, every
+# TYPEAHEAD_SYNC_SECONDS. Venues deleted by other processes are suggested until the index is built again.
+
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from heapq import merge
+from itertools import accumulate, chain, islice, takewhile
+from operator import itemgetter
+from flask import current_app
+from sqlalchemy import select
+from models import db, Venue, Artist, Area
+from enums import Genre
+
+# kinds of suggestions, in the order of their indexes, and the kind of one suggestion
+kinds = ('artists', 'venues', 'cities', 'genres')
+suggestionKinds = {'artists': 'artist', 'venues': 'venue', 'cities': 'city', 'genres': 'genre'}
+
+# most suggestions returned by one request
+maxResults = 50
+
+# writes are read from this long before the previous read, so the ones of transactions that committed
+# after it started aren't missed
+syncOverlap = timedelta(minutes=1)
+
+# rows of the projections read at once by a build
+buildChunk = 10000
+
+wordPattern = re.compile(r'\w+')
+
+
+def normalize(text):
+    # lowercase words of a text, without accents, one space apart
+    if not text.isascii():
+        text = ''.join(character for character in unicodedata.normalize('NFKD', text)
+                       if not unicodedata.combining(character)).casefold()
+    return ' '.join(wordPattern.findall(text.lower()))
+
+
+def word_starts(text):
+    # offsets of the words of a normalized text, as bytes
+    starts, position = [0] if text else [], text.find(b' ')
+    while position >= 0:
+        starts.append(position + 1)
+        position = text.find(b' ', position + 1)
+    return starts
+
+
+def fetched(statement):
+    # rows of a statement, fetched buildChunk rows at a time
+    result = db.session.execute(statement)
+    while True:
+        rows = result.fetchmany(buildChunk)
+        if not rows:
+            return
+        yield from rows
+
+
+def city_label(city, state):
+    return f'{city}, {state}'
+
+
+class PrefixIndex(object):
+    """
+    Suggestions of one kind, (id, label) pairs, found by the prefixes of the words of their labels.
+    Rows are kept in arrays and byte strings, row i has ids[i] and the labels between label_starts[i] and
+    label_starts[i + 1]. Keys are the word starts of the normalized labels, in key order, and their rows.
+
+    Suggestions written later are kept apart, in a sorted list of their keys, and the rows they replace are skipped.
+
+    :param rows:
+        (id, label) pairs, in id order.
+    """
+
+    def __init__(self, rows):
+        ids, labels, texts = array('q'), [], []
+        for id, label in rows:
+            ids.append(id)
+            labels.append(label.encode())
+            texts.append(normalize(label).encode())
+        self.ids = ids
+        self.labels = b''.join(labels)
+        self.label_starts = array('I', chain([0], accumulate(map(len, labels))))
+        self.text = b''.join(texts)
+        self.text_starts = array('I', chain([0], accumulate(map(len, texts))))
+        starts, rows = array('I'), array('I')
+        for row, (text, start) in enumerate(zip(texts, self.text_starts)):
+            offsets = word_starts(text)
+            starts.extend([start + offset for offset in offsets])
+            rows.extend([row] * len(offsets))
+        del labels, texts
+        order = sorted(range(len(starts)), key=lambda key: self.text[starts[key]:self.text_starts[rows[key] + 1]])
+        self.key_starts = array('I', (starts[key] for key in order))
+        self.key_rows = array('I', (rows[key] for key in order))
+        # {id: label} and sorted (key, id) of the suggestions written since, and the ids of the rows they replace
+        self.added = {}
+        self.added_keys = []
+        self.removed = set()
+
+    def key(self, position):
+        return self.text[self.key_starts[position]:self.text_starts[self.key_rows[position] + 1]]
+
+    def label_of_row(self, row):
+        return self.labels[self.label_starts[row]:self.label_starts[row + 1]].decode()
+
+    def row(self, id):
+        row = bisect_left(self.ids, id)
+        return row if row < len(self.ids) and self.ids[row] == id else None
+
+    def label(self, id):
+        if id in self.added:
+            return self.added[id]
+        row = self.row(id) if id not in self.removed else None
+        return self.label_of_row(row) if row is not None else None
+
+    def first(self, prefix):
+        # position of the first key not below the prefix
+        low, high = 0, len(self.key_starts)
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def rows_matching(self, prefix):
+        position = self.first(prefix)
+        while position < len(self.key_starts):
+            key = self.key(position)
+            if not key.startswith(prefix):
+                return
+            row = self.key_rows[position]
+            id = self.ids[row]
+            if id not in self.removed:
+                yield key, id, self.label_of_row(row)
+            position += 1
+
+    def matches(self, prefix):
+        """
+        Returns an iterator of the (key, id, label) of the suggestions with a word starting with the prefix,
+        a normalized text as bytes, in key order. A suggestion is found once per matching word.
+        """
+        added = takewhile(lambda item: item[0].startswith(prefix),
+                          islice(self.added_keys, bisect_left(self.added_keys, (prefix,)), None))
+        return merge(self.rows_matching(prefix), ((key, id, self.added[id]) for key, id in added), key=itemgetter(0))
+
+    def put(self, id, label):
+        # adds a suggestion, or replaces its label
+        if self.label(id) == label:
+            return
+        self.remove(id)
+        self.added[id] = label
+        text = normalize(label).encode()
+        for offset in word_starts(text):
+            insort(self.added_keys, (text[offset:], id))
+
+    def remove(self, id):
+        label = self.added.pop(id, None)
+        if label is not None:
+            text = normalize(label).encode()
+            for offset in word_starts(text):
+                del self.added_keys[bisect_left(self.added_keys, (text[offset:], id))]
+        if self.row(id) is not None:
+            self.removed.add(id)
+
+
+class Typeahead(object):
+    """
+    The prefix indexes of every kind of suggestion of an app, built from the database on first use,
+    and the time from which the writes of other processes are read.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = None
+        self.cities = None
+        self.synced_at = None
+        self.next_sync = 0
+
+    def build(self):
+        # projections of the names of every artist and venue, and of the areas of the venues
+        started = datetime.utcnow()
+        artists = PrefixIndex(fetched(select([Artist.id, Artist.name]).order_by(Artist.id)))
+        venues = PrefixIndex(fetched(select([Venue.id, Venue.name]).order_by(Venue.id)))
+        cities = [city_label(row.city, row.state) for row in db.session.execute(
+            select([Area.city, Area.state]).order_by(Area.state, Area.city))]
+        self.cities = set(cities)
+        self.indexes = {
+            'artists': artists,
+            'venues': venues,
+            'cities': PrefixIndex(enumerate(cities)),
+            'genres': PrefixIndex(enumerate(genre.value for genre in Genre))
+        }
+        self.synced_at = started
+        self.next_sync = time.monotonic() + current_app.config['TYPEAHEAD_SYNC_SECONDS']
+
+    def put_city(self, city, state):
+        label = city_label(city, state)
+        if label not in self.cities:
+            self.cities.add(label)
+            self.indexes['cities'].put(len(self.cities) - 1, label)
+
+    def put(self, kind, id, name, city, state):
+        # cities are the areas of venues, like the ones of the venues page
+        self.indexes[kind].put(id, name)
+        if kind == 'venues':
+            self.put_city(city, state)
+
+    def sync(self):
+        # artists and venues written by any process since the previous read
+        started = datetime.utcnow()
+        for kind, model in (('artists', Artist), ('venues', Venue)):
+            for row in db.session.execute(select([model.id, model.name, model.city, model.state]).where(
+                    model.updated_at > self.synced_at - syncOverlap)).fetchall():
+                self.put(kind, row.id, row.name, row.city, row.state)
+        self.synced_at = started
+        self.next_sync = time.monotonic() + current_app.config['TYPEAHEAD_SYNC_SECONDS']
+
+    def ready(self):
+        # built, and synced when it's time, under the lock
+        if self.indexes is None:
+            self.build()
+        elif time.monotonic() >= self.next_sync:
+            self.sync()
+
+
+def init_app(app, preload=False):
+    """
+    Adds the typeahead of an app, built right away with preload, like before the workers of a server fork.
+    """
+    app.extensions['typeahead'] = Typeahead()
+    if preload:
+        with app.app_context():
+            app.extensions['typeahead'].build()
+            db.session.remove()
+
+
+def typeahead():
+    return current_app.extensions['typeahead']
+
+
+def kind_matches(index, kind, prefix):
+    for key, id, label in index.matches(prefix):
+        yield key, kind, id, label
+
+
+def suggest(term, kinds=kinds, limit=None):
+    """
+    Returns the suggestions of the given kinds with a word starting with the words of the term, in the order
+    of their matching words, as dictionaries of their kind, label, and id, or city and state.
+    """
+    limit = min(limit or current_app.config['TYPEAHEAD_RESULTS'], maxResults)
+    prefix = normalize(term).encode()
+    if not prefix:
+        return []
+    index = typeahead()
+    with index.lock:
+        index.ready()
+        matches = merge(*[kind_matches(index.indexes[kind], kind, prefix) for kind in kinds], key=itemgetter(0))
+        found, seen = [], set()
+        for key, kind, id, label in matches:
+            if (kind, id) not in seen:
+                seen.add((kind, id))
+                found.append((kind, id, label))
+                if len(found) == limit:
+                    break
+    suggestions = []
+    for kind, id, label in found:
+        suggestion = {'kind': suggestionKinds[kind], 'label': label}
+        if kind in ('artists', 'venues'):
+            suggestion['id'] = id
+        elif kind == 'cities':
+            suggestion['city'], suggestion['state'] = label.rsplit(', ', 1)
+        suggestions.append(suggestion)
+    return suggestions
+
+
+def written(kind, id, name, city, state):
+    # an artist or venue created or edited by this process, suggested right away
+    index = typeahead()
+    with index.lock:
+        if index.indexes is not None:
+            index.put(kind, id, name, city, state)
+
+
+def deleted(kind, id):
+    index = typeahead()
+    with index.lock:
+        if index.indexes is not None:
+            index.indexes[kind].remove(id)